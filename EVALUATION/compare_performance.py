@@ -17,6 +17,7 @@ Usage:
         -s list of <str> Can be either:
             - a directory path where tested PPI prediction k-fold subset files exist (file names must contain the word 'prediction' and a number)
             - a file path for the tested PPI predictions
+            - a score matrix (.npy) of all-to-all PPI predictions (see MODELS/score_matrix.py), labelled PPIs are looked up
         -l list of <str> is the file path to the labelled PPIs
             - order of provided list corresponds to order of provided scores list
             - e.g. SCORES_1 predictions will be evaluated against labels_1.tsv, then SCORES_2 with labels_2.tsv
@@ -29,13 +30,15 @@ Usage:
         -n <str> name for saving files, default is result directory name
         -m <str> metric used in significance tests to compare performance, default is area under precision-recall curve
         -t <str> type of two-tailed t-test performed (paired or independent), default is independent
+        -j <int> number of predictions files evaluated in parallel processes, default is 1
+        -b <int> number of bootstrap resamples of all predictions of each scores for 95% confidence intervals of overall AUCs, default is 0 (none)
+        -c <str> directory path for caching performance of each scores, reused while predictions, labels and delta are unchanged,
+            default is results directory + 'cache/'
 
 @author: Eric Arezza
 """
 
-__all__ = ['recalculate_precision',
-           'recalculate_metrics_to_imbalance',
-           'get_matching_pairs',
+__all__ = ['get_matching_pairs',
            'get_metrics',
            'test_anova',
            'test_t',
@@ -48,13 +51,21 @@ import os, sys
 import argparse
 import pandas as pd
 import numpy as np
-from sklearn import metrics
 import matplotlib.pyplot as plt
 from scipy.stats import f_oneway, ttest_ind, ttest_rel
 import statsmodels.api as sm
 from statsmodels.formula.api import ols
 from itertools import combinations
 import time
+import hashlib
+import joblib
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'MODELS'))
+from score_matrix import is_score_matrix, get_sidecar
+import ppi_metrics, ppi_pairs, ppi_evaluation, ppi_bootstrap
+from ppi_metrics import Curves, get_imbalanced_metrics
+from ppi_pairs import get_matching_pairs
+from ppi_evaluation import get_fold_files, evaluate_folds
+from ppi_bootstrap import Bootstrap, get_confidence_interval
 
 describe_help = 'python compare_performance.py -s SCORES_1/ SCORES_2 -l labels.tsv -d 0.5 -r RESULTS/ -n scores1_vs_scores2'
 parser = argparse.ArgumentParser(description=describe_help)
@@ -72,6 +83,12 @@ parser.add_argument('-m', '--metric', help='Metric used to compare performance',
                     type=str, default='auc_pr', choices=['auc_pr', 'auc_roc', 'precision', 'recall', 'accuracy', 'specificity', 'f1', 'mcc'])
 parser.add_argument('-t', '--ttest_type', help='Paired if same samples tested under variable, independent if different samples tested under variable', 
                     type=str, default='ind', choices=['ind', 'paired'])
+parser.add_argument('-j', '--jobs', help='Number of predictions files evaluated in parallel processes (default 1)', 
+                    type=int, default=1)
+parser.add_argument('-b', '--bootstrap', help='Number of bootstrap resamples of all predictions of each scores for 95%% confidence intervals of overall AUC_ROC and AUC_PR (default 0 for none)', 
+                    type=int, default=0)
+parser.add_argument('-c', '--cache', help='Path to directory for saving performance of each scores, reused while scores, labels and delta are unchanged (default is cache/ in results directory)', 
+                    type=str, default=None)
 args = parser.parse_args()
 
 RESULTS_DIR = args.results
@@ -81,78 +98,38 @@ if args.name == '' and len(args.labels) == 1:
     args.name = RESULTS_DIR.split('/')[-2].lower().capitalize() + '_' + args.labels[0].split('/')[-1].split('.')[0]
 elif args.name == '' and len(args.labels) > 1:
     args.name = RESULTS_DIR.split('/')[-2].lower().capitalize()
+CACHE_DIR = args.cache if args.cache else RESULTS_DIR + 'cache/'
+if not CACHE_DIR.endswith('/'):
+    CACHE_DIR += '/'
 
-# Calculate estimate for prevalence-corrected precision on imbalanced data
-def recalculate_precision(df, precision, thresholds, d):
-    delta = 2*d - 1
-    new_precision = precision.copy()
-    for t in range(0, len(thresholds)):
-        tn, fp, fn, tp = metrics.confusion_matrix(df[1], (df[0] >= thresholds[t]).astype(int)).ravel()
-        lpp = tp/(tp+fn)
-        lnn = tn/(tn+fp)
-        if d != 0.5:
-            new_precision[t] = (lpp*(1 + delta)) / ( (lpp*(1 + delta)) + ((1 - lnn)*(1 - delta)) )
-        else:
-            new_precision[t] = (lpp)/(lpp + (1-lnn))
-    return new_precision
+# Filename of cached performance of scores, keyed by hash of contents of predictions files and labels, delta and evaluation code
+def get_metrics_filename(scores, labels, delta, path, bootstrap=0):
+    h = hashlib.sha256()
+    files = get_fold_files(scores)
+    files += [get_sidecar(f) for f in files if is_score_matrix(f)]
+    # Performance is recalculated if evaluation code changed
+    for filename in files + [labels, __file__, ppi_metrics.__file__, ppi_pairs.__file__, ppi_evaluation.__file__, ppi_bootstrap.__file__]:
+        with open(filename, 'rb') as f:
+            for block in iter(lambda: f.read(2**20), b''):
+                h.update(block)
+    h.update(repr((float(delta), bootstrap)).encode())
+    return path + 'metrics_' + scores.rstrip('/').split('/')[-1].split('.')[0] + '_' + h.hexdigest()[:16] + '.joblib'
 
-# Recalculate metrics for imbalanced classification where d is num_positives/(num_positives + num_negatives)
-def recalculate_metrics_to_imbalance(tp, tn, fp, fn, d):
-    delta = 2*d - 1
-    # recall and specificity are unchanged
-    lpp = tp/(tp+fn)
-    lnn = tn/(tn+fp)
-    if d != 0.5:
-        accuracy = lpp*((1 + delta)/2) + lnn*((1 - delta)/2)
-        precision = (lpp*(1 + delta)) / ( (lpp*(1 + delta)) + ((1 - lnn)*(1 - delta)) )
-        f1 = (2*lpp*(1 + delta)) / ( ((1+lpp)*(1+delta)) + ((1-lnn)*(1-delta)) )
-        mcc = (lpp+lnn-1) / np.sqrt((lpp + (1-lnn)*( (1-delta)/(1+delta) ) )*( lnn + (1-lpp)*( (1+delta)/(1-delta) ) ))
-    else:
-        accuracy = (lpp + lnn)/2
-        precision = (lpp)/(lpp + (1-lnn))
-        f1 = (2*lpp)/(2 + lpp - lnn)
-        mcc = (lpp + lnn - 1) / np.sqrt( (lpp + (1-lnn))*(lnn + (1-lpp)) )
-        
-    return round(accuracy, 5), round(precision, 5), round(lpp, 5), round(lnn, 5), round(f1, 5), round(mcc, 5)
-
-# Get labels for PPIs
-def get_matching_pairs(df_1, df_2):
-    # Get matches using PPI ordering of smaller df
-    if df_1.shape > df_2.shape:
-        df_test = df_1.copy()
-        df_train = df_2.copy()
-    else:
-        df_test = df_2.copy()
-        df_train = df_1.copy()
-    
-    # Include all PPIs where A-B is B-A
-    df_test_rev = df_test.copy()
-    df_test_rev[[df_test_rev.columns[0], df_test_rev.columns[1]]] = df_test_rev[[df_test_rev.columns[1], df_test_rev.columns[0]]]
-    df = df_test.append(df_test_rev)
-    df = df.drop_duplicates(subset=[df.columns[0], df.columns[1]])
-    df.reset_index(drop=True, inplace=True)
-    
-    # Merge to match all PPIs found between df
-    matches = df_train.merge(df, on=[df.columns[0], df.columns[1]])
-    matches = matches.drop_duplicates(subset=[df.columns[0], df.columns[1]])
-    matches.reset_index(drop=True, inplace=True)
-    # Returns as <ProteinA> <ProteinB> <label> <score>
-    return matches
-
-def get_metrics(scores, labels, delta):
+# Performance of predictions (directory of cross-validation files or single file) scores against labels, adjusted for imbalance delta
+# results are evaluate_folds results of files of scores in order if already evaluated (e.g. with files of other scores by a pool of processes)
+# cache is filename of cached performance (see get_metrics_filename), loaded if exists else saved
+# bootstrap is number of resamples of all predictions for confidence intervals of overall AUCs, computed by jobs processes
+def get_metrics(scores, labels, delta, results=None, cache=None, bootstrap=0, jobs=1):
     print('Calculating performance for predictions:\n\t%s\nUsing labels:\n\t%s\nDelta:\t%s'%(scores, labels, delta))
-    # Get PPI scores
-    if os.path.isdir(scores):
-        # For cross-validation tested PPI subsets
-        files = os.listdir(path=scores)
-        files = [ x for x in files if 'prediction' in x and '.pos' not in x and '.neg' not in x ]
-        files.sort()
-    else:
-        # For single file tested PPIs
-        files = [ scores.split('/')[-1] ]
-        
-    # Get PPI labels for entire dataset
-    df_labels = pd.read_csv(labels, delim_whitespace=True, header=None)
+    if cache and os.path.exists(cache):
+        print('Loading performance from %s...'%cache.split('/')[-1])
+        cached = joblib.load(cache)
+        print('\n===== EVALUATION =====')
+        print(cached['evaluation'])
+        return cached['metrics']
+    # Get PPI scores, for cross-validation tested PPI subsets or single file tested PPIs
+    if results is None:
+        results = evaluate_folds([(filename, labels) for filename in get_fold_files(scores)], delta)
     
     # Metrics for evaluation
     # For ROC curve
@@ -172,42 +149,26 @@ def get_metrics(scores, labels, delta):
     fold_f1 = []
     fold_mcc = []
 
-    df_pred_total = pd.DataFrame()
+    # Scores and labels of all folds
+    total_scores, total_labels = [], []
     fold = 0
-    for k in files:
+    for result in results:
         
         # Isolate k-fold subset
         print('\n===== Fold - %s ====='%fold)
         
-        # Read predictions for k-fold set or single test set
-        if os.path.isdir(scores):
-            df_pred = pd.read_csv(scores + k, delim_whitespace=True, header=None)
-        else:
-            df_pred = pd.read_csv(scores, delim_whitespace=True, header=None)
-        
-        # Remove any extra columns if exists to prevent subsequent problems in functions
-        # predictions files should be ProteinA ProteinB Score
-        if df_pred.shape[1] > 3:
-            df_pred.drop(columns=df_pred.columns[3:].tolist(), inplace=True)
-        
-        # Get matching PPI labels for predictions
-        #if '_SPRINT_' not in k and ('SPRINT' not in args.scores and 'CME' not in args.scores):
-        df_pred = get_matching_pairs(df_pred, df_labels)
-        df_pred.drop(columns=[0, 1], inplace=True)
-        df_pred.rename(columns={'2_x': 0, '2_y': 1}, inplace=True)
-        #df_pred[[0, 1]] = df_pred[[1, 0]]
-        
-        df_pred_total = df_pred_total.append(df_pred)
+        total_scores.append(result['scores'])
+        total_labels.append(result['labels'])
         
         # Get other metrics at 0.5 threshold if predictions are probabilities (0 to 1) i.e. not SPRINT predictions
-        if df_pred[0].min() >= 0 and df_pred[0].max() <= 1:# and 'SPRINT' not in scores:
+        if result['confusion'] is not None:# and 'SPRINT' not in scores:
             
-            tn, fp, fn, tp = metrics.confusion_matrix(df_pred[1], (df_pred[0] + 1e-12).round()).ravel()
+            tn, fp, fn, tp = result['confusion']
             print('TP = %0.0f \nFP = %0.0f \nTN = %0.0f \nFN = %0.0f'%(tp, fp, tn, fn))
             print('Total_samples = %s'%(tn+fp+fn+tp))
             # For imbalanced classification metrics
             if delta != 0.5:
-                accuracy, precision, recall, specificity, f1, mcc = recalculate_metrics_to_imbalance(tp, tn, fp, fn, delta)
+                accuracy, precision, recall, specificity, f1, mcc = [round(m[0], 5) for m in get_imbalanced_metrics(tn, fp, fn, tp, [delta])]
                 if np.isnan(accuracy) == False:
                     fold_accuracy.append(accuracy)
                 if np.isnan(precision) == False:
@@ -255,15 +216,9 @@ def get_metrics(scores, labels, delta):
             print('Accuracy =', accuracy, '\nPrecision =', precision, '\nRecall =', recall, '\nSpecificity =', specificity, '\nF1 =', f1, '\nMCC =', mcc)
         np.seterr(invalid='ignore')
         # Evaluate k-fold performance and adjust for hypothetical imbalance
-        precision, recall, thresholds = metrics.precision_recall_curve(df_pred[1], df_pred[0])
-        if delta != 0.5:
-            precision = recalculate_precision(df_pred, precision, thresholds, delta)
-        fpr, tpr, __ = metrics.roc_curve(df_pred[1], df_pred[0])
-        if delta == 0.5:
-            pr_auc = metrics.average_precision_score(df_pred[1], df_pred[0])
-        else:
-            pr_auc = metrics.auc(recall, precision)
-        roc_auc = metrics.roc_auc_score(df_pred[1], df_pred[0])
+        precision, recall = result['precision'], result['recall']
+        fpr, tpr = result['fpr'], result['tpr']
+        pr_auc, roc_auc = result['pr_auc'], result['roc_auc']
         
         print('AUC_ROC = %0.5f'%roc_auc, '\nAUC_PR = %0.5f'%pr_auc)
         
@@ -278,17 +233,14 @@ def get_metrics(scores, labels, delta):
         fold += 1
     
     # Get total performance from all PPI predictions (concatenated k-fold tested subsets)
-    precision, recall, thresholds = metrics.precision_recall_curve(df_pred_total[1], df_pred_total[0])
-    if delta != 0.5:
-        precision = recalculate_precision(df_pred_total, precision, thresholds, delta)
-    fpr, tpr, __ = metrics.roc_curve(df_pred_total[1], df_pred_total[0])
-    if delta == 0.5:
-        pr_auc = metrics.average_precision_score(df_pred_total[1], df_pred_total[0])
-    else:
-        pr_auc = metrics.auc(recall, precision)
-    roc_auc = metrics.roc_auc_score(df_pred_total[1], df_pred_total[0])
+    total_scores, total_labels = np.concatenate(total_scores), np.concatenate(total_labels)
+    curves = Curves(total_labels, total_scores)
+    precision, recall, thresholds = curves.pr(delta)
+    fpr, tpr, __ = curves.roc()
+    pr_auc = curves.pr_auc(delta)
+    roc_auc = curves.roc_auc()
     
-    if df_pred_total[0].min() >= 0 and df_pred_total[0].max() <= 1:# and 'SPRINT' not in scores:
+    if total_scores.min() >= 0 and total_scores.max() <= 1:# and 'SPRINT' not in scores:
         evaluation = ('accuracy = %.5f (+/- %.5f)'%(np.mean(fold_accuracy), np.std(fold_accuracy))
                       + '\nprecision = %.5f (+/- %.5f)'%(np.mean(fold_precision), np.std(fold_precision)) 
                       + '\nrecall = %.5f (+/- %.5f)'%(np.mean(fold_recall), np.std(fold_recall)) 
@@ -306,6 +258,12 @@ def get_metrics(scores, labels, delta):
                       + '\nroc_auc_overall = %.5f' % (roc_auc)
                       + '\npr_auc_overall = %.5f' % (pr_auc)
                       + '\n')  
+    if bootstrap > 0:
+        # Resamples of all predictions sorted once, chunks of resamples computed by processes
+        boot_roc_aucs, boot_pr_aucs = Bootstrap(total_labels, total_scores).get_aucs(bootstrap, delta=delta, jobs=jobs)
+        evaluation += ('roc_auc_overall_95ci = [%.5f, %.5f]' % get_confidence_interval(boot_roc_aucs)
+                       + '\npr_auc_overall_95ci = [%.5f, %.5f]' % get_confidence_interval(boot_pr_aucs)
+                       + '\n')
     print('\n===== EVALUATION =====')
     print(evaluation)
     performance = pd.DataFrame(data={'precision': pd.Series(fold_precision, dtype=float), 'recall': pd.Series(fold_recall, dtype=float), 'specificity': pd.Series(fold_specificity, dtype=float), 'f1': pd.Series(fold_f1, dtype=float), 'mcc': pd.Series(fold_mcc, dtype=float), 'auc_pr': pd.Series(np.fromiter(pr_aucs.values(), dtype=float), dtype=float), 'auc_roc': pd.Series(np.fromiter(roc_aucs.values(), dtype=float), dtype=float)}, dtype=float)
@@ -333,6 +291,13 @@ def get_metrics(scores, labels, delta):
     df_interp_tprs.insert(df_interp_tprs.shape[1], 'mean', df_interp_tprs.mean(axis=1))
     df_interp_tprs.insert(df_interp_tprs.shape[1], 'std', df_interp_tprs.std(axis=1))
     
+    if cache:
+        # Write to temporary file first so concurrent runs never load a partially written file
+        if not os.path.exists(os.path.dirname(cache)):
+            os.makedirs(os.path.dirname(cache))
+        joblib.dump({'metrics': (performance, overall_curves, df_interp_precisions, df_interp_tprs, pr_auc, roc_auc), 'evaluation': evaluation}, cache + '.%s.tmp'%os.getpid(), compress=3)
+        os.replace(cache + '.%s.tmp'%os.getpid(), cache)
+    
     return performance, overall_curves, df_interp_precisions, df_interp_tprs, pr_auc, roc_auc
 
 def test_anova(to_test):
@@ -416,8 +381,13 @@ if __name__ == '__main__':
     pr_aucs = {}
     roc_aucs = {}
     names = []
+    # Performance of scores unchanged since a previous comparison is loaded from cache
+    caches = {s: get_metrics_filename(s, l, args.delta, CACHE_DIR, bootstrap=args.bootstrap) for s, l in scores_labels_mapping.items()}
+    # Files of all other scores evaluated together by a pool of processes, results merged in order of scores and files
+    files = {s: get_fold_files(s) if not os.path.exists(caches[s]) else [] for s in scores_labels_mapping.keys()}
+    results = evaluate_folds([(f, l) for s, l in scores_labels_mapping.items() for f in files[s]], args.delta, jobs=args.jobs)
     for s, l in scores_labels_mapping.items():
-        performance, overall_curve, interp_precision, interp_tpr, pr_auc, roc_auc = get_metrics(s, l, args.delta)
+        performance, overall_curve, interp_precision, interp_tpr, pr_auc, roc_auc = get_metrics(s, l, args.delta, results=[next(results) for f in files[s]] if files[s] else None, cache=caches[s], bootstrap=args.bootstrap, jobs=args.jobs)
         #name = ''.join([ i.replace('/', '') for i in s.split('RESULTS')[1:] ])
         if os.path.isdir(s):
             if s[-1] != '/':
@@ -15,6 +15,7 @@ Usage:
         -s <str> Can be either:
             - a directory path where tested PPI prediction k-fold subset files exist (file names must contain the word 'prediction' and a number)
             - a file path for the tested PPI predictions
+            - a score matrix (.npy) of all-to-all PPI predictions (see MODELS/score_matrix.py), labelled PPIs are looked up
         -l <str> is the file path to the labelled PPIs
         -d <float> is the hypothetical imbalance ratio of positives/all PPIs, default is 0.5
             e.g.
@@ -22,13 +23,17 @@ Usage:
             - imbalanced data where 1 positive for every 100 negatives would be 1/101, so 0.0099
         -r <str> is a directory path for saving the results, default is current directory
         -n <str> name for plot titles and files, default is result directory name
+        --stream read predictions files in chunks keeping only labelled PPIs, for very large (e.g. all-to-all) predictions files
+        -cs <int> number of PPIs read per chunk when streaming, default is 1048576
+        -j <int> number of predictions files evaluated in parallel processes, default is 1
+        -b <int> number of bootstrap resamples of all predictions for 95% confidence intervals of overall AUCs, default is 0 (none)
+        -sw <float> ... imbalance ratios (e.g. 0.5 0.0909 0.0099 0.000999) evaluated in the same pass as -d,
+            metrics and AUC_PR of each written to sweep_<name>.tsv and PR curves plotted together in <name>_PR_sweep.png
 
 @author: Eric Arezza
 """
 
-__all__ = ['recalculate_precision',
-           'recalculate_metrics_to_imbalance',
-           'get_matching_pairs',
+__all__ = ['get_matching_pairs',
            ]
 
 __version__ = '1.0'
@@ -38,8 +43,13 @@ import os
 import argparse
 import pandas as pd
 import numpy as np
-from sklearn import metrics
 import matplotlib.pyplot as plt
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'MODELS'))
+from ppi_metrics import Curves, get_imbalanced_metrics
+from ppi_pairs import get_matching_pairs
+from ppi_evaluation import get_fold_files, read_labels, evaluate_folds
+from ppi_bootstrap import Bootstrap, get_confidence_interval
 
 describe_help = 'python evaluate_ppi.py -s SCORES/ -l labels.tsv -d 0.5 -r RESULTS/'
 parser = argparse.ArgumentParser(description=describe_help)
@@ -51,6 +61,16 @@ parser.add_argument('-d', '--delta', help='Imbalance ratio as positives/total (e
                     type=float, default=0.5)
 parser.add_argument('-n', '--name', help='Name for saving files, default basename will be results directory name', 
                     type=str, default='')
+parser.add_argument('--stream', help='Read predictions files in chunks keeping only labelled PPIs (for very large predictions files, memory proportional to number of labelled PPIs)', 
+                    action='store_true', default=False)
+parser.add_argument('-cs', '--chunksize', help='Number of PPIs read per chunk of predictions files when streaming (default 1048576)', 
+                    type=int, default=2**20)
+parser.add_argument('-j', '--jobs', help='Number of predictions files evaluated in parallel processes (default 1)', 
+                    type=int, default=1)
+parser.add_argument('-b', '--bootstrap', help='Number of bootstrap resamples of all predictions for 95%% confidence intervals of overall AUC_ROC and AUC_PR (default 0 for none)', 
+                    type=int, default=0)
+parser.add_argument('-sw', '--sweep', help='Imbalance ratios as positives/total evaluated in the same pass (e.g. 0.5 0.0909 0.0099 0.000999), metrics and PR curves of each saved together', 
+                    type=float, nargs='+', default=[])
 args = parser.parse_args()
 
 RESULTS_DIR = args.results
@@ -64,78 +84,22 @@ elif args.name == '' and len(args.labels) > 1:
 # Display ratio of positives:negatives
 RATIO = '1:' + str(int((1/args.delta) - 1))
 
-# Calculate estimate for prevalence-corrected precision on imbalanced data
-def recalculate_precision(df, precision, thresholds, d):
-    delta = 2*d - 1
-    new_precision = precision.copy()
-    for t in range(0, len(thresholds)):
-        tn, fp, fn, tp = metrics.confusion_matrix(df[1], (df[0] >= thresholds[t]).astype(int)).ravel()
-        lpp = tp/(tp+fn)
-        lnn = tn/(tn+fp)
-        if d != 0.5:
-            new_precision[t] = (lpp*(1 + delta)) / ( (lpp*(1 + delta)) + ((1 - lnn)*(1 - delta)) )
-        else:
-            new_precision[t] = (lpp)/(lpp + (1-lnn))
-    return new_precision
+# Add PPI scores and labels of a fold to preallocated arrays of all folds, doubled in size if full
+def add_scores(total, scores, labels, n):
+    if n + len(scores) > total.shape[0]:
+        total = np.concatenate([total, np.zeros((max(total.shape[0], len(scores)), 2), dtype=total.dtype)])
+    total[n:n + len(scores), 0] = scores
+    total[n:n + len(scores), 1] = labels
+    return total, n + len(scores)
 
-# Recalculate metrics for imbalanced classification where d is num_positives/(num_positives + num_negatives)
-def recalculate_metrics_to_imbalance(tp, tn, fp, fn, d):
-    delta = 2*d - 1
-    # recall and specificity are unchanged
-    lpp = tp/(tp+fn)
-    lnn = tn/(tn+fp)
-    if d != 0.5:
-        accuracy = lpp*((1 + delta)/2) + lnn*((1 - delta)/2)
-        precision = (lpp*(1 + delta)) / ( (lpp*(1 + delta)) + ((1 - lnn)*(1 - delta)) )
-        f1 = (2*lpp*(1 + delta)) / ( ((1+lpp)*(1+delta)) + ((1-lnn)*(1-delta)) )
-        mcc = (lpp+lnn-1) / np.sqrt((lpp + (1-lnn)*( (1-delta)/(1+delta) ) )*( lnn + (1-lpp)*( (1+delta)/(1-delta) ) ))
-    else:
-        accuracy = (lpp + lnn)/2
-        precision = (lpp)/(lpp + (1-lnn))
-        f1 = (2*lpp)/(2 + lpp - lnn)
-        mcc = (lpp + lnn - 1) / np.sqrt( (lpp + (1-lnn))*(lnn + (1-lpp)) )
-        
-    return round(accuracy, 5), round(precision, 5), round(lpp, 5), round(lnn, 5), round(f1, 5), round(mcc, 5)
-
-# Get labels for PPIs
-def get_matching_pairs(df_1, df_2):
-    # Get matches using PPI ordering of smaller df
-    if df_1.shape > df_2.shape:
-        df_test = df_1.copy()
-        df_train = df_2.copy()
-    else:
-        df_test = df_2.copy()
-        df_train = df_1.copy()
-    
-    # Include all PPIs where A-B is B-A
-    df_test_rev = df_test.copy()
-    df_test_rev[[df_test_rev.columns[0], df_test_rev.columns[1]]] = df_test_rev[[df_test_rev.columns[1], df_test_rev.columns[0]]]
-    df = df_test.append(df_test_rev)
-    df = df.drop_duplicates(subset=[df.columns[0], df.columns[1]])
-    df.reset_index(drop=True, inplace=True)
-    
-    # Merge to match all PPIs found between df
-    matches = df_train.merge(df, on=[df.columns[0], df.columns[1]])
-    matches = matches.drop_duplicates(subset=[df.columns[0], df.columns[1]])
-    matches.reset_index(drop=True, inplace=True)
-    # Returns as <ProteinA> <ProteinB> <label> <score>
-    return matches
-    
 
 if __name__ == '__main__':
 
-    # Get PPI scores
-    if os.path.isdir(args.scores):
-        # For cross-validation tested PPI subsets
-        files = os.listdir(path=args.scores)
-        files = [ x for x in files if 'prediction' in x and '.pos' not in x and '.neg' not in x ]
-        files.sort()
-    else:
-        # For single file tested PPIs
-        files = [ args.scores.split('/')[-1] ]
+    # Get PPI scores, for cross-validation tested PPI subsets or single file tested PPIs
+    files = get_fold_files(args.scores)
         
     # Get PPI labels for entire dataset
-    df_labels = pd.read_csv(args.labels, delim_whitespace=True, header=None)
+    df_labels, __ = read_labels(args.labels)
     
     # Metrics for evaluation
     # For ROC curve
@@ -154,35 +118,29 @@ if __name__ == '__main__':
     fold_specificity = []
     fold_f1 = []
     fold_mcc = []
+    # Metrics at 0.5 threshold (accuracy, precision, recall, specificity, f1, mcc x deltas) and AUC_PR of each fold for each delta of sweep
+    fold_sweep_metrics = []
+    fold_sweep_pr_aucs = []
 
-    df_pred_total = pd.DataFrame()
+    # Scores and labels of all folds
+    total = np.zeros((df_labels.shape[0], 2))
+    n_total = 0
     fold = 0
     output = args.name
-    for k in files:
+    # Folds read, matched to labels and evaluated by a pool of processes, results in order of files
+    for result in evaluate_folds([(filename, args.labels) for filename in files], args.delta, jobs=args.jobs, stream=args.stream, chunk_size=args.chunksize, deltas=args.sweep):
         
         # Isolate k-fold subset
         print('\n===== Fold - %s ====='%fold)
         output += '\n===== Fold - %s ====='%fold
         
-        # Read predictions for k-fold set or single test set
-        if os.path.isdir(args.scores):
-            df_pred = pd.read_csv(args.scores + k, delim_whitespace=True, header=None)
-        else:
-            df_pred = pd.read_csv(args.scores, delim_whitespace=True, header=None)
-        
-        # Get matching PPI labels for predictions
-        #if '_SPRINT_' not in k and ('SPRINT' not in args.scores and 'CME' not in args.scores):
-        df_pred = get_matching_pairs(df_pred, df_labels)
-        df_pred.drop(columns=[0, 1], inplace=True)
-        df_pred.rename(columns={'2_x': 0, '2_y': 1}, inplace=True)
-        #df_pred[[0, 1]] = df_pred[[1, 0]]
-        
-        df_pred_total = df_pred_total.append(df_pred)
+        total, n_total = add_scores(total, result['scores'], result['labels'], n_total)
         
         # Get other metrics at 0.5 threshold if predictions are probabilities (0 to 1) i.e. not SPRINT predictions
-        if df_pred[0].min() >= 0 and df_pred[0].max() <= 1: #and 'SPRINT' not in args.scores:
+        if result['confusion'] is not None: #and 'SPRINT' not in args.scores:
             
-            tn, fp, fn, tp = metrics.confusion_matrix(df_pred[1], (df_pred[0] + 1e-12).round()).ravel()
+            tn, fp, fn, tp = result['confusion']
+            fold_sweep_metrics.append(get_imbalanced_metrics(tn, fp, fn, tp, args.sweep))
             print('TP = %0.0f \nFP = %0.0f \nTN = %0.0f \nFN = %0.0f'%(tp, fp, tn, fn))
             output += '\nTP = %0.0f \nFP = %0.0f \nTN = %0.0f \nFN = %0.0f'%(tp, fp, tn, fn)
             print('Total samples = %s'%(tn+fp+fn+tp))
@@ -190,7 +148,7 @@ if __name__ == '__main__':
             
             # For imbalanced classification metrics
             if args.delta != 0.5:
-                accuracy, precision, recall, specificity, f1, mcc = recalculate_metrics_to_imbalance(tp, tn, fp, fn, args.delta)
+                accuracy, precision, recall, specificity, f1, mcc = [round(m[0], 5) for m in get_imbalanced_metrics(tn, fp, fn, tp, [args.delta])]
                 if np.isnan(accuracy) == False:
                     fold_accuracy.append(accuracy)
                 if np.isnan(precision) == False:
@@ -239,15 +197,9 @@ if __name__ == '__main__':
             output += '\nAccuracy = ' + str(accuracy) + '\nPrecision = ' + str(precision) + '\nRecall = '+ str(recall) + '\nSpecificity = ' + str(specificity) + '\nF1 = ' + str(f1) + '\nMCC = ' + str(mcc)
         np.seterr(invalid='ignore')
         # Evaluate k-fold performance and adjust for hypothetical imbalance
-        precision, recall, thresholds = metrics.precision_recall_curve(df_pred[1], df_pred[0])
-        if args.delta != 0.5:
-            precision = recalculate_precision(df_pred, precision, thresholds, args.delta)
-        fpr, tpr, __ = metrics.roc_curve(df_pred[1], df_pred[0])
-        if args.delta == 0.5:
-            pr_auc = metrics.average_precision_score(df_pred[1], df_pred[0])
-        else:
-            pr_auc = metrics.auc(recall, precision)
-        roc_auc = metrics.roc_auc_score(df_pred[1], df_pred[0])
+        precision, recall = result['precision'], result['recall']
+        fpr, tpr = result['fpr'], result['tpr']
+        pr_auc, roc_auc = result['pr_auc'], result['roc_auc']
         
         print('AUC_ROC = %0.5f'%roc_auc, '\nAUC_PR = %0.5f'%pr_auc)
         output += '\nAUC_ROC = %0.5f'%roc_auc + '\nAUC_PR = %0.5f\n'%pr_auc
@@ -259,19 +211,16 @@ if __name__ == '__main__':
         precisions[fold] = precision
         recalls[fold] = recall
         pr_aucs[fold] = pr_auc
+        fold_sweep_pr_aucs.append([result['sweep'][d] for d in args.sweep])
     
         fold += 1
     
     # Get total performance from all PPI predictions (concatenated k-fold tested subsets)
-    precision, recall, thresholds = metrics.precision_recall_curve(df_pred_total[1], df_pred_total[0])
-    if args.delta != 0.5:
-        precision = recalculate_precision(df_pred_total, precision, thresholds, args.delta)
-    fpr, tpr, __ = metrics.roc_curve(df_pred_total[1], df_pred_total[0])
-    if args.delta == 0.5:
-        pr_auc = metrics.average_precision_score(df_pred_total[1], df_pred_total[0])
-    else:
-        pr_auc = metrics.auc(recall, precision)
-    roc_auc = metrics.roc_auc_score(df_pred_total[1], df_pred_total[0])
+    curves = Curves(total[:n_total, 1], total[:n_total, 0])
+    precision, recall, thresholds = curves.pr(args.delta)
+    fpr, tpr, __ = curves.roc()
+    pr_auc = curves.pr_auc(args.delta)
+    roc_auc = curves.roc_auc()
     
     if args.delta <= 0.5:
         leg_loc = 'lower right'
@@ -279,7 +228,7 @@ if __name__ == '__main__':
         leg_loc = 'upper right'
     
     # Get other metrics at 0.5 threshold if predictions are probabilities (0 to 1) i.e. not SPRINT predictions
-    if df_pred_total[0].min() >= 0 and df_pred_total[0].max() <= 1:# and 'SPRINT' not in args.scores:
+    if total[:n_total, 0].min() >= 0 and total[:n_total, 0].max() <= 1:# and 'SPRINT' not in args.scores:
         evaluation = ('accuracy = %.5f (+/- %.5f)'%(np.mean(fold_accuracy), np.std(fold_accuracy))
                       + '\nprecision = %.5f (+/- %.5f)'%(np.mean(fold_precision), np.std(fold_precision)) 
                       + '\nrecall = %.5f (+/- %.5f)'%(np.mean(fold_recall), np.std(fold_recall)) 
@@ -297,6 +246,12 @@ if __name__ == '__main__':
                       + '\nroc_auc_overall = %.5f' % (roc_auc)
                       + '\npr_auc_overall = %.5f' % (pr_auc)
                       + '\n')        
+    if args.bootstrap > 0:
+        # Resamples of all predictions sorted once, chunks of resamples computed by processes
+        boot_roc_aucs, boot_pr_aucs = Bootstrap(total[:n_total, 1], total[:n_total, 0]).get_aucs(args.bootstrap, delta=args.delta, jobs=args.jobs)
+        evaluation += ('roc_auc_overall_95ci = [%.5f, %.5f]' % get_confidence_interval(boot_roc_aucs)
+                       + '\npr_auc_overall_95ci = [%.5f, %.5f]' % get_confidence_interval(boot_pr_aucs)
+                       + '\n')
 
     print('\n===== EVALUATION =====')
     print(evaluation)
@@ -371,3 +326,33 @@ if __name__ == '__main__':
     plt.legend(loc=leg_loc, handlelength=0, prop={'size': 8})
     plt.savefig(RESULTS_DIR + args.name + '_ROC.png', format='png')
     plt.close()
+    
+    if len(args.sweep) > 0:
+        # Metrics and PR curves of all imbalance ratios of sweep from the same sorted predictions
+        print("Evaluating imbalance ratios %s"%args.sweep)
+        sweep = curves.sweep(args.sweep)
+        df_sweep = pd.DataFrame(data={'delta': args.sweep, 'ratio': ['1:' + str(int((1/d) - 1)) for d in args.sweep]})
+        if len(fold_sweep_metrics) > 0:
+            fold_sweep_metrics = np.array(fold_sweep_metrics)
+            with np.errstate(invalid='ignore'):
+                for m, metric in enumerate(['accuracy', 'precision', 'recall', 'specificity', 'f1', 'mcc']):
+                    df_sweep[metric] = np.nanmean(fold_sweep_metrics[:, m], axis=0)
+                    df_sweep[metric + '_std'] = np.nanstd(fold_sweep_metrics[:, m], axis=0)
+        fold_sweep_pr_aucs = np.array(fold_sweep_pr_aucs)
+        df_sweep['pr_auc'] = np.mean(fold_sweep_pr_aucs, axis=0)
+        df_sweep['pr_auc_std'] = np.std(fold_sweep_pr_aucs, axis=0)
+        df_sweep['pr_auc_overall'] = [sweep[d]['pr_auc'] for d in args.sweep]
+        print(df_sweep.to_string(index=False))
+        df_sweep.to_csv(RESULTS_DIR + 'sweep_' + args.name + '.tsv', sep='\t', index=False, float_format='%.5f')
+        
+        plt.figure
+        for d, r in zip(args.sweep, df_sweep['ratio']):
+            plt.plot(sweep[d]['recall'], sweep[d]['precision'], label='ratio = %s, AUC = %0.4f' % (r, sweep[d]['pr_auc']))
+        plt.xlabel('Recall')
+        plt.ylabel('Precision') 
+        plt.xlim([-0.05, 1.05])
+        plt.ylim([-0.05, 1.05])
+        plt.title("Precision-Recall Curve - %s"%(args.name))
+        plt.legend(loc='upper right', prop={'size': 8})
+        plt.savefig(RESULTS_DIR + args.name + '_PR_sweep.png', format='png')
+        plt.close()
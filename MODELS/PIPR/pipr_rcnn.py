@@ -48,10 +48,11 @@ from keras.layers.convolutional import Conv1D
 from keras.layers.pooling import MaxPooling1D, GlobalAveragePooling1D
 from keras.optimizers import Adam,  RMSprop
 from sklearn.model_selection import KFold, StratifiedKFold
-from sklearn.metrics import roc_auc_score, average_precision_score
 
 if 'embeddings' not in sys.path:
     sys.path.append('embeddings')
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from ppi_metrics import Curves
 
 # Description of command-line usage
 describe_help = 'CUDA_VISIBLE_DEVICES=0 python pipr_rcnn.py sequencesFile.fasta trainFile.tsv testFile.tsv'
@@ -438,8 +439,10 @@ if __name__ == "__main__":
                     else:
                         num_true_neg += 1
             
-            auc_roc_test = roc_auc_score(class_labels[test], pred)
-            auc_pr_test = average_precision_score(class_labels[test], pred)
+            # Macro average over both label columns, scores of each sorted once
+            curves = [Curves(class_labels[test][:, j], pred[:, j]) for j in range(class_labels.shape[1])]
+            auc_roc_test = np.mean([c.roc_auc() for c in curves])
+            auc_pr_test = np.mean([c.average_precision() for c in curves])
             
             print("======== Fold", cv)
             print('\ntp=%0.0f \nfp=%0.0f \ntn=%0.0f \nfn=%0.0f \n'%(num_true_pos, num_false_pos, num_true_neg, num_false_neg))
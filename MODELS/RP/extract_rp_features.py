@@ -12,33 +12,65 @@ Description:
     
     Input arguements:
         -l: <str> path to labeled dataset to convert to RP dataset (.tsv)
-        -p: <str> path to file containing all-to-all PPI predictions
+        -p: <str> path(s) to files containing all-to-all PPI predictions, one per expert (e.g. SPRINT PIPR DEEPFE DPPI),
+            either .tsv or score matrix .npy (see score_matrix.py)
+        -e: <str> names of experts for multiple prediction files, default is prediction filenames (without extension)
         -r: <str> path to directory to save RP feature dataset
         -m: <float> Percent of available processors to use multiprocessing, default is 0 (no multiprocessing)
+        -c: <float> Memory bound (MB) for caching one-to-all curves per process, default is 1024 (0 = no caching)
+        -s: <flag> Stream predictions into an on-disk store (for predictions too large to fit in memory)
+        -mem: <float> Memory budget (MB) for streaming predictions, default is 2048
+        -u: <flag> Update RP dataset from state saved by previous run (with -u) in results directory,
+            only new labelled pairs and pairs of proteins whose one-to-all predictions changed are computed
+        -a: <flag> Extract RP features for every pair in predictions instead of labelled pairs (-l not needed)
+        -b: <flag> Also save RP features as typed numeric arrays (.npz), read by rp_ppi_classifier.py without parsing text
     
     Output files:
         A single .tsv file of RP features for each PPI found in given labelled pairs.
+        Given multiple prediction files, one wide .tsv file (RP_<experts>_<labels>) of all experts' RP features
+        with columns prefixed by expert name, labels are read and indexed once for all experts.
+        With -u, state of RP dataset for next update (RP_<labels>.state.npz, one per expert if multiple) containing
+            predictions file hash, per-protein digests of one-to-all predictions, knees/elbows and RP values.
+        With -a, a .tsv file (RP_ALL_<predictions>) of RP features for every pair in each predictions file (label 0).
+        If streaming, the store of predictions is kept in a STORE_<predictions filename>/ directory of results.
+        Optionally, the same RP features as a .npz file containing:
+            features: structured array of RP features (int32 ranks/binary values, float64 otherwise)
+            proteins: protein IDs, protein_a/protein_b: codes of PPI protein IDs in proteins
+            label: PPI labels
     
 @author: Eric Arezza
 Last Updated: October 13, 2021
 """
 
-import os, argparse
+import os, sys, argparse
+import hashlib
 import warnings
 import numpy as np
 import pandas as pd
-from kneed import KneeLocator
 import matplotlib.pyplot as plt
 import time
 import tqdm as tqdm
 import multiprocessing
+from multiprocessing import shared_memory
+from rp_knee import Knee, locate_knees
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from score_matrix import ScoreMatrix, is_score_matrix
+from ppi_pairs import get_matching_pairs
+from collections import OrderedDict
 
-describe_help = 'python extract_rp_features.py -l labels.tsv -p predictions.tsv -r RESULTS/ -m 0.5'
+describe_help = 'python extract_rp_features.py -l labels.tsv -p predictions.tsv [predictions2.tsv ...] -r RESULTS/ -m 0.5'
 parser = argparse.ArgumentParser(description=describe_help)
 parser.add_argument('-l', '--labels', help='Path to labeled PPIs file to convert to RP dataset (.tsv)', type=str)
-parser.add_argument('-p', '--predictions', help='Path to directory with all-to-all PPI prediction files', type=str)
+parser.add_argument('-p', '--predictions', help='Path(s) to all-to-all PPI prediction files, one per expert', type=str, nargs='+')
+parser.add_argument('-e', '--experts', help='Names of experts for multiple prediction files (default prediction filenames)', type=str, nargs='+')
 parser.add_argument('-r', '--results', help='Path to directory to save new RP dataset', type=str, default=os.getcwd()+'/')
 parser.add_argument('-m', '--multiprocessing', help='Percent of processors to use for multiprocessing (default 0 = no multiprocessing)', type=float, default=0)
+parser.add_argument('-c', '--cache', help='Memory bound (MB) for caching one-to-all curves per process (default 1024, 0 = no caching)', type=float, default=1024)
+parser.add_argument('-s', '--stream', help='Stream predictions into an on-disk store instead of loading them in memory', action='store_true', default=False)
+parser.add_argument('-mem', '--memory', help='Memory budget (MB) for streaming predictions (default 2048)', type=float, default=2048)
+parser.add_argument('-u', '--update', help='Update RP dataset from state of previous run in results, only computing new labelled pairs and changed proteins', action='store_true', default=False)
+parser.add_argument('-a', '--all', help='Extract RP features for every pair in predictions (proteome-wide, labels not needed)', action='store_true', default=False)
+parser.add_argument('-b', '--binary', help='Also save RP features as typed numeric arrays (.npz)', action='store_true', default=False)
 args = parser.parse_args()
 
 
@@ -53,6 +85,247 @@ class Labels(object):
         return get_protein_ppi(self.labels, protein)
 
 
+class ScoreIndex(object):
+    # Per-protein partitioned index of a PPI table, built once per predictions (or labels) file
+    # df_in contains 3 columns as <proteinA> <proteinB> <score> (or <label>)
+    # Each protein's PPIs are stored as one contiguous slice, pre-sorted descending by score exactly
+    # as get_protein_ppi sorts them, with slice offsets addressed by integer protein code
+    # proteins is an optional code table (pd.Index of protein IDs) shared with other indices, extended by new IDs
+    def __init__(self, df_in: pd.DataFrame, proteins=None):
+        self.columns = df_in.columns
+        n = df_in.shape[0]
+
+        # Intern protein IDs to integer codes
+        ids = pd.concat([df_in[self.columns[0]], df_in[self.columns[1]]], ignore_index=True)
+        if proteins is None:
+            codes, self.proteins = pd.factorize(ids)
+        else:
+            self.proteins = proteins.append(pd.Index(pd.unique(ids)).difference(proteins, sort=False))
+            codes = self.proteins.get_indexer(ids)
+        self.codes = {p: c for c, p in enumerate(self.proteins)}
+        code_a, code_b = codes[:n], codes[n:]
+        values = df_in[self.columns[-1]].to_numpy()
+
+        # Each PPI belongs to the slice of both proteins (only once if self-interacting)
+        cross = code_a != code_b
+        owner = np.concatenate([code_a, code_b[cross]])
+        rows = np.concatenate([np.arange(n), np.arange(n)[cross]])
+        # Group rows by protein while keeping their original order within each protein
+        order = np.lexsort((rows, owner))
+        rows = rows[order]
+        self.offsets = np.zeros(len(self.proteins) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(owner, minlength=len(self.proteins)), out=self.offsets[1:])
+        for c in range(len(self.proteins)):
+            start, end = self.offsets[c], self.offsets[c + 1]
+            rows[start:end] = rows[start:end][sort_descending(values[rows[start:end]])]
+
+        self.pair_a = code_a[rows].astype(np.int32)
+        self.pair_b = code_b[rows].astype(np.int32)
+        self.values = values[rows]
+
+        # Basic global stats of scores
+        scores = df_in[self.columns[-1]]
+        self.mean = np.mean(scores)
+        self.median = np.median(scores)
+        self.std = np.std(scores)
+        
+        # Knee/elbow of one-to-all curves, keyed by KneeLocator params then protein
+        self.knees = {}
+
+    @classmethod
+    def attach(cls, arrays, attributes):
+        # Rebuild index (e.g. in a worker process) from arrays and attributes given by share, arrays are not copied
+        index = cls.__new__(cls)
+        index.__dict__.update(attributes)
+        index.__dict__.update(arrays)
+        index.codes = {p: c for c, p in enumerate(index.proteins)}
+        return index
+
+    def share(self):
+        # Numeric arrays (to place in shared memory) and remaining attributes needed to rebuild index with attach
+        arrays = {'offsets': self.offsets, 'pair_a': self.pair_a, 'pair_b': self.pair_b, 'values': self.values}
+        attributes = {k: v for k, v in self.__dict__.items() if k not in arrays and k != 'codes'}
+        return arrays, attributes
+
+    def __contains__(self, protein):
+        return protein in self.codes
+
+    def has_pair(self, proteinA, proteinB):
+        # True if PPI between proteinA and proteinB (in either order) is indexed
+        start, end = self.get_bounds(proteinA)
+        code = self.codes.get(proteinB)
+        if code is None:
+            return False
+        return bool(((self.pair_a[start:end] == code) | (self.pair_b[start:end] == code)).any())
+
+    def get_bounds(self, protein):
+        # Start and end of slice for protein, empty slice if protein has no PPIs
+        code = self.codes.get(protein)
+        if code is None:
+            return 0, 0
+        return self.offsets[code], self.offsets[code + 1]
+
+    def get_ppi(self, protein):
+        # Same as get_protein_ppi(df_in, protein) without scanning df_in
+        start, end = self.get_bounds(protein)
+        return pd.DataFrame({self.columns[0]: self.proteins[self.pair_a[start:end]],
+                             self.columns[1]: self.proteins[self.pair_b[start:end]],
+                             self.columns[2]: self.values[start:end]},
+                            columns=self.columns)
+
+    def locate_knees(self, proteins=None, sens=5, deg=7, on=True):
+        # Locate knee/elbow of one-to-all curves for proteins (default all) as a batch, see rp_knee
+        # Proteins already located (e.g. reused from a previous run) are skipped
+        located = self.knees.setdefault((sens, deg, on), {})
+        proteins = self.proteins if proteins is None else proteins
+        codes = np.array([self.codes[p] for p in proteins if p in self.codes and p not in located], dtype=np.int64)
+        curves = [self.values[self.offsets[c]:self.offsets[c + 1]] for c in codes]
+        knee, elbow, sensitivity = locate_knees(curves, sens=sens, deg=deg, online=on)
+        located.update(zip(self.proteins[codes], zip(knee, elbow, sensitivity)))
+
+    def get_knee_elbow(self, protein, sens=5, deg=7, on=True):
+        # Knee, elbow and sensitivity for protein if already located, otherwise None
+        return self.knees.get((sens, deg, on), {}).get(protein)
+
+    def get_digests(self, proteins):
+        # Content digest (uint64) of each protein's one-to-all slice as partner IDs and scores in ranked order
+        # Independent of protein codes, so digests can be compared between runs (or files)
+        partners = np.array([int.from_bytes(hashlib.blake2b(str(p).encode(), digest_size=8).digest(), 'little') for p in self.proteins], dtype=np.uint64)
+        digests = np.zeros(len(proteins), dtype=np.uint64)
+        for i, protein in enumerate(proteins):
+            start, end = self.get_bounds(protein)
+            code = self.codes.get(protein, -1)
+            a, b = self.pair_a[start:end], self.pair_b[start:end]
+            digest = hashlib.blake2b(partners[np.where(a == code, b, a)].tobytes(), digest_size=8)
+            digest.update(np.ascontiguousarray(self.values[start:end], dtype=np.float64).tobytes())
+            digests[i] = int.from_bytes(digest.digest(), 'little')
+        return digests
+
+
+class ScoreStore(ScoreIndex):
+    # Out-of-core ScoreIndex for all-to-all predictions too large to load, built by streaming the predictions file
+    # Protein IDs are interned to int32 codes and each protein's PPIs are spilled to memory-mapped files in path,
+    # as one contiguous slice pre-sorted descending by score (equal scores ordered by partner), read lazily per protein
+    # Redundant pairs (A-B and B-A) are kept once with the highest score
+    # memory is the budget (MB) for reading, deduplicating and partitioning chunks of predictions
+    # proteins is an optional code table shared with other indices (see ScoreIndex)
+    RECORD = np.dtype([('a', np.int32), ('b', np.int32), ('score', np.float64)])
+
+    def __init__(self, filename, path, memory=2048, proteins=None):
+        self.path = path
+        self.columns = pd.Index([0, 1, 2])
+        os.makedirs(path, exist_ok=True)
+        budget = int(memory*1024**2)
+        # Rows parsed per chunk (~200 bytes per row of parsed IDs and scores), records held per chunk (~5 arrays of records)
+        chunk_rows = max(1000, budget // 4 // 200)
+        chunk_records = max(1000, budget // 5 // self.RECORD.itemsize)
+        
+        # Spill records to buckets by lowest protein code so both orders of a pair land in the same bucket
+        with open(filename) as f:
+            sample = [len(line) for _, line in zip(range(1000), f)]
+        rows = os.path.getsize(filename) / max(1, np.mean(sample)) if sample else 0
+        n_buckets = int(min(512, max(1, np.ceil(rows / chunk_records))))
+        buckets = [os.path.join(path, 'bucket_%d.bin'%i) for i in range(n_buckets)]
+        codes = {} if proteins is None else {p: c for c, p in enumerate(proteins)}
+        handles = [open(b, 'wb') for b in buckets]
+        try:
+            for chunk in pd.read_csv(filename, delim_whitespace=True, header=None, chunksize=chunk_rows):
+                # Intern protein IDs to int32 codes
+                for p in pd.unique(pd.concat([chunk[0], chunk[1]], ignore_index=True)):
+                    if p not in codes:
+                        codes[p] = len(codes)
+                records = np.empty(chunk.shape[0], dtype=self.RECORD)
+                records['a'] = chunk[0].map(codes).to_numpy()
+                records['b'] = chunk[1].map(codes).to_numpy()
+                records['score'] = chunk[chunk.columns[2]].to_numpy(dtype=np.float64)
+                bucket = np.minimum(records['a'], records['b']) % n_buckets
+                for i in np.unique(bucket):
+                    records[bucket == i].tofile(handles[i])
+        finally:
+            for h in handles:
+                h.close()
+        self.proteins = pd.Index(list(codes), dtype=object)
+        self.codes = codes
+        n_proteins = len(self.proteins)
+        
+        # Remove redundant pairs within each bucket, keeping highest score (first in file if equal)
+        pairs_file = os.path.join(path, 'pairs.bin')
+        counts = np.zeros(n_proteins, dtype=np.int64)
+        with open(pairs_file, 'wb') as h:
+            for b in buckets:
+                records = np.fromfile(b, dtype=self.RECORD)
+                low = np.minimum(records['a'], records['b'])
+                high = np.maximum(records['a'], records['b'])
+                order = np.lexsort((-records['score'], high, low))
+                first = np.ones(len(order), dtype=bool)
+                first[1:] = (low[order][1:] != low[order][:-1]) | (high[order][1:] != high[order][:-1])
+                records = records[np.sort(order[first])]
+                records.tofile(h)
+                # Each PPI belongs to the slice of both proteins (only once if self-interacting)
+                counts += np.bincount(records['a'], minlength=n_proteins)
+                counts += np.bincount(records['b'][records['a'] != records['b']], minlength=n_proteins)
+                os.remove(b)
+        pairs = np.memmap(pairs_file, dtype=self.RECORD, mode='r') if os.path.getsize(pairs_file) else np.empty(0, dtype=self.RECORD)
+        
+        # Scatter each PPI into its proteins' slices
+        self.offsets = np.zeros(n_proteins + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.offsets[1:])
+        total = int(self.offsets[-1])
+        pair_a = np.lib.format.open_memmap(os.path.join(path, 'pair_a.npy'), mode='w+', dtype=np.int32, shape=(total,))
+        pair_b = np.lib.format.open_memmap(os.path.join(path, 'pair_b.npy'), mode='w+', dtype=np.int32, shape=(total,))
+        values = np.lib.format.open_memmap(os.path.join(path, 'values.npy'), mode='w+', dtype=np.float64, shape=(total,))
+        cursor = self.offsets[:-1].copy()
+        for start in range(0, len(pairs), chunk_records // 2):
+            records = np.array(pairs[start:start + chunk_records // 2])
+            cross = records['a'] != records['b']
+            owner = np.concatenate([records['a'], records['b'][cross]])
+            entries = np.concatenate([records, records[cross]])
+            order = np.argsort(owner, kind='stable')
+            owner, entries = owner[order], entries[order]
+            # Position of each entry is after entries of the same protein already placed
+            group_start = np.searchsorted(owner, owner, side='left')
+            position = cursor[owner] + np.arange(len(owner)) - group_start
+            cursor += np.bincount(owner, minlength=n_proteins)
+            pair_a[position] = entries['a']
+            pair_b[position] = entries['b']
+            values[position] = entries['score']
+        
+        # Sort each protein's slice descending by score (NaNs last), equal scores by partner
+        for c in range(n_proteins):
+            start, end = self.offsets[c], self.offsets[c + 1]
+            a, b, v = pair_a[start:end], pair_b[start:end], values[start:end]
+            order = np.lexsort((np.where(a == c, b, a), -v))
+            pair_a[start:end], pair_b[start:end], values[start:end] = a[order], b[order], v[order]
+        for a in (pair_a, pair_b, values):
+            a.flush()
+        del pair_a, pair_b, values
+        
+        # Basic global stats of scores (each PPI once)
+        self.mean, self.std, self.median = chunked_stats(pairs['score'], chunk_records)
+        del pairs
+        os.remove(pairs_file)
+        
+        self.knees = {}
+        self.open()
+
+    def open(self):
+        # Memory-map protein slices read-only
+        self.pair_a = np.load(os.path.join(self.path, 'pair_a.npy'), mmap_mode='r')
+        self.pair_b = np.load(os.path.join(self.path, 'pair_b.npy'), mmap_mode='r')
+        self.values = np.load(os.path.join(self.path, 'values.npy'), mmap_mode='r')
+
+    @classmethod
+    def attach(cls, arrays, attributes):
+        store = super().attach(arrays, attributes)
+        store.open()
+        return store
+
+    def share(self):
+        # Memory-mapped slices are reopened by path in other processes instead of being placed in shared memory
+        attributes = {k: v for k, v in self.__dict__.items() if k not in ('pair_a', 'pair_b', 'values', 'codes')}
+        return {}, attributes
+
+
 # If no knee found, manually assign knee to last ranked PPI
 class No_Knee(object):
     def __init__(self, scores: pd.DataFrame):
@@ -70,10 +343,11 @@ class No_Elbow(object):
 
 
 class OneToAll(object):
-    def __init__(self, df_scores: pd.DataFrame, df_labels: pd.DataFrame, proteinID, sens=5, deg=7, on=True):
+    # knee_elbow is an optional (knee, elbow, sensitivity) already located for proteinID, see rp_knee.locate_knees
+    def __init__(self, df_scores: pd.DataFrame, df_labels: pd.DataFrame, proteinID, sens=5, deg=7, on=True, knee_elbow=None):
         self.scores = df_scores
         self.labels = Labels(df_labels)
-        self.proteins = self.scores[self.scores.columns[0]].append(self.scores[self.scores.columns[1]]).unique()
+        self.proteins = pd.concat([self.scores[self.scores.columns[0]], self.scores[self.scores.columns[1]]]).unique()
         self.ID = proteinID
         self.sensitivity=sens
         self.degree=deg
@@ -89,66 +363,25 @@ class OneToAll(object):
         self.ranks = predictions.rank(ascending=False)
         self.percentiles = predictions.rank(pct=True)
         
+        # Partner -> (rank, score) lookup so rank/score queries don't re-filter scores
+        self.partners = self.map_partners()
+        
         # Local knee/elbow thresholds, knee is 'concave' elbow is 'convex'
         if not predictions.any():
             # When all scores are 0, no knee/elbow possible
             self.knee = No_Knee(self.scores)
             self.elbow = No_Elbow(self.scores)
         else:
-            x = self.scores.index.tolist()
-            y = predictions #.fillna(0.0) # Fill w/ 0.0 to avoid +-Inf/NaN
-            try:
-                # Adjust sensitivity until knee found to avoid None value
-                for s in range(sens, -1, -1):
-                    
-                    self.knee = KneeLocator(
-                        x, y,
-                        interp_method='polynomial',
-                        curve='concave',
-                        direction='decreasing',
-                        online=on,
-                        S=s,
-                        polynomial_degree=deg
-                    )
-
-                    if self.knee.knee:
-                        self.sensitivity=s
-                        break
-
-            except Exception:
-                # If still no knee found, manually assign knee to last rank PPI
-                if not hasattr(self, 'knee'):
-                    self.knee = No_Knee(self.scores)
-                elif self.knee.knee == None:
-                    self.knee = No_Knee(self.scores)
-
-            try:
-                # Adjust sensitivity until elbow found to avoid None value
-                for s in range(sens, -1, -1):
-                    self.elbow = KneeLocator(
-                        x, y,
-                        interp_method='polynomial',
-                        curve='convex',
-                        direction='decreasing',
-                        online=on,
-                        S=s,
-                        polynomial_degree=deg
-                    )
-
-                    if self.elbow.knee:
-                        self.sensitivity=s
-                        break
-            except:
-                # If still no elbow found, manually assign elbow to first rank PPI
-                if not hasattr(self, 'elbow'): # If it fails on the first pass
-                    self.elbow = No_Elbow(self.scores)
-                elif self.elbow.knee == None:
-                    self.elbow = No_Elbow(self.scores)
-
-        if self.knee.knee == None:
-            self.knee = No_Knee(self.scores)
-        if self.elbow.knee == None:
-            self.elbow = No_Elbow(self.scores)
+            # Adjust sensitivity until knee/elbow found, unless already located as part of a batch of proteins
+            if knee_elbow is None:
+                knee, elbow, sensitivity = locate_knees([predictions.to_numpy()], sens=sens, deg=deg, online=on)
+                knee_elbow = (knee[0], elbow[0], sensitivity[0])
+            knee, elbow, self.sensitivity = knee_elbow
+            # If no knee found, manually assign knee to last rank PPI
+            self.knee = Knee(predictions, knee) if knee >= 0 else No_Knee(self.scores)
+            # If no elbow found, manually assign elbow to first rank PPI
+            self.elbow = Knee(predictions, elbow) if elbow >= 0 else No_Elbow(self.scores)
+
         # Swap if poor elbow/knee detections
         if self.knee.knee < self.elbow.knee:
             temp = self.knee
@@ -167,26 +400,38 @@ class OneToAll(object):
     def get_ppi(self, protein):
         return get_protein_ppi(self.scores, protein)
     
+    def map_partners(self):
+        # Rank of a protein is the first position of its top scoring PPI in the one-to-all scores
+        # (same as filtering scores with get_ppi and scanning for the top PPI), score is that PPI's score
+        proteins_a = self.scores[self.scores.columns[0]].to_numpy()
+        proteins_b = self.scores[self.scores.columns[1]].to_numpy()
+        values = self.scores[self.scores.columns[-1]].to_numpy()
+        positions = np.arange(len(values))
+        
+        def top_ppi(rows):
+            top = rows[sort_descending(values[rows])[0]]
+            same = rows[(proteins_a[rows] == proteins_a[top]) & (proteins_b[rows] == proteins_b[top])]
+            return same[0], values[top]
+        
+        partners = np.where(proteins_a == self.ID, proteins_b, proteins_a)
+        codes, uniques = pd.factorize(partners)
+        counts = np.bincount(codes, minlength=len(uniques))
+        # Partners with a single PPI rank at its position
+        single = counts[codes] == 1
+        lookup = dict(zip(partners[single], zip(positions[single], values[single])))
+        # Partners with repeated PPIs
+        for c in np.flatnonzero(counts > 1):
+            lookup[uniques[c]] = top_ppi(positions[codes == c])
+        # Every PPI contains the protein itself
+        if len(values):
+            lookup[self.ID] = top_ppi(positions)
+        return lookup
+    
     def get_rank(self, protein):
-        df = self.get_ppi(protein)
-        try:
-            rank = self.scores.loc[(self.scores[self.scores.columns[0]] == df.iloc[0][df.columns[0]]) &
-                                    (self.scores[self.scores.columns[1]] == df.iloc[0][df.columns[1]])].index[0]
-        except IndexError:
-            try:
-                rank = self.scores.loc[(self.scores[self.scores.columns[1]] == df.iloc[0][df.columns[0]]) &
-                                        (self.scores[self.scores.columns[0]] == df.iloc[0][df.columns[1]])].index[0]
-            except IndexError:
-                rank = np.nan
-        return rank
+        return self.partners.get(protein, (np.nan, np.nan))[0]
     
     def get_score(self, protein):
-        df = self.get_ppi(protein)
-        try:
-            score = df.iloc[0].iloc[-1]
-        except IndexError:
-            score = np.nan
-        return score
+        return self.partners.get(protein, (np.nan, np.nan))[1]
     
     def get_relative_rank(self, protein):
         return (self.get_rank(protein))/len(self.ranks)
@@ -252,11 +497,59 @@ class OneToAll(object):
         plt.show()
     
 
+class OneToAllCache(object):
+    # Bounded cache of OneToAll objects shared across labelled pairs
+    # A protein's one-to-all curve (sorted scores, ranks, knee/elbow, local stats) only depends on the protein
+    # and the predictions, so it is built once and reused for every labelled pair the protein appears in
+    # max_bytes bounds the approximate memory held, least recently used proteins are evicted first
+    def __init__(self, max_bytes=1024*1024**2):
+        self.max_bytes = max_bytes
+        self.curves = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, df_predictions, df_labels, proteinID, sens=5, deg=7, on=True):
+        key = (proteinID, sens, deg, on)
+        if key in self.curves:
+            self.curves.move_to_end(key)
+            self.hits += 1
+            return self.curves[key][0]
+        self.misses += 1
+        one_to_all = OneToAll(get_protein_ppi(df_predictions, proteinID), get_protein_ppi(df_labels, proteinID),
+                              proteinID, sens=sens, deg=deg, on=on, knee_elbow=get_knee_elbow(df_predictions, proteinID, sens, deg, on))
+        size = self.sizeof(one_to_all)
+        if size <= self.max_bytes:
+            self.curves[key] = (one_to_all, size)
+            self.nbytes += size
+            # Evict least recently used curves until within memory bound
+            while self.nbytes > self.max_bytes:
+                _, (_, evicted) = self.curves.popitem(last=False)
+                self.nbytes -= evicted
+        return one_to_all
+
+    def sizeof(self, one_to_all):
+        # Approximate bytes held by one-to-all (scores, labels split 2 ways, ranks, knee/elbow arrays)
+        size = one_to_all.scores.memory_usage(deep=True).sum()
+        size += 2*one_to_all.labels.all.memory_usage(deep=True).sum()
+        size += one_to_all.ranks.nbytes + one_to_all.percentiles.nbytes
+        size += sys.getsizeof(one_to_all.partners) + len(one_to_all.partners)*sys.getsizeof((0, 0.0))
+        for curve in (one_to_all.knee, one_to_all.elbow):
+            size += sum(v.nbytes for v in vars(curve).values() if isinstance(v, np.ndarray))
+        return size
+
+    def clear(self):
+        self.curves.clear()
+        self.nbytes = 0
+
+
 class RP_AB(object):
     # df_predictions contains 3 columns as <proteinA> <proteinB> <score>
     # df_labels contains 3 columns as <proteinA> <proteinB> <label>
+    # df_predictions and df_labels can each be given as a ScoreIndex to avoid re-filtering for every pair
+    # cache is an optional OneToAllCache to reuse one-to-all curves of proteins seen in previous pairs
     # proteinA and protein B are each a string of the protein IDs for reciprocal perspectives
-    # sens, deg, and on are used for finding the elbow/knee, see kneed.KneeLocator for info
+    # sens, deg, and on are used for finding the elbow/knee, see rp_knee (and kneed.KneeLocator) for info
 
     COLUMNS = ['Protein_A', 'Protein_B', 
                    'Rank_A_in_B', 'Rank_B_in_A', 'Score_A_in_B', 'Score_B_in_A',
@@ -270,8 +563,18 @@ class RP_AB(object):
                    'Above_Global_Mean', 'Above_Global_Median',
                    'FD_A_elbow', 'FD_B_elbow', 'FD_A_knee', 'FD_B_knee'
                    ]
+    # RP features with integer values (ranks and binary values)
+    INT_COLUMNS = ['Rank_A_in_B', 'Rank_B_in_A',
+                   'Rank_LocalCutoff_A_elbow', 'Rank_LocalCutoff_B_elbow',
+                   'Rank_LocalCutoff_A_knee', 'Rank_LocalCutoff_B_knee',
+                   'Rank_AB_AboveLocal_A_elbow', 'Rank_BA_AboveLocal_B_elbow',
+                   'Rank_AB_AboveLocal_A_knee', 'Rank_BA_AboveLocal_B_knee',
+                   'Above_Global_Mean', 'Above_Global_Median'
+                   ]
+    # Record layout of RP features for a batch of pairs (without protein IDs), see get_rp_batch
+    DTYPE = np.dtype([(c, np.int32 if is_int else np.float64) for c, is_int in zip(COLUMNS[2:], np.isin(COLUMNS[2:], INT_COLUMNS))])
 
-    def __init__(self, df_predictions: pd.DataFrame, df_labels: pd.DataFrame, proteinA: str, proteinB: str, sens=5, deg=7, on=True):
+    def __init__(self, df_predictions, df_labels, proteinA: str, proteinB: str, sens=5, deg=7, on=True, cache=None):
         # RP global attributes
         # Scores and labels
         
@@ -281,12 +584,27 @@ class RP_AB(object):
         self.online=on
 
         # Basic global stats of scores
-        predictions = df_predictions[df_predictions.columns[-1]]
-        self.global_baseline_mean = np.mean(predictions)
-        self.global_baseline_median = np.median(predictions)
-        self.global_baseline_std = np.std(predictions)
+        if isinstance(df_predictions, ScoreIndex):
+            self.global_baseline_mean = df_predictions.mean
+            self.global_baseline_median = df_predictions.median
+            self.global_baseline_std = df_predictions.std
+        else:
+            predictions = df_predictions[df_predictions.columns[-1]]
+            self.global_baseline_mean = np.mean(predictions)
+            self.global_baseline_median = np.median(predictions)
+            self.global_baseline_std = np.std(predictions)
         
         # RP local attributes
+        if cache is not None:
+            # Reuse one-to-all PPIs from cache
+            self.ProteinA = cache.get(df_predictions, df_labels, proteinA, sens=self.sensitivity, deg=self.degree, on=self.online)
+            self.ProteinB = cache.get(df_predictions, df_labels, proteinB, sens=self.sensitivity, deg=self.degree, on=self.online)
+            self.scores_A = self.ProteinA.scores
+            self.scores_B = self.ProteinB.scores
+            self.labels_A = self.ProteinA.labels.all
+            self.labels_B = self.ProteinB.labels.all
+            return
+
         # Get scores relevant to proteinA and proteinB
         self.scores_A = get_protein_ppi(df_predictions, proteinA)
         self.scores_B = get_protein_ppi(df_predictions, proteinB)
@@ -294,13 +612,13 @@ class RP_AB(object):
         self.labels_A = get_protein_ppi(df_labels, proteinA)
         self.labels_B = get_protein_ppi(df_labels, proteinB)
         
-        # Create attributes for each one-to-all PPIs, ignore warnings from KneeLocator in choosing params
-        with warnings.catch_warnings():
-            warnings.simplefilter("error")
-            self.ProteinA = OneToAll(self.scores_A, self.labels_A, proteinA, sens=self.sensitivity, deg=self.degree, on=self.online)
-            self.ProteinB = OneToAll(self.scores_B, self.labels_B, proteinB, sens=self.sensitivity, deg=self.degree, on=self.online)
+        # Create attributes for each one-to-all PPIs
+        self.ProteinA = OneToAll(self.scores_A, self.labels_A, proteinA, sens=self.sensitivity, deg=self.degree, on=self.online,
+                                 knee_elbow=get_knee_elbow(df_predictions, proteinA, self.sensitivity, self.degree, self.online))
+        self.ProteinB = OneToAll(self.scores_B, self.labels_B, proteinB, sens=self.sensitivity, deg=self.degree, on=self.online,
+                                 knee_elbow=get_knee_elbow(df_predictions, proteinB, self.sensitivity, self.degree, self.online))
     
-    def get_rp_features(self):
+    def get_rp_values(self):
         
         # RP features
         rank_A_in_B = self.ProteinB.get_rank(self.ProteinA.ID)
@@ -355,18 +673,20 @@ class RP_AB(object):
                 score_local_cutoff_B_knee) and not np.isnan((score_A_in_B - score_local_cutoff_B_knee) /
                 score_local_cutoff_B_knee) else 0
             
-        rp_features = pd.DataFrame(np.array([[self.ProteinA.ID, self.ProteinB.ID,
-                       rank_A_in_B, rank_B_in_A, score_A_in_B, score_B_in_A,
-                       narro, arro, norro_A, norro_B, norro,
-                       rank_local_cutoff_A_elbow, rank_local_cutoff_B_elbow,
-                       score_local_cutoff_A_elbow, score_local_cutoff_B_elbow,
-                       rank_local_cutoff_A_knee, rank_local_cutoff_B_knee,
-                       score_local_cutoff_A_knee, score_local_cutoff_B_knee,
-                       rank_AB_above_local_A_elbow, rank_BA_above_local_B_elbow,
-                       rank_AB_above_local_A_knee, rank_BA_above_local_B_knee,
-                       above_global_mean, above_global_median,
-                       fd_A_elbow, fd_B_elbow, fd_A_knee, fd_B_knee,
-                       ]]),
+        # RP feature values in order of COLUMNS (without protein IDs)
+        return [rank_A_in_B, rank_B_in_A, score_A_in_B, score_B_in_A,
+                narro, arro, norro_A, norro_B, norro,
+                rank_local_cutoff_A_elbow, rank_local_cutoff_B_elbow,
+                score_local_cutoff_A_elbow, score_local_cutoff_B_elbow,
+                rank_local_cutoff_A_knee, rank_local_cutoff_B_knee,
+                score_local_cutoff_A_knee, score_local_cutoff_B_knee,
+                rank_AB_above_local_A_elbow, rank_BA_above_local_B_elbow,
+                rank_AB_above_local_A_knee, rank_BA_above_local_B_knee,
+                above_global_mean, above_global_median,
+                fd_A_elbow, fd_B_elbow, fd_A_knee, fd_B_knee]
+    
+    def get_rp_features(self):
+        rp_features = pd.DataFrame(np.array([[self.ProteinA.ID, self.ProteinB.ID] + self.get_rp_values()]),
             columns=self.COLUMNS)
         return rp_features
     
@@ -415,39 +735,414 @@ class RP_AB(object):
         plt.legend(prop={'size': 8})
         plt.show()
 
-def create_RP_dataset(predictions: pd.DataFrame, labels: pd.DataFrame):
+def get_rp_batch(df_predictions, df_labels, proteins_a, proteins_b, sens=5, deg=7, on=True, cache=None, out=None, progress=False):
+    # RP features for many pairs (proteins_a[i], proteins_b[i]) at once as a structured array with RP_AB.DTYPE fields
+    # Fills out if given (preallocated), see RP_AB for other args
+    if out is None:
+        out = np.empty(len(proteins_a), dtype=RP_AB.DTYPE)
+    pairs = zip(proteins_a, proteins_b)
+    if progress:
+        pairs = tqdm.tqdm(pairs, total=len(proteins_a))
+    for i, (proteinA, proteinB) in enumerate(pairs):
+        out[i] = tuple(RP_AB(df_predictions, df_labels, proteinA, proteinB, sens=sens, deg=deg, on=on, cache=cache).get_rp_values())
+    return out
+
+def rp_batch_to_df(values, proteins_a, proteins_b):
+    # DataFrame of RP features from a batch, with typed columns and protein IDs as categorical columns
+    proteins = pd.unique(np.concatenate([proteins_a, proteins_b]))
+    df = pd.DataFrame(values)
+    df.insert(0, 'Protein_A', pd.Categorical(proteins_a, categories=proteins))
+    df.insert(1, 'Protein_B', pd.Categorical(proteins_b, categories=proteins))
+    return df
+
+def create_RP_dataset(predictions: pd.DataFrame, labels: pd.DataFrame, cache_size=1024, labels_index=None):
     start = time.time()
-    df = pd.DataFrame()
-    for i in tqdm.tqdm(range(0, labels.shape[0]), total=labels.shape[0]):
-        rp = RP_AB(predictions, labels, labels.iloc[i][0], labels.iloc[i][1])
-        df: pd.DataFrame = df.append(rp.get_rp_features())
-        df.reset_index(drop=True, inplace=True)
+    # Index predictions (unless already given as ScoreIndex/ScoreStore) and labels (unless given) once instead of re-filtering them for every pair
+    predictions_index = predictions if isinstance(predictions, ScoreIndex) else ScoreIndex(predictions)
+    labels_index = ScoreIndex(labels) if labels_index is None else labels_index
+    cache = OneToAllCache(max_bytes=cache_size*1024**2) if cache_size > 0 else None
+    proteins_a = labels[labels.columns[0]].to_numpy()
+    proteins_b = labels[labels.columns[1]].to_numpy()
+    # Locate knees/elbows of all labelled proteins' one-to-all curves as a batch
+    predictions_index.locate_knees(proteins=pd.unique(np.concatenate([proteins_a, proteins_b])))
+    values = get_rp_batch(predictions_index, labels_index, proteins_a, proteins_b, cache=cache, progress=True)
+    df = rp_batch_to_df(values, proteins_a, proteins_b)
     print('\n\tTime:', round(time.time() - start, 2), 'seconds')
     labels.rename(columns={0: 'Protein_A', 1:'Protein_B', 2:'label'}, inplace=True)
     df = df.merge(labels, on=['Protein_A', 'Protein_B'])
     return df
 
+def create_RP_dataset_experts(predictions, labels, experts, processors=0, cache_size=1024, states=None, hashes=None):
+    # RP features from multiple experts' predictions as one wide table, feature columns prefixed by expert name
+    # predictions is an iterable of each expert's predictions (DataFrame or ScoreIndex), e.g. read one at a time
+    # Labels are indexed once and shared by all experts
+    # states is an optional dict of each expert's state from a previous run (or None) to update from,
+    # replaced in place by the new states, with hashes of each expert's predictions file (see update_RP_dataset)
+    labels_index = ScoreIndex(labels)
+    df_experts = None
+    for expert, df_predictions in zip(experts, predictions):
+        print('\tExpert %s...'%expert)
+        if states is not None:
+            df, states[expert] = update_RP_dataset(df_predictions, labels, states.get(expert), predictions_hash=hashes[expert],
+                                                   processors=processors, cache_size=cache_size, labels_index=labels_index)
+        elif processors > 0:
+            df = create_RP_dataset_parallel(df_predictions, labels, processors=processors, cache_size=cache_size, labels_index=labels_index)
+        else:
+            df = create_RP_dataset(df_predictions, labels, cache_size=cache_size, labels_index=labels_index)
+        df.rename(columns={c: expert + '_' + c for c in RP_AB.COLUMNS[2:]}, inplace=True)
+        if df_experts is None:
+            df_experts = df
+        else:
+            # Same labelled pairs in the same order for each expert
+            df_experts = pd.concat([df_experts.drop(columns=['label']), df[df.columns[2:]]], axis=1)
+    return df_experts
+
+# Incremental updates of an RP dataset from the state of a previous run
+def get_file_hash(filename, chunk_size=2**24):
+    # Content hash of a file (e.g. predictions) read in chunks
+    h = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def save_rp_state(filename, state):
+    np.savez(filename, **state)
+
+def load_rp_state(filename):
+    # State saved by save_rp_state, None if no previous state
+    if not os.path.exists(filename):
+        return None
+    with np.load(filename) as data:
+        return {k: data[k] for k in data.files}
+
+def get_state_rows(state, proteins_a, proteins_b):
+    # Row of each labelled pair in a previous state's RP values, -1 if pair is new
+    rows = {pair: i for i, pair in enumerate(zip(state['protein_a'], state['protein_b']))}
+    return np.array([rows.get((str(a), str(b)), -1) for a, b in zip(proteins_a, proteins_b)], dtype=np.int64)
+
+def is_state_current(state, predictions_hash, labels):
+    # True if predictions are unchanged since state and all labelled pairs are in state, i.e. nothing to compute
+    return (state is not None and str(state['predictions_hash']) == predictions_hash and
+            (get_state_rows(state, labels[labels.columns[0]], labels[labels.columns[1]]) >= 0).all())
+
+def update_RP_dataset(predictions, labels, state=None, predictions_hash='', processors=0, cache_size=1024, labels_index=None):
+    # RP dataset reusing RP values and knees/elbows from the state of a previous run, only rows of new labelled pairs
+    # and pairs with a protein whose one-to-all slice changed (by digest) are computed, see create_RP_dataset
+    # predictions can be None if state is current (see is_state_current), then predictions are not needed
+    # Returns RP dataset and state to save for the next update, which holds predictions_hash (of predictions file),
+    # per-protein digests and knees/elbows and RP values of labelled pairs
+    proteins_a = labels[labels.columns[0]].to_numpy()
+    proteins_b = labels[labels.columns[1]].to_numpy()
+    proteins = pd.unique(np.concatenate([proteins_a, proteins_b]))
+    if predictions is None:
+        print('\tPredictions unchanged, 0/%s labelled pairs to update'%len(proteins_a))
+        values = state['values'][get_state_rows(state, proteins_a, proteins_b)]
+        keep = np.isin(state['proteins'], proteins.astype(str))
+        new_state = {k: state[k][keep] for k in ('proteins', 'digests', 'knee', 'elbow', 'sensitivity')}
+        new_state.update({'predictions_hash': predictions_hash, 'protein_a': proteins_a.astype(str), 'protein_b': proteins_b.astype(str), 'values': values})
+        return update_RP_df(values, labels), new_state
+    
+    predictions_index = predictions if isinstance(predictions, ScoreIndex) else ScoreIndex(predictions)
+    digests = predictions_index.get_digests(proteins)
+    values = np.empty(len(proteins_a), dtype=RP_AB.DTYPE)
+    compute = np.ones(len(proteins_a), dtype=bool)
+    if state is not None:
+        # Reuse knees/elbows of proteins with unchanged slices, and rows of pairs between them
+        previous = dict(zip(state['proteins'], zip(state['digests'], state['knee'], state['elbow'], state['sensitivity'])))
+        unchanged = [p for p, d in zip(proteins, digests) if str(p) in previous and previous[str(p)][0] == d]
+        predictions_index.knees.setdefault((5, 7, True), {}).update({p: previous[str(p)][1:] for p in unchanged})
+        rows = get_state_rows(state, proteins_a, proteins_b)
+        reused = (rows >= 0) & np.isin(proteins_a, unchanged) & np.isin(proteins_b, unchanged)
+        values[reused] = state['values'][rows[reused]]
+        compute = ~reused
+        # Global baseline may have changed with scores of other proteins
+        for column, baseline in (('Above_Global_Mean', predictions_index.mean), ('Above_Global_Median', predictions_index.median)):
+            values[column][reused] = (values['Score_A_in_B'][reused] > baseline) & (values['Score_B_in_A'][reused] > baseline)
+    print('\t%s/%s labelled pairs to update'%(compute.sum(), len(compute)))
+    
+    if compute.any():
+        if processors > 0:
+            df = create_RP_dataset_parallel(predictions_index, labels[compute].copy(), processors=processors, cache_size=cache_size, labels_index=labels_index)
+        else:
+            df = create_RP_dataset(predictions_index, labels[compute].copy(), cache_size=cache_size, labels_index=labels_index)
+        for c in RP_AB.COLUMNS[2:]:
+            values[c][compute] = df[c].to_numpy()
+    
+    knees = [predictions_index.get_knee_elbow(p) for p in proteins]
+    new_state = {'predictions_hash': predictions_hash, 'proteins': proteins.astype(str), 'digests': digests,
+                 'knee': np.array([k[0] for k in knees], dtype=np.int64),
+                 'elbow': np.array([k[1] for k in knees], dtype=np.int64),
+                 'sensitivity': np.array([k[2] for k in knees], dtype=np.int64),
+                 'protein_a': proteins_a.astype(str), 'protein_b': proteins_b.astype(str), 'values': values}
+    return update_RP_df(values, labels), new_state
+
+def update_RP_df(values, labels):
+    # RP dataset of RP values for labelled pairs in order of labels
+    df = rp_batch_to_df(values, labels[labels.columns[0]].to_numpy(), labels[labels.columns[1]].to_numpy())
+    labels.rename(columns={0: 'Protein_A', 1:'Protein_B', 2:'label'}, inplace=True)
+    df = df.merge(labels, on=['Protein_A', 'Protein_B'])
+    return df
+
+# Proteome-wide RP features for every pair in all-to-all predictions
+def get_one_to_all_summary(index, sens=5, deg=7, on=True):
+    # Per-protein attributes of one-to-all curves used by RP features, as OneToAll finds them for each protein of index:
+    # size (number of proteins in curve), knee/elbow ranks and scores, and rank/score of top PPI (for self-interactions)
+    # Knees/elbows are located for all proteins as a batch
+    index.locate_knees(sens=sens, deg=deg, on=on)
+    located = index.knees[(sens, deg, on)]
+    lengths = np.diff(index.offsets)
+    starts = index.offsets[:-1]
+    owner = np.repeat(np.arange(len(index.proteins)), lengths)
+    values = np.asarray(index.values)
+    knee = np.array([located.get(p, (-1, -1, sens))[0] for p in index.proteins], dtype=np.int64)
+    elbow = np.array([located.get(p, (-1, -1, sens))[1] for p in index.proteins], dtype=np.int64)
+    # No knee/elbow possible when all scores are 0, else if none found knee is last rank and elbow is first rank
+    nonzero = np.bincount(owner, weights=(values != 0) & ~np.isnan(values), minlength=len(lengths)) > 0
+    knee = np.where(nonzero & (knee >= 0), knee, lengths - 1)
+    elbow = np.where(nonzero & (elbow >= 0), elbow, 0)
+    # Swap if poor elbow/knee detections
+    knee, elbow = np.maximum(knee, elbow), np.minimum(knee, elbow)
+    has_ppi = lengths > 0
+    # Self-interacting proteins count once in their curve
+    self_ppi = np.zeros(len(lengths), dtype=bool)
+    self_ppi[owner[np.asarray(index.pair_a) == np.asarray(index.pair_b)]] = True
+    top = np.zeros(len(lengths), dtype=np.int64)
+    for c in np.flatnonzero(self_ppi):
+        top[c] = sort_descending(values[starts[c]:starts[c] + lengths[c]])[0]
+    return {'size': lengths + ~self_ppi, 'knee': knee, 'elbow': elbow,
+            'knee_score': np.where(has_ppi, values[np.where(has_ppi, starts + knee, 0)], np.nan),
+            'elbow_score': np.where(has_ppi, values[np.where(has_ppi, starts + elbow, 0)], np.nan),
+            'top': top, 'top_score': np.where(has_ppi, values[np.where(has_ppi, starts + top, 0)], np.nan)}
+
+def get_rp_values_all(summary, code_a, code_b, rank_A_in_B, rank_B_in_A, score_A_in_B, score_B_in_A, mean, median):
+    # RP features (same values as RP_AB.get_rp_values) for arrays of pairs of protein codes, given ranks and scores
+    # of each protein in the other's one-to-all curve, as a structured array with RP_AB.DTYPE fields
+    out = np.empty(len(code_a), dtype=RP_AB.DTYPE)
+    size_A, size_B = summary['size'][code_a], summary['size'][code_b]
+    with np.errstate(all='ignore'):
+        out['Rank_A_in_B'], out['Rank_B_in_A'] = rank_A_in_B, rank_B_in_A
+        out['Score_A_in_B'], out['Score_B_in_A'] = score_A_in_B, score_B_in_A
+        out['NaRRO'] = 1.0 / ((rank_A_in_B + 1) * (rank_B_in_A + 1))
+        out['NoRRO_A'] = 1.0 / ((rank_A_in_B + 1) / size_B)
+        out['NoRRO_B'] = 1.0 / ((rank_B_in_A + 1) / size_A)
+        out['NoRRO'] = out['NoRRO_A'] * out['NoRRO_B']
+        out['ARRO'] = 1.0 / ((rank_A_in_B + 1) / size_B * (rank_B_in_A + 1) / size_A)
+        for cutoff in ('elbow', 'knee'):
+            rank_A, rank_B = summary[cutoff][code_a], summary[cutoff][code_b]
+            cutoff_A, cutoff_B = summary[cutoff + '_score'][code_a], summary[cutoff + '_score'][code_b]
+            out['Rank_LocalCutoff_A_' + cutoff], out['Rank_LocalCutoff_B_' + cutoff] = rank_A, rank_B
+            out['Score_LocalCutoff_A_' + cutoff], out['Score_LocalCutoff_B_' + cutoff] = cutoff_A, cutoff_B
+            out['Rank_AB_AboveLocal_A_' + cutoff] = rank_B_in_A < rank_A
+            out['Rank_BA_AboveLocal_B_' + cutoff] = rank_A_in_B < rank_B
+            # Fold differences, 0 if not finite
+            fd_A = (score_B_in_A - cutoff_A) / cutoff_A
+            fd_B = (score_A_in_B - cutoff_B) / cutoff_B
+            out['FD_A_' + cutoff] = np.where(np.isfinite(fd_A), fd_A, 0.0)
+            out['FD_B_' + cutoff] = np.where(np.isfinite(fd_B), fd_B, 0.0)
+        out['Above_Global_Mean'] = (score_A_in_B > mean) & (score_B_in_A > mean)
+        out['Above_Global_Median'] = (score_A_in_B > median) & (score_B_in_A > median)
+    return out
+
+def create_RP_dataset_all(predictions, filename, sens=5, deg=7, on=True, block_size=2**20, binary=None):
+    # RP features for every pair in all-to-all predictions (e.g. a whole proteome), no labelled pairs needed
+    # Each pair is kept once as ordered in predictions, predictions are expected without redundant pairs (see prep_df)
+    # Ranks are positions in each protein's one-to-all slice of the index (sorted once per protein) and features are
+    # computed for blocks of block_size pairs at once, each block is appended to filename (.tsv) as it is computed
+    # Label column is 0 (unlabelled) for rp_ppi_classifier.py, binary is an optional .npz filename (see save_rp_binary)
+    # Returns number of pairs
+    start = time.time()
+    index = predictions if isinstance(predictions, ScoreIndex) else ScoreIndex(predictions)
+    summary = get_one_to_all_summary(index, sens=sens, deg=deg, on=on)
+    lengths = np.diff(index.offsets)
+    owner = np.repeat(np.arange(len(index.proteins), dtype=np.int64), lengths)
+    rank = np.arange(len(owner)) - index.offsets[owner]
+    pair_a, pair_b = np.asarray(index.pair_a).astype(np.int64), np.asarray(index.pair_b).astype(np.int64)
+    # Each pair A-B is in A's slice (rank of B in A) and B's slice (rank of A in B) unless self-interacting
+    rows = np.flatnonzero(owner == pair_a)
+    mirrors = np.flatnonzero((owner == pair_b) & (pair_a != pair_b))
+    keys = pair_a[mirrors]*len(index.proteins) + pair_b[mirrors]
+    order = np.argsort(keys)
+    mirrors = mirrors[order][np.searchsorted(keys[order], pair_a[rows]*len(index.proteins) + pair_b[rows])
+                             .clip(0, max(len(mirrors) - 1, 0))] if len(mirrors) else np.zeros(len(rows), dtype=np.int64)
+    del keys, order
+    
+    features = None
+    if binary is not None:
+        features = np.lib.format.open_memmap(binary.rsplit('.', 1)[0] + '_features.npy', mode='w+', dtype=RP_AB.DTYPE, shape=(len(rows),))
+    for block_start in tqdm.tqdm(range(0, len(rows), block_size)):
+        block, mirror = rows[block_start:block_start + block_size], mirrors[block_start:block_start + block_size]
+        code_a, code_b = pair_a[block], pair_b[block]
+        score = np.asarray(index.values[block])
+        same = code_a == code_b
+        # Rank of a self-interacting protein in its own curve is that of its top PPI
+        rank_B_in_A = np.where(same, summary['top'][code_a], rank[block])
+        rank_A_in_B = np.where(same, summary['top'][code_a], rank[mirror])
+        score = np.where(same, summary['top_score'][code_a], score)
+        values = get_rp_values_all(summary, code_a, code_b, rank_A_in_B, rank_B_in_A, score, score, index.mean, index.median)
+        if features is not None:
+            features[block_start:block_start + len(block)] = values
+        df = rp_batch_to_df(values, index.proteins[code_a], index.proteins[code_b])
+        df['label'] = 0
+        df.replace(to_replace=np.nan, value=0, inplace=True)
+        df.to_csv(filename, sep='\t', index=False, mode='w' if block_start == 0 else 'a', header=block_start == 0)
+    
+    if features is not None:
+        # Binary RP dataset with all pairs as codes of predictions' proteins
+        features.flush()
+        np.savez(binary, features=features, proteins=np.array(index.proteins, dtype=str),
+                 protein_a=pair_a[rows].astype(np.int32), protein_b=pair_b[rows].astype(np.int32),
+                 label=np.zeros(len(rows), dtype=np.int64))
+        del features
+        os.remove(binary.rsplit('.', 1)[0] + '_features.npy')
+    print('\n\tTime:', round(time.time() - start, 2), 'seconds')
+    return len(rows)
+
 # Running parallel processes to speed up RP feature extraction
-def get_rp(i):
-    return RP_AB(PREDICTIONS, LABELS, LABELS.iloc[i][0], LABELS.iloc[i][1]).get_rp_features()
+def share_arrays(arrays):
+    # Copy dict of numpy arrays into shared memory
+    # Returns blocks (to close and unlink when done) and specs for attach_arrays
+    blocks, specs = [], {}
+    for key, a in arrays.items():
+        block = shared_memory.SharedMemory(create=True, size=max(1, a.nbytes))
+        np.ndarray(a.shape, dtype=a.dtype, buffer=block.buf)[...] = a
+        blocks.append(block)
+        specs[key] = (block.name, a.shape, a.dtype.str)
+    return blocks, specs
+
+def attach_arrays(specs):
+    # Attach to arrays placed in shared memory by share_arrays, blocks must be kept open while arrays are used
+    blocks, arrays = [], {}
+    for key, (name, shape, dtype) in specs.items():
+        block = shared_memory.SharedMemory(name=name)
+        blocks.append(block)
+        arrays[key] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+    return blocks, arrays
 
-def create_RP_dataset_parallel(predictions, labels, processors=round(os.cpu_count())):
+def init_rp_worker(predictions_class, predictions_specs, predictions_attributes, labels_specs, labels_attributes, pairs_specs, cache_size):
+    # Attach each worker to indices and labelled pairs in shared memory, each worker keeps its own one-to-all cache
+    # Only relies on arguments (not globals inherited by fork) so works with any start method
+    global WORKER
+    predictions_blocks, predictions_arrays = attach_arrays(predictions_specs)
+    labels_blocks, labels_arrays = attach_arrays(labels_specs)
+    pairs_blocks, pairs = attach_arrays(pairs_specs)
+    WORKER = {'blocks': predictions_blocks + labels_blocks + pairs_blocks,
+              'predictions': predictions_class.attach(predictions_arrays, predictions_attributes),
+              'labels': ScoreIndex.attach(labels_arrays, labels_attributes),
+              'pairs': pairs,
+              'cache': OneToAllCache(max_bytes=cache_size*1024**2) if cache_size > 0 else None}
+
+def get_rp_block(unit):
+    # RP feature values for a work unit (start, stop) of labelled pairs in protein-grouped order
+    start, stop = unit
+    predictions, labels, pairs, cache = WORKER['predictions'], WORKER['labels'], WORKER['pairs'], WORKER['cache']
+    rows = pairs['order'][start:stop]
+    block = get_rp_batch(predictions, labels, predictions.proteins[pairs['protein_a'][rows]], predictions.proteins[pairs['protein_b'][rows]], cache=cache)
+    return unit, block
+
+def create_RP_dataset_parallel(predictions, labels, processors=round(os.cpu_count()), cache_size=1024, start_method=None, labels_index=None):
     start = time.time()
+    predictions_index = predictions if isinstance(predictions, ScoreIndex) else ScoreIndex(predictions)
+    labels_index = ScoreIndex(labels) if labels_index is None else labels_index
+    predictions_index.locate_knees(proteins=pd.unique(np.concatenate([labels[labels.columns[0]].to_numpy(), labels[labels.columns[1]].to_numpy()])))
 
-    with multiprocessing.Pool(processors) as pool:
-        df = list(tqdm.tqdm(pool.imap(get_rp, range(0, labels.shape[0])), total=labels.shape[0]))
+    # Labelled pairs as protein codes, grouped by protein so each worker's one-to-all cache is reused within a work unit
+    protein_a = np.array([predictions_index.codes[p] for p in labels[labels.columns[0]]], dtype=np.int32)
+    protein_b = np.array([predictions_index.codes[p] for p in labels[labels.columns[1]]], dtype=np.int32)
+    order = np.lexsort((protein_b, protein_a))
+    chunksize = max(1, min(1024, len(order) // (processors*8)))
+    units = [(i, min(i + chunksize, len(order))) for i in range(0, len(order), chunksize)]
 
-    df = pd.concat(df)
-    df.reset_index(drop=True, inplace=True)
-    LABELS.rename(columns={0: 'Protein_A', 1:'Protein_B', 2:'label'}, inplace=True)
-    df = df.merge(LABELS, on=['Protein_A', 'Protein_B'])
+    # Place numeric arrays in shared memory, workers attach to them instead of receiving copies
+    predictions_arrays, predictions_attributes = predictions_index.share()
+    labels_arrays, labels_attributes = labels_index.share()
+    blocks = []
+    try:
+        shared, predictions_specs = share_arrays(predictions_arrays)
+        blocks += shared
+        shared, labels_specs = share_arrays(labels_arrays)
+        blocks += shared
+        shared, pairs_specs = share_arrays({'protein_a': protein_a, 'protein_b': protein_b, 'order': order})
+        blocks += shared
+
+        # Memory bound for caching is split among processes
+        values = np.empty(len(order), dtype=RP_AB.DTYPE)
+        context = multiprocessing.get_context(start_method)
+        with context.Pool(processors, initializer=init_rp_worker,
+                          initargs=(type(predictions_index), predictions_specs, predictions_attributes, labels_specs, labels_attributes, pairs_specs, cache_size/processors)) as pool:
+            for (unit_start, unit_stop), block in tqdm.tqdm(pool.imap_unordered(get_rp_block, units), total=len(units)):
+                values[order[unit_start:unit_stop]] = block
+            pool.close()
+            pool.join()
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    df = rp_batch_to_df(values, labels[labels.columns[0]].to_numpy(), labels[labels.columns[1]].to_numpy())
+    labels.rename(columns={0: 'Protein_A', 1:'Protein_B', 2:'label'}, inplace=True)
+    df = df.merge(labels, on=['Protein_A', 'Protein_B'])
     print('\n\tTime:', round(time.time() - start, 2), 'seconds')
-    pool.close()
-    pool.join()
     return df
 
-def get_protein_ppi(df_in: pd.DataFrame, proteinID: str):
+def sort_descending(values):
+    # Indices sorting values descending with NaNs last, same order as DataFrame.sort_values(ascending=False)
+    mask = pd.isna(values)
+    idx = np.arange(len(values))
+    non_nans = values[~mask][::-1]
+    non_nan_idx = idx[~mask][::-1]
+    indexer = non_nan_idx[non_nans.argsort(kind='quicksort')][::-1]
+    return np.concatenate([indexer, idx[mask]])
+
+def chunked_stats(scores, chunk_size):
+    # Mean, standard deviation and median of scores (e.g. memory-mapped) reading chunk_size values at a time
+    n = len(scores)
+    if n == 0:
+        return np.nan, np.nan, np.nan
+    chunks = lambda: (np.asarray(scores[i:i + chunk_size]) for i in range(0, n, chunk_size))
+    mean = sum(np.sum(c) for c in chunks()) / n
+    std = np.sqrt(sum(np.sum((c - mean)**2) for c in chunks()) / n)
+    if np.isnan(mean):
+        return mean, std, np.nan
+    # Median is average of middle value(s)
+    middle = [select_kth(chunks, k, chunk_size) for k in sorted({(n - 1)//2, n//2})]
+    return mean, std, np.mean(middle)
+
+def select_kth(chunks, k, chunk_size, bins=1024):
+    # k-th smallest (from 0) of values read by chunks(), narrowing a range [low, high] of candidates
+    # by histogram until they fit in one chunk
+    low, high, below = -np.inf, np.inf, 0
+    while True:
+        count, lowest, highest = 0, np.inf, -np.inf
+        for c in chunks():
+            c = c[(c >= low) & (c <= high)]
+            if len(c):
+                count += len(c)
+                lowest, highest = min(lowest, c.min()), max(highest, c.max())
+        if lowest == highest:
+            return lowest
+        if count <= chunk_size:
+            candidates = np.concatenate([c[(c >= low) & (c <= high)] for c in chunks()])
+            return np.partition(candidates, k - below)[k - below]
+        edges = np.linspace(lowest, highest, bins + 1)
+        counts = np.zeros(bins, dtype=np.int64)
+        for c in chunks():
+            c = c[(c >= low) & (c <= high)]
+            counts += np.bincount(np.clip(np.searchsorted(edges, c, side='right') - 1, 0, bins - 1), minlength=bins)
+        i = np.searchsorted(np.cumsum(counts), k - below + 1)
+        below += counts[:i].sum()
+        low, high = edges[i], highest if i == bins - 1 else np.nextafter(edges[i + 1], -np.inf)
+
+def get_knee_elbow(df_in, proteinID: str, sens=5, deg=7, on=True):
+    # Knee/elbow of proteinID's one-to-all curve if already located in a ScoreIndex, otherwise None
+    if isinstance(df_in, ScoreIndex):
+        return df_in.get_knee_elbow(proteinID, sens=sens, deg=deg, on=on)
+    return None
+
+def get_protein_ppi(df_in, proteinID: str):
     # Return df only for PPIs containing proteinID and sort descending
+    if isinstance(df_in, ScoreIndex):
+        return df_in.get_ppi(proteinID)
     df = (df_in[(df_in[df_in.columns[0]] == proteinID) |
                 (df_in[df_in.columns[1]] == proteinID)]).copy()
     df.sort_values(by=df.columns[-1], ascending=False, inplace=True)
@@ -455,32 +1150,11 @@ def get_protein_ppi(df_in: pd.DataFrame, proteinID: str):
 
     return df
 
-def get_matching_pairs(df_1: pd.DataFrame, df_2: pd.DataFrame):
-    # Get matches using PPI ordering of smaller df
-    if df_1.shape > df_2.shape:
-        df_test = df_1.copy()
-        df_train = df_2.copy()
-    else:
-        df_test = df_2.copy()
-        df_train = df_1.copy()
-    
-    # Include all PPIs where A-B is B-A
-    df_test_rev = df_test.copy()
-    df_test_rev[[df_test_rev.columns[0], df_test_rev.columns[1]]] = df_test_rev[[df_test_rev.columns[1], df_test_rev.columns[0]]]
-    df = df_test.append(df_test_rev)
-    df = df.drop_duplicates(subset=[df.columns[0], df.columns[1]])
-    df.reset_index(drop=True, inplace=True)
-    
-    # Merge to match all PPIs found between df
-    matches = df_train.merge(df, on=[df.columns[0], df.columns[1]]).drop_duplicates(subset=[df.columns[0], df.columns[1]])
-    matches.reset_index(drop=True, inplace=True)
-
-    
-    # Returns as <ProteinA> <ProteinB> <label> <score>
-    return matches
-
 def labels_verified(labels, predictions):
-    matches = get_matching_pairs(labels, predictions)
+    if isinstance(predictions, ScoreIndex):
+        matches = labels[[predictions.has_pair(a, b) for a, b in labels[labels.columns[:2]].values]]
+    else:
+        matches = get_matching_pairs(labels, predictions)
     if labels.shape[0] != matches.shape[0]:
         print('%s/%s labelled pairs found in predictions...unable to extract RP features for given labels.'%(matches.shape[0], labels.shape[0]))
         unmatched = pd.concat([matches, labels]).drop_duplicates(subset=[labels.columns[0], labels.columns[1]], keep=False)
@@ -518,38 +1192,132 @@ def remove_redundant_pairs(df_ppi):
     
     return df_out
 
+def save_rp_binary(df_rp, filename):
+    # Save RP dataset as typed numeric arrays (.npz), protein IDs stored once and PPIs as codes
+    # Features are all columns between protein IDs and label (RP_AB.DTYPE fields for each expert)
+    codes_a, proteins = pd.factorize(pd.concat([df_rp['Protein_A'].astype(str), df_rp['Protein_B'].astype(str)], ignore_index=True))
+    features = np.empty(df_rp.shape[0], dtype=[(c, df_rp[c].dtype) for c in df_rp.columns[2:-1]])
+    for c in df_rp.columns[2:-1]:
+        features[c] = df_rp[c].to_numpy()
+    np.savez(filename, features=features, proteins=np.array(proteins, dtype=str),
+             protein_a=codes_a[:df_rp.shape[0]].astype(np.int32), protein_b=codes_a[df_rp.shape[0]:].astype(np.int32),
+             label=df_rp[df_rp.columns[-1]].to_numpy())
+
 def prep_df(df_in):
     df = remove_redundant_pairs(df_in)
     df = df[df.columns[:3]]
     return df
+
+def read_predictions(filename, stream=False, path='', memory=2048, proteins=None):
+    # Predictions as a DataFrame, or streamed into a ScoreStore in path (see -s),
+    # indexed with protein code table proteins if given
+    if is_score_matrix(filename):
+        # Pairs of score matrix (see score_matrix.py) are already without redundant pairs
+        predictions = ScoreMatrix(filename).to_df()
+        return predictions if proteins is None else ScoreIndex(predictions, proteins=proteins)
+    if stream:
+        # Read predictions in chunks into memory-mapped per-protein slices
+        return ScoreStore(filename, path + 'STORE_' + filename.split('/')[-1].split('.')[0] + '/', memory=memory, proteins=proteins)
+    predictions = pd.read_csv(filename, delim_whitespace=True, header=None)
+    predictions = prep_df(predictions)
+    return predictions if proteins is None else ScoreIndex(predictions, proteins=proteins)
+
+def read_experts(filenames, labels, stream=False, path='', memory=2048, skip=()):
+    # Read and verify each expert's predictions only when needed, indexed with one protein code table shared by all
+    # Files in skip are not read (None instead), e.g. unchanged since previous run
+    proteins = pd.Index(pd.unique(pd.concat([labels[labels.columns[0]], labels[labels.columns[1]]], ignore_index=True)))
+    for filename in filenames:
+        if filename in skip:
+            yield None
+            continue
+        print('Reading predictions %s...'%filename.split('/')[-1])
+        predictions = read_predictions(filename, stream=stream, path=path, memory=memory, proteins=proteins)
+        if not labels_verified(labels, predictions):
+            raise ValueError('Labels missing from predictions %s'%filename)
+        proteins = predictions.proteins
+        yield predictions
     
 if __name__ == '__main__':
     
     if not os.path.exists(args.results):
         os.makedirs(args.results)
     start = time.time()
+    if args.all:
+        # Proteome-wide RP features for every pair of each predictions file, no labels needed
+        for filename in args.predictions:
+            print('Reading predictions %s...'%filename.split('/')[-1])
+            predictions = read_predictions(filename, stream=args.stream, path=args.results, memory=args.memory)
+            print('Creating RP features dataset for all pairs...')
+            save_name = 'RP_ALL_' + filename.split('/')[-1].rsplit('.', 1)[0]
+            n = create_RP_dataset_all(predictions, args.results + save_name + '.tsv',
+                                      binary=args.results + save_name + '.npz' if args.binary else None)
+            print('\t%s RP features extracted for %s PPIs'%(len(RP_AB.COLUMNS) - 2, n))
+        print('Saved and done.')
+        print('\n\tTime:', round(time.time() - start, 2), 'seconds')
+        exit()
+    
     print('Reading labels...')
     labels = pd.read_csv(args.labels, delim_whitespace=True, header=None)
     labels = prep_df(labels)
     
-    print('Reading predictions...')
-    predictions = pd.read_csv(args.predictions, delim_whitespace=True, header=None)
-    predictions = prep_df(predictions)
+    if len(args.predictions) > 1:
+        # Multiple experts in a single pass, each expert's predictions read in turn
+        experts = args.experts if args.experts else [f.split('/')[-1].split('.')[0] for f in args.predictions]
+        if len(experts) != len(args.predictions):
+            raise ValueError('Number of experts (%s) does not match number of prediction files (%s)'%(len(experts), len(args.predictions)))
+        states, hashes, skip = None, None, []
+        if args.update:
+            # States of previous run for each expert, predictions unchanged since then are not read
+            states = {e: load_rp_state(args.results + 'RP_' + e + '_' + args.labels.split('/')[-1].rsplit('.', 1)[0] + '.state.npz') for e in experts}
+            hashes = {e: get_file_hash(f) for e, f in zip(experts, args.predictions)}
+            skip = [f for e, f in zip(experts, args.predictions) if is_state_current(states[e], hashes[e], labels)]
+        print('Creating RP features dataset for %s...'%', '.join(experts))
+        predictions = read_experts(args.predictions, labels, stream=args.stream, path=args.results, memory=args.memory, skip=skip)
+        processors = round(os.cpu_count()*args.multiprocessing) if args.multiprocessing > 0 else 0
+        rp = create_RP_dataset_experts(predictions, labels, experts, processors=processors, cache_size=args.cache, states=states, hashes=hashes)
+        print('\t%s RP features extracted for %s PPIs'%(rp.shape[1] - 3, rp.shape[0]))
+        save_name = 'RP_' + '_'.join(experts) + '_' + args.labels.split('/')[-1]
+        if args.update:
+            for e in experts:
+                save_rp_state(args.results + 'RP_' + e + '_' + args.labels.split('/')[-1].rsplit('.', 1)[0] + '.state.npz', states[e])
+        rp.replace(to_replace=np.nan, value=0, inplace=True)
+        rp.to_csv(args.results + save_name, sep='\t', index=False)
+        if args.binary:
+            save_rp_binary(rp, args.results + save_name.rsplit('.', 1)[0] + '.npz')
+        print('Saved and done.')
+        print('\n\tTime:', round(time.time() - start, 2), 'seconds')
+        exit()
+    
+    save_name = 'RP_' + args.labels.split('/')[-1]
+    state_file = args.results + save_name.rsplit('.', 1)[0] + '.state.npz'
+    state, predictions_hash = None, ''
+    if args.update:
+        # State of previous run, predictions unchanged since then are not read
+        state = load_rp_state(state_file)
+        predictions_hash = get_file_hash(args.predictions[0])
+    if args.update and is_state_current(state, predictions_hash, labels):
+        predictions = None
+    else:
+        print('Reading predictions...')
+        predictions = read_predictions(args.predictions[0], stream=args.stream, path=args.results, memory=args.memory)
     
     print('Verifying input data...')
-    if labels_verified(labels, predictions):
+    if predictions is None or labels_verified(labels, predictions):
         print('Creating RP features dataset...')
-        if args.multiprocessing > 0:
-            print('\tExecuting parallel...%s cpus out of %s'%(round(os.cpu_count()*args.multiprocessing), os.cpu_count()))
-            PREDICTIONS = predictions.copy()
-            LABELS = labels.copy()
-            rp = create_RP_dataset_parallel(PREDICTIONS, LABELS, processors=round(os.cpu_count()*args.multiprocessing))
+        processors = round(os.cpu_count()*args.multiprocessing) if args.multiprocessing > 0 else 0
+        if args.update:
+            rp, state = update_RP_dataset(predictions, labels, state, predictions_hash=predictions_hash, processors=processors, cache_size=args.cache)
+            save_rp_state(state_file, state)
+        elif processors > 0:
+            print('\tExecuting parallel...%s cpus out of %s'%(processors, os.cpu_count()))
+            rp = create_RP_dataset_parallel(predictions, labels, processors=processors, cache_size=args.cache)
         else:
-            rp = create_RP_dataset(predictions, labels)
+            rp = create_RP_dataset(predictions, labels, cache_size=args.cache)
         print('\t%s RP features extracted for %s PPIs'%(rp.shape[1] - 3, rp.shape[0]))
-        save_name = 'RP_' + args.labels.split('/')[-1]
         rp.replace(to_replace=np.nan, value=0, inplace=True)
         rp.to_csv(args.results + save_name, sep='\t', index=False)
+        if args.binary:
+            save_rp_binary(rp, args.results + save_name.rsplit('.', 1)[0] + '.npz')
         print('Saved and done.')
     else:
         print('Labels missing from predictions')
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Description:
+    Feature store of RP datasets (extract_rp_features.py) from multiple experts for CME in rp_ppi_classifier.py.
+
+    Each expert's block of RP features is aligned to the others by canonical integer pair codes
+    (protein codes from one table shared by all files, A-B and B-A are the same pair) with one sort-merge,
+    instead of repeatedly merging whole DataFrames on protein ID strings.
+    Files are opened lazily: only PPIs are read when a file is first needed, and only the feature columns
+    of the experts requested, so a CME without an expert (e.g. ablation without SPRINT) never reads its features.
+
+    Files can be RP datasets of one expert (.tsv or .npz), named by the part of their filename not shared with
+    the other files (e.g. RP_SPRINT_biogrid_Ecoli_interactions.tsv is expert SPRINT), or wide datasets of multiple experts (extract_rp_features.py -e)
+    with feature columns prefixed by expert name (e.g. SPRINT_Rank_A_in_B).
+"""
+
+import os, sys
+import numpy as np
+import pandas as pd
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from ppi_pairs import pack_pairs
+
+# First RP feature of each expert's block, used to find expert prefixes of wide datasets
+FIRST_FEATURE = 'Rank_A_in_B'
+
+
+def get_expert_names(filenames):
+    # Expert name of each single expert RP dataset from its filename, parts of filenames shared by all files are removed
+    # (e.g. RP_SPRINT_biogrid_Ecoli_interactions.tsv and RP_PIPR_biogrid_Ecoli_interactions.tsv are SPRINT and PIPR),
+    # end of filename if only one file or nothing is left
+    parts = {f: f.split('/')[-1].split('.')[0].split('_') for f in filenames}
+    if len(filenames) == 1:
+        return {f: p[-1] for f, p in parts.items()}
+    shared = set.intersection(*[set(p) for p in parts.values()])
+    return {f: '_'.join([x for x in p if x not in shared]) or p[-1] for f, p in parts.items()}
+
+
+class FeatureStore(object):
+    # RP feature blocks of experts from RP dataset files, aligned by canonical pair codes
+    def __init__(self, filenames):
+        self.codes = {}
+        self.files = {}
+        # Expert name: (filename, feature columns in file)
+        self.experts = {}
+        names = get_expert_names(filenames)
+        for filename in filenames:
+            for expert, columns in self.get_file_experts(filename, names[filename]).items():
+                if expert in self.experts:
+                    raise ValueError('Expert %s found in %s and %s'%(expert, self.experts[expert][0], filename))
+                self.experts[expert] = (filename, columns)
+
+    def get_file_experts(self, filename, name):
+        # Feature columns of each expert in an RP dataset file (header only), name is expert of a single expert's dataset
+        if filename.endswith('.npz'):
+            with np.load(filename) as data:
+                columns = list(data['features'].dtype.names)
+        else:
+            columns = list(pd.read_csv(filename, delim_whitespace=True, nrows=0).columns[2:-1])
+        prefixes = [c[:-len(FIRST_FEATURE)] for c in columns if c.endswith('_' + FIRST_FEATURE)]
+        if not prefixes:
+            return {name: columns}
+        experts = {p[:-1]: [] for p in prefixes}
+        for c in columns:
+            # Longest matching prefix, in case an expert's name starts with another expert's name
+            expert = max((p for p in prefixes if c.startswith(p)), key=len, default=None)
+            if expert is None:
+                raise ValueError('Feature %s of %s not prefixed by an expert'%(c, filename))
+            experts[expert[:-1]].append(c)
+        return experts
+
+    def get_pair_codes(self, proteins_a, proteins_b):
+        # Canonical codes of pairs, protein codes shared by all files with the lower code first
+        for p in pd.unique(np.concatenate([proteins_a, proteins_b])):
+            if p not in self.codes:
+                self.codes[p] = len(self.codes)
+        codes_a = pd.Series(proteins_a).map(self.codes).to_numpy(dtype=np.uint64)
+        codes_b = pd.Series(proteins_b).map(self.codes).to_numpy(dtype=np.uint64)
+        return pack_pairs(codes_a, codes_b, canonical=True)
+
+    def get_file(self, filename):
+        # PPIs, labels and pair codes of a file, read once when first needed
+        if filename not in self.files:
+            if filename.endswith('.npz'):
+                with np.load(filename) as data:
+                    proteins = data['proteins']
+                    proteins_a, proteins_b = proteins[data['protein_a']], proteins[data['protein_b']]
+                    labels = data['label']
+            else:
+                header = pd.read_csv(filename, delim_whitespace=True, nrows=0).columns
+                df = pd.read_csv(filename, delim_whitespace=True, usecols=[header[0], header[1], header[-1]], dtype={header[0]: str, header[1]: str})
+                proteins_a, proteins_b, labels = df[header[0]].to_numpy(), df[header[1]].to_numpy(), df[header[-1]].to_numpy()
+            self.files[filename] = {'proteins_a': proteins_a, 'proteins_b': proteins_b, 'labels': labels,
+                                    'keys': self.get_pair_codes(proteins_a, proteins_b)}
+        return self.files[filename]
+
+    def get_features(self, filename, experts, rows):
+        # Feature blocks of experts in a file at rows, columns prefixed by expert name and missing values as 0
+        # Only the columns of the experts given are read
+        columns = [c for e in experts for c in self.experts[e][1]]
+        if filename.endswith('.npz'):
+            with np.load(filename) as data:
+                features = data['features'][rows]
+            df = pd.DataFrame({c: features[c] for c in columns})
+        else:
+            df = pd.read_csv(filename, delim_whitespace=True, usecols=columns)[columns].iloc[rows].reset_index(drop=True)
+        df.replace(to_replace=np.nan, value=0, inplace=True)
+        names = {c: c if c.startswith(e + '_') else e + '_' + c for e in experts for c in self.experts[e][1]}
+        return {e: df[self.experts[e][1]].rename(columns=names) for e in experts}
+
+    def get_dataset(self, experts=None):
+        # CME dataset <Protein_A> <Protein_B> <each expert's RP features> <label> of PPIs found for all experts
+        # (default all experts), PPIs in order of first expert's file and labels of last expert's file
+        experts = list(self.experts) if experts is None else list(experts)
+        missing = [e for e in experts if e not in self.experts]
+        if missing:
+            raise ValueError('Experts %s not found in RP datasets (found %s)'%(missing, list(self.experts)))
+        filenames = list(dict.fromkeys(self.experts[e][0] for e in experts))
+        first = self.get_file(filenames[0])
+
+        # Sort-merge: row of each of first file's pairs in each file, kept where pair is found in all files
+        rows = {filenames[0]: np.arange(len(first['keys']))}
+        found = np.ones(len(first['keys']), dtype=bool)
+        for filename in filenames[1:]:
+            keys = self.get_file(filename)['keys']
+            order = np.argsort(keys, kind='stable')
+            position = np.minimum(np.searchsorted(keys, first['keys'], sorter=order), len(keys) - 1)
+            rows[filename] = order[position] if len(keys) else np.zeros(len(position), dtype=np.int64)
+            found &= (keys[rows[filename]] == first['keys']) if len(keys) else False
+        rows = {filename: r[found] for filename, r in rows.items()}
+
+        df = pd.DataFrame({'Protein_A': first['proteins_a'][found], 'Protein_B': first['proteins_b'][found]})
+        blocks = {}
+        for filename in filenames:
+            blocks.update(self.get_features(filename, [e for e in experts if self.experts[e][0] == filename], rows[filename]))
+        df = pd.concat([df] + [blocks[e] for e in experts], axis=1)
+        df['label'] = self.get_file(filenames[-1])['labels'][rows[filenames[-1]]]
+        return df
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Description:
+    Vectorized knee/elbow detection for one-to-all PPI curves used by extract_rp_features.py.
+
+    Reproduces the sensitivity search OneToAll previously ran with kneed 0.7.0, i.e.
+    KneeLocator(x, y, interp_method='polynomial', direction='decreasing', online=on, S=s, polynomial_degree=deg)
+    for curve='concave' (knee) and curve='convex' (elbow), retrying S = sens, sens-1, ..., 0 until a knee is found,
+    where any warning raised by KneeLocator (poorly conditioned fit, flat curve, no maxima, no knee) ends the search.
+
+    Instead of up to (sens + 1) * 2 KneeLocator objects per curve, each curve is fit once and the fit is shared
+    by the concave and convex searches, all sensitivities are evaluated in one pass, and curves are processed
+    in batches as a padded 2-D array (rows sorted by length to keep padding small).
+    Results match kneed exactly, kneed is only needed to check against as the reference implementation.
+"""
+
+import numpy as np
+
+
+class Knee(object):
+    # Knee/elbow of a one-to-all curve, with the kneed.KneeLocator attributes used for RP features and plotting
+    # y is the curve of scores sorted descending, knee is the rank (index) of the knee/elbow
+    def __init__(self, y, knee):
+        self.x = np.arange(len(y))
+        self.y = np.array(y)
+        self.knee = knee
+        self.knee_y = self.y[knee]
+
+    @property
+    def elbow(self):
+        return self.knee
+
+    @property
+    def elbow_y(self):
+        return self.knee_y
+
+
+# Scaled Vandermonde matrix and threshold offset only depend on curve length, reused across curves
+_VANDER = {}
+_OFFSET = {}
+
+def get_vander(n, deg):
+    # Same design matrix and column scaling as np.polyfit(range(n), y, deg)
+    if (n, deg) not in _VANDER:
+        lhs = np.vander(np.arange(n) + 0.0, deg + 1)
+        scale = np.sqrt((lhs*lhs).sum(axis=0))
+        lhs /= scale
+        _VANDER[(n, deg)] = (lhs, scale, n*np.finfo(lhs.dtype).eps)
+    return _VANDER[(n, deg)]
+
+def get_offset(n):
+    # Mean spacing of normalized ranks, threshold of a local maximum is its difference minus S * offset
+    if n not in _OFFSET:
+        x = np.arange(n)
+        x_normalized = (x - min(x)) / (max(x) - min(x))
+        _OFFSET[n] = np.abs(np.diff(x_normalized).mean())
+    return _OFFSET[n]
+
+def fit_curves(curves, lengths, deg=7):
+    # Least-squares polynomial fit of each row (as np.polyfit) evaluated at its ranks (as np.poly1d)
+    # Returns fitted curves and mask of rows where the fit is poorly conditioned (rank deficient)
+    m, width = curves.shape
+    coeffs = np.zeros((m, deg + 1))
+    poor = np.zeros(m, dtype=bool)
+    for r in range(m):
+        n = lengths[r]
+        y = curves[r, :n]
+        if n == 0 or not np.isfinite(y).all():
+            poor[r] = True
+            continue
+        lhs, scale, rcond = get_vander(n, deg)
+        c, _, rank, _ = np.linalg.lstsq(lhs, y, rcond)
+        coeffs[r] = c/scale
+        poor[r] = rank != deg + 1
+    # Horner's method for all rows at once
+    x = np.arange(width)
+    fitted = np.zeros((m, width))
+    for k in range(deg + 1):
+        fitted = fitted * x + coeffs[:, k:k + 1]
+    return fitted, poor
+
+def shift(a, index, lengths):
+    # Values of each row at index, clipped to the row's length (as scipy.signal.argrelextrema mode='clip')
+    return np.take_along_axis(a, np.clip(index, 0, lengths[:, None] - 1), axis=1)
+
+def search_knees(difference, valid, lengths, offsets, sensitivities, concave=True, online=True):
+    # Knee of each row's difference curve for each sensitivity, following kneed 0.7.0 KneeLocator.find_knee
+    # Returns knee index (m x len(sensitivities)) and mask of rows/sensitivities where no knee was found
+    m, width = difference.shape
+    idx = np.broadcast_to(np.arange(width), (m, width))
+    after = shift(difference, idx + 1, lengths)
+    before = shift(difference, idx - 1, lengths)
+    maxima = (difference >= after) & (difference >= before) & valid
+    minima = (difference <= after) & (difference <= before) & valid
+    has_maxima = maxima.any(axis=1)
+
+    # Threshold at each point is set by the last local maximum (difference - S * offset) or last local minimum (0.0)
+    last_max = np.maximum.accumulate(np.where(maxima, idx, -1), axis=1)
+    last_min = np.maximum.accumulate(np.where(minima, idx, -1), axis=1)
+    at_minimum = last_min >= last_max
+    difference_max = shift(difference, last_max, lengths)
+    # Traverse from first local maximum until the last point
+    traversed = (idx >= np.argmax(maxima, axis=1)[:, None]) & (idx < lengths[:, None] - 1) & has_maxima[:, None]
+
+    knees = np.zeros((m, len(sensitivities)), dtype=np.int64)
+    missing = np.zeros((m, len(sensitivities)), dtype=bool)
+    for j, s in enumerate(sensitivities):
+        threshold = np.where(at_minimum, 0.0, difference_max - s*offsets[:, None])
+        detected = traversed & (after < threshold)
+        found = detected.any(axis=1)
+        if online:
+            # Knees are corrected, last one found is kept
+            point = width - 1 - np.argmax(detected[:, ::-1], axis=1)
+        else:
+            point = np.argmax(detected, axis=1)
+        threshold_index = last_max[np.arange(m), point]
+        knees[:, j] = lengths - 1 - threshold_index if concave else threshold_index
+        missing[:, j] = ~found
+    return knees, missing
+
+def choose_sensitivity(knees, missing, failed, sensitivities):
+    # Lower sensitivity until a nonzero knee is found, a failure keeps the last (zero) knee found if any
+    # Returns knee (-1 if none) and sensitivity it was found at (-1 if not found)
+    m = knees.shape[0]
+    knee = np.full(m, -1, dtype=np.int64)
+    found_at = np.full(m, -1, dtype=np.int64)
+    for r in np.flatnonzero(~failed):
+        for j, s in enumerate(sensitivities):
+            if missing[r, j]:
+                break
+            knee[r] = knees[r, j]
+            if knees[r, j]:
+                found_at[r] = s
+                break
+    return knee, found_at
+
+def locate_batch(curves, lengths, sens=5, deg=7, online=True):
+    # Knee and elbow of each row of padded 2-D curves, each row only valid up to its length
+    m, width = curves.shape
+    sensitivities = list(range(sens, -1, -1))
+    idx = np.arange(width)
+    valid = idx < lengths[:, None]
+    fitted, poor = fit_curves(curves, lengths, deg=deg)
+
+    with np.errstate(all='ignore'):
+        # Normalize ranks and fitted scores to [0, 1], flat fits can't be normalized
+        lowest = np.where(valid, fitted, np.inf).min(axis=1)
+        highest = np.where(valid, fitted, -np.inf).max(axis=1)
+        flat = ~(highest - lowest != 0) | ~np.isfinite(highest - lowest)
+        y_normalized = (fitted - lowest[:, None]) / (highest - lowest)[:, None]
+        x_normalized = idx / (lengths[:, None] - 1)
+        offsets = np.array([get_offset(n) if n > 1 else np.nan for n in lengths])
+
+        # Difference curves for knee (concave, flipped) and elbow (convex, inverted)
+        flipped = shift(y_normalized, lengths[:, None] - 1 - idx, lengths)
+        inverted = np.where(valid, y_normalized, -np.inf).max(axis=1)[:, None] - y_normalized
+        concave = np.where(valid, flipped - x_normalized, np.nan)
+        convex = np.where(valid, inverted - x_normalized, np.nan)
+    failed = poor | flat
+
+    knees, missing = search_knees(concave, valid, lengths, offsets, sensitivities, concave=True, online=online)
+    knee, knee_sensitivity = choose_sensitivity(knees, missing, failed, sensitivities)
+    elbows, missing = search_knees(convex, valid, lengths, offsets, sensitivities, concave=False, online=online)
+    elbow, elbow_sensitivity = choose_sensitivity(elbows, missing, failed, sensitivities)
+
+    # Sensitivity kept is from the last search where a knee was found
+    sensitivity = np.where(elbow_sensitivity >= 0, elbow_sensitivity, np.where(knee_sensitivity >= 0, knee_sensitivity, sens))
+    return knee, elbow, sensitivity
+
+def locate_knees(curves, sens=5, deg=7, online=True, batch_size=2**21):
+    # Knee and elbow of each curve in a list of 1-D arrays of scores sorted descending
+    # Curves are batched by similar length so that each padded batch holds at most ~batch_size values
+    # Returns arrays of knee (-1 if no knee), elbow (-1 if no elbow) and sensitivity for each curve
+    lengths = np.array([len(c) for c in curves], dtype=np.int64)
+    knee = np.full(len(curves), -1, dtype=np.int64)
+    elbow = np.full(len(curves), -1, dtype=np.int64)
+    sensitivity = np.full(len(curves), sens, dtype=np.int64)
+    # Curves shorter than deg + 1 can't be fit without being poorly conditioned
+    order = np.flatnonzero(lengths > deg)
+    order = order[np.argsort(lengths[order], kind='stable')]
+    start = 0
+    while start < len(order):
+        # Grow batch until padded size would exceed batch_size
+        end = start + 1
+        while end < len(order) and (end - start + 1)*lengths[order[end]] <= batch_size:
+            end += 1
+        batch = order[start:end]
+        width = lengths[batch].max()
+        padded = np.zeros((len(batch), width))
+        for r, c in enumerate(batch):
+            padded[r, :lengths[c]] = curves[c]
+        knee[batch], elbow[batch], sensitivity[batch] = locate_batch(padded, lengths[batch], sens=sens, deg=deg, online=online)
+        start = end
+    return knee, elbow, sensitivity
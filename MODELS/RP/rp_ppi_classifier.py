@@ -6,15 +6,32 @@ Description:
     RP datasets generated using extract_rp_features.py based on PPI predictions from other models.
     
     Input arguements:
-        -f: paths to files containing RP PPI datasets (.tsv) (cross-validation will be performed, otherwise input -train and -test)
-        -train: Filepath(s) of training dataset(s) (.tsv file)
-        -test: Filepath(s) of testing dataset(s) (.tsv file)
+        -f: paths to files containing RP PPI datasets (.tsv or .npz) (cross-validation will be performed, otherwise input -train and -test)
+        -train: Filepath(s) of training dataset(s) (.tsv or .npz file)
+        -test: Filepath(s) of testing dataset(s) (.tsv or .npz file)
         -k: number of k-folds to perform cross-validation of given files (int)
         -d: delta imbalance ratio of labelled RP data as positives/total (float)
         -c: perform CME (combines all dataset files provided by -f) for PPI prediction (flag)
+        -ce: classifier for CME, svc (default) or nystroem (Nystroem RBF kernel approximation with logistic regression, much faster on large datasets)
+        -e: names of experts to combine for CME, default is all experts in -f files (e.g. PIPR SPRINT to leave out DEEPFE)
+        -j: number of cross-validation folds to run in parallel processes (int), default is 1
+        --predict-only: paths to RP datasets to make predictions for using model trained on -train (no evaluation),
+            saved as predictions_<dataset filename>.tsv, suffixed by position of datasets with the same filename
+        -m: path to directory for saving fitted models, default is models/ in results directory
+        -cs: number of PPIs read and predicted per chunk for -test and --predict-only datasets (int), default is 262144
+        -bc: path to directory for caching binned features of LightGBM cross-validation folds, default is no cache
+    
+        RP datasets saved as .npz (extract_rp_features.py -b) are loaded as typed numeric features without parsing text
+        CME files can each be one expert's RP dataset (expert named by end of filename, e.g. RP_SPRINT.tsv)
+        or multiple experts' (extract_rp_features.py -e), features of experts not included in -e are not read
+        Models fit by -train are saved and reused when the same training file and hyperparameters are given again,
+        -train can also be a saved model (.joblib)
+        LightGBM cross-validation folds are fit on features of their training data binned once (see binned_datasets.py),
+        cached in the -bc directory (if given) for reruns
     
     Output files:
         Prediction probabilities for PPIs (.tsv)
+        Fitted model (.joblib) for -train runs
         Performance results of PPI classification:
             - ROC curve
             - Precision-Recall curve
@@ -24,20 +41,35 @@ Description:
 Last Updated: September 18, 2021
 """
 
-import os, argparse, time
+import os, sys, argparse, time
+import multiprocessing
+import zipfile
+import hashlib
+import joblib
 import pandas as pd
 import numpy as np
+import sklearn
+import lightgbm
 from sklearn import metrics
+from sklearn.base import clone
 
 from lightgbm.sklearn import LGBMClassifier
 from sklearn.svm import SVC
+from sklearn.kernel_approximation import Nystroem
+from sklearn.linear_model import LogisticRegression
 from sklearn.model_selection import StratifiedKFold
 from sklearn.preprocessing import StandardScaler
 from sklearn.pipeline import Pipeline
 import matplotlib.pyplot as plt
 
+from rp_feature_store import FeatureStore
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from binned_datasets import BinnedDataset, BinnedLGBMClassifier
+from ppi_metrics import Curves, get_imbalanced_metrics
+
 describe_help = 'python rp_ppi_classifier.py -f predictions1.tsv predictions2.tsv predictions3.tsv -d 0.5 -c -k 10' + '\nOR\n' \
-    + 'python rp_ppi_classifier.py -train trainData.tsv -test testData.tsv -d 0.5'
+    + 'python rp_ppi_classifier.py -train trainData.tsv -test testData.tsv -d 0.5' + '\nOR\n' \
+    + 'python rp_ppi_classifier.py -train trainData.tsv --predict-only candidates1.tsv candidates2.tsv'
 parser = argparse.ArgumentParser(description=describe_help)
 parser.add_argument('-f', '--files', help='Filepath(s) of dataset(s) (.tsv file) if cross-validation', type=str, nargs='+')
 parser.add_argument('-train', '--train', help='Filepath(s) of training dataset(s) (.tsv file) to train model', type=str)
@@ -45,77 +77,228 @@ parser.add_argument('-test', '--test', help='Filepath(s) of testing dataset(s) (
 parser.add_argument('-k', '--k_folds', help='Number of k-folds when cross-validating (int)', type=int, required=False, default=10)
 parser.add_argument('-d', '--delta', help='Imbalance ratio as positives/total (e.g. balanced = 0.5)', type=float, nargs=1, required=False, default=0.5)
 parser.add_argument('-c', '--cme', help='Perform a combination of multiple experts (combine datasets provided in -files)', action='store_true', default=False)
+parser.add_argument('-ce', '--cme_engine', help='Classifier for CME: svc (sigmoid SVC) or nystroem (faster kernel approximation with logistic regression), default svc', type=str, choices=['svc', 'nystroem'], default='svc')
+parser.add_argument('-e', '--experts', help='Names of experts to combine for CME (default all experts in -files), e.g. to leave one out', type=str, nargs='+', default=None)
 parser.add_argument('-r', '--results', help='Path to directory for saving prediction results', type=str, default=os.getcwd()+'/RESULTS/')
 parser.add_argument('-n', '--name', help='Name for saving files (optional, will default to modified filenames)', type=str, default='')
+parser.add_argument('-j', '--jobs', help='Number of cross-validation folds to run in parallel processes (default 1)', type=int, default=1)
+parser.add_argument('--predict-only', help='Filepath(s) of dataset(s) (.tsv or .npz file) to make predictions for using model trained on -train, without evaluation', type=str, nargs='+', dest='predict_only')
+parser.add_argument('-cs', '--chunksize', help='Number of PPIs predicted per chunk when testing (default 262144)', type=int, default=2**18)
+parser.add_argument('-m', '--models', help='Path to directory for saving fitted models (default is models/ in results directory)', type=str, default=None)
+parser.add_argument('-bc', '--bin_cache', help='Path to directory for caching binned features of LightGBM cross-validation folds (default no cache)', type=str, default=None)
 args = parser.parse_args()
 
 FILES = args.files
 K_FOLDS = args.k_folds
 IMBALANCE = args.delta
 RATIO = '1:' + str(int((1/IMBALANCE) - 1))
+MODELS_PATH = args.models if args.models else args.results + 'models/'
+if not MODELS_PATH.endswith('/'):
+    MODELS_PATH += '/'
 
-# Calculate estimate for prevalence-corrected precision on imbalanced data
-def recalculate_precision(df, precision, thresholds, d):
-    delta = 2*d - 1
-    new_precision = precision.copy()
-    for t in range(0, len(thresholds)):
-        tn, fp, fn, tp = metrics.confusion_matrix(df[1], (df[0] >= thresholds[t]).astype(int)).ravel()
-        lpp = tp/(tp+fn)
-        lnn = tn/(tn+fp)
-        if d != 0.5:
-            new_precision[t] = (lpp*(1 + delta)) / ( (lpp*(1 + delta)) + ((1 - lnn)*(1 - delta)) )
+# Load RP dataset as <Protein_A> <Protein_B> <RP features> <label>
+def load_rp_dataset(filename):
+    if filename.endswith('.npz'):
+        # Typed numeric features, protein IDs stored once and PPIs as codes (see extract_rp_features.save_rp_binary)
+        with np.load(filename) as data:
+            proteins = data['proteins']
+            df = pd.DataFrame(data['features'])
+            df.insert(0, 'Protein_A', proteins[data['protein_a']])
+            df.insert(1, 'Protein_B', proteins[data['protein_b']])
+            df['label'] = data['label']
+        return df
+    return pd.read_csv(filename, delim_whitespace=True)
+
+# Rows of array name of an open .npz (ZipFile zf) in chunks of chunk_size rows, read from the archive as each chunk is needed
+def read_npz_chunks(zf, name, chunk_size=2**18):
+    with zf.open(name + '.npy') as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
         else:
-            new_precision[t] = (lpp)/(lpp + (1-lnn))
-    return new_precision
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        if fortran_order and len(shape) > 1:
+            raise ValueError('Array %s of %s not stored in row order'%(name, zf.filename))
+        row_size = dtype.itemsize*int(np.prod(shape[1:]))
+        for start in range(0, shape[0], chunk_size):
+            rows = min(chunk_size, shape[0] - start)
+            yield np.frombuffer(f.read(rows*row_size), dtype=dtype).reshape((rows,) + shape[1:])
 
-# Recalculate metrics for imbalanced classification where d is num_positives/(num_positives + num_negatives)
-def recalculate_metrics_to_imbalance(tp, tn, fp, fn, d):
-    delta = 2*d - 1
-    # recall and specificity are unchanged
-    lpp = tp/(tp+fn)
-    lnn = tn/(tn+fp)
-    if d != 0.5:
-        accuracy = lpp*((1 + delta)/2) + lnn*((1 - delta)/2)
-        precision = (lpp*(1 + delta)) / ( (lpp*(1 + delta)) + ((1 - lnn)*(1 - delta)) )
-        f1 = (2*lpp*(1 + delta)) / ( ((1+lpp)*(1+delta)) + ((1-lnn)*(1-delta)) )
-        mcc = (lpp+lnn-1) / np.sqrt((lpp + (1-lnn)*( (1-delta)/(1+delta) ) )*( lnn + (1-lpp)*( (1+delta)/(1-delta) ) ))
-    else:
-        accuracy = (lpp + lnn)/2
-        precision = (lpp)/(lpp + (1-lnn))
-        f1 = (2*lpp)/(2 + lpp - lnn)
-        mcc = (lpp + lnn - 1) / np.sqrt( (lpp + (1-lnn))*(lnn + (1-lpp)) )
-        
-    return round(accuracy, 5), round(precision, 5), round(lpp, 5), round(lnn, 5), round(f1, 5), round(mcc, 5)
+# Read RP dataset in chunks of chunk_size PPIs as <Protein_A> <Protein_B> <RP features> <label>, features as float64 as models are fit on
+def read_rp_chunks(filename, chunk_size=2**18):
+    if filename.endswith('.npz'):
+        # Arrays of PPIs in .npz are read a chunk at a time, only the protein IDs are read whole
+        with np.load(filename) as data:
+            proteins = data['proteins']
+        with zipfile.ZipFile(filename) as zf:
+            arrays = [read_npz_chunks(zf, name, chunk_size) for name in ['features', 'protein_a', 'protein_b', 'label']]
+            for features, protein_a, protein_b, label in zip(*arrays):
+                df = pd.DataFrame(features).astype(np.float64)
+                df.insert(0, 'Protein_A', proteins[protein_a])
+                df.insert(1, 'Protein_B', proteins[protein_b])
+                df['label'] = label
+                yield df
+        return
+    columns = pd.read_csv(filename, delim_whitespace=True, nrows=0).columns
+    dtype = {c: np.float64 for c in columns[2:-1]}
+    dtype.update({columns[0]: str, columns[1]: str})
+    for df in pd.read_csv(filename, delim_whitespace=True, dtype=dtype, chunksize=chunk_size):
+        yield df
+
+# Predict RP dataset in chunks, writing <Protein_A> <Protein_B> <probability> to output_filename as each chunk is predicted
+# If evaluate, returns labels, binary predictions and probabilities of all PPIs as 1-D arrays for evaluation
+# Feature rows are never all in memory
+def predict_rp_chunks(pipe, filename, output_filename, chunk_size=2**18, evaluate=False):
+    labels, preds, probs = [], [], []
+    with open(output_filename, 'w') as f:
+        for df in read_rp_chunks(filename, chunk_size):
+            X = df[df.columns[2:-1]].to_numpy(dtype=np.float64)
+            X[np.isnan(X)] = 0
+            pred_probs = pipe.predict_proba(X)[:, 1]
+            df[df.columns[:2]].assign(probability=pred_probs).to_csv(f, sep='\t', header=None, index=False)
+            if evaluate:
+                labels.append(df[df.columns[-1]].to_numpy())
+                preds.append(pipe.predict(X))
+                probs.append(pred_probs)
+    if evaluate:
+        if not labels:
+            raise ValueError('DataFrames opened empty')
+        return np.concatenate(labels), np.concatenate(preds), np.concatenate(probs)
 
-# Get labels for PPIs
-def get_matching_pairs(df_1, df_2):
-    # Get matches using PPI ordering of smaller df
-    if df_1.shape > df_2.shape:
-        df_test = df_1.copy()
-        df_train = df_2.copy()
+# Classifier model and pipeline, SVC for CME else LightGBM
+# CME engine 'nystroem' approximates an RBF kernel (Nystroem) for a logistic regression, which gives probabilities
+# from a single fit instead of SVC's internal 5-fold Platt calibration and scales linearly with number of PPIs
+def get_pipeline(cme=False, engine='svc'):
+    if cme and engine == 'nystroem':
+        return Pipeline([('scaler', StandardScaler()),
+                         ('kernel', Nystroem(kernel='rbf', n_components=300, random_state=13052021)),
+                         ('metaclf', LogisticRegression(C=0.6, max_iter=1000)),
+                         ])
+    if cme:
+        clf = SVC(C=0.6,
+                  kernel='sigmoid',
+                  gamma='scale',
+                  probability=True,
+                  random_state=13052021,
+                  )
     else:
-        df_test = df_2.copy()
-        df_train = df_1.copy()
+        clf = LGBMClassifier(random_state=13052021,
+                         boosting_type='goss', 
+                         learning_rate=0.1, 
+                         num_leaves=50,
+                         max_depth=10, 
+                         min_data_in_leaf=50,
+                         n_estimators=150,
+                         path_smooth=0.1,
+                         )
+    return Pipeline([('scaler', StandardScaler()), ('metaclf', clf)])
+
+# Filename of model fitted on training file, keyed by hash of training file contents and pipeline hyperparameters
+def get_model_filename(train, pipe, path):
+    h = hashlib.sha256()
+    with open(train, 'rb') as f:
+        for block in iter(lambda: f.read(2**20), b''):
+            h.update(block)
+    # Models saved by other library versions are refit
+    h.update(('sklearn=%s lightgbm=%s'%(sklearn.__version__, lightgbm.__version__)).encode())
+    for name, step in pipe.steps:
+        h.update(repr((name, type(step).__name__, sorted(step.get_params().items()))).encode())
+    return path + 'model_' + train.split('/')[-1].split('.')[0] + '_' + h.hexdigest()[:16] + '.joblib'
+
+# Fitted pipeline for training file (or a saved model file .joblib), loaded if previously fit with same data and hyperparameters
+def get_fitted_model(pipe, train, path):
+    if train.endswith('.joblib'):
+        print('Loading model %s...'%train.split('/')[-1])
+        return joblib.load(train)
+    model_filename = get_model_filename(train, pipe, path)
+    if os.path.exists(model_filename):
+        print('Loading model fitted on %s...'%train.split('/')[-1])
+        return joblib.load(model_filename)
     
-    # Include all PPIs where A-B is B-A
-    df_test_rev = df_test.copy()
-    df_test_rev[[df_test_rev.columns[0], df_test_rev.columns[1]]] = df_test_rev[[df_test_rev.columns[1], df_test_rev.columns[0]]]
-    df = df_test.append(df_test_rev)
-    df = df.drop_duplicates(subset=[df.columns[0], df.columns[1]])
-    df.reset_index(drop=True, inplace=True)
+    df_train = load_rp_dataset(train)
+    df_train.replace(to_replace=np.nan, value=0, inplace=True)
+    if df_train.empty:
+        raise ValueError('DataFrames opened empty')
+    X_train = np.array(df_train[df_train.columns[2:-1]])
+    y_train = np.array(df_train[df_train.columns[-1]])
+    pipe.fit(X_train, y_train)
     
-    # Merge to match all PPIs found between df
-    matches = df_train.merge(df, on=[df.columns[0], df.columns[1]])
-    matches = matches.drop_duplicates(subset=[df.columns[0], df.columns[1]])
-    matches.reset_index(drop=True, inplace=True)
-    # Returns as <ProteinA> <ProteinB> <label> <score>
-    return matches
+    # Write to temporary file first so concurrent runs never load a partially written model
+    if not os.path.exists(path):
+        os.makedirs(path)
+    joblib.dump(pipe, model_filename + '.%s.tmp'%os.getpid())
+    os.replace(model_filename + '.%s.tmp'%os.getpid(), model_filename)
+    print('Model saved to %s'%model_filename)
+    return pipe
+
+# Names for saving predictions of each dataset, filename without directory and extension (name if a single dataset)
+# Datasets with the same name (e.g. a/RP_X.tsv and b/RP_X.tsv, RP_X.tsv and RP_X.npz) are suffixed by their position
+def get_save_names(filenames, name=''):
+    if name != '' and len(filenames) == 1:
+        return [name]
+    names = [os.path.splitext(os.path.basename(f))[0] for f in filenames]
+    save_names = [n + '_%s'%i if names.count(n) > 1 else n for i, n in enumerate(names)]
+    if len(set(save_names)) < len(save_names):
+        raise ValueError('Predictions of datasets %s would be saved to the same file, rename datasets'%filenames)
+    return save_names
+
+# Running cross-validation folds in parallel processes
+# LightGBM folds are fit on features of their training rows binned once (see binned_datasets.py), scaler and bins
+# are of training rows only, and are cached in bins by key of each fold's training data if bins is given
+def get_binned_dataset(pipe, X, y, train, bins=None):
+    scaler = clone(pipe.named_steps['scaler']).fit(X[train])
+    return BinnedDataset(X[train], y[train], pipe.named_steps['metaclf'], scaler=scaler, cache=bins)
+
+def init_fold_worker(pipe, X, y, bins=None):
+    global FOLD
+    FOLD = {'pipe': pipe, 'X': X, 'y': y, 'bins': bins}
+
+def fit_fold(fold):
+    # Fit a copy of pipeline on a fold's training data, returns binary predictions and probabilities for its test data
+    train, test = fold
+    if isinstance(FOLD['pipe'].named_steps['metaclf'], LGBMClassifier):
+        binned = get_binned_dataset(FOLD['pipe'], FOLD['X'], FOLD['y'], train, bins=FOLD['bins'])
+        pipe = BinnedLGBMClassifier(FOLD['pipe'].named_steps['metaclf'], binned).fit()
+    else:
+        pipe = clone(FOLD['pipe'])
+        pipe.fit(FOLD['X'][train], FOLD['y'][train])
+    return pipe.predict(FOLD['X'][test]), pipe.predict_proba(FOLD['X'][test])
+
+def get_fold_predictions(pipe, X, y, folds, jobs=1, bins=None):
+    # Predictions of each fold (train, test) in order of folds, folds are fit by a pool of processes if jobs > 1
+    # LightGBM threads are split among processes so the node is not oversubscribed
+    if jobs <= 1:
+        init_fold_worker(pipe, X, y, bins=bins)
+        for fold in folds:
+            yield fit_fold(fold)
+        return
+    if isinstance(pipe.named_steps['metaclf'], LGBMClassifier):
+        pipe = clone(pipe).set_params(metaclf__n_jobs=max(1, os.cpu_count() // jobs))
+    with multiprocessing.Pool(min(jobs, len(folds)), initializer=init_fold_worker, initargs=(pipe, X, y, bins)) as pool:
+        for predictions in pool.imap(fit_fold, folds):
+            yield predictions
 
 if __name__ == '__main__':
     
     if not os.path.exists(args.results):
         os.makedirs(args.results)
     
+    # ================== FOR PREDICTION ONLY RUNS ==================
+    if args.predict_only != None:
+        if args.train == None:
+            raise ValueError('Training dataset or saved model (-train) required to make predictions')
+        t_start = time.time()
+        # Model is fit (or loaded) once and used for all datasets
+        pipe = get_fitted_model(get_pipeline(args.cme, args.cme_engine), args.train, MODELS_PATH)
+        # Filenames for saving predictions, modified filenames when predicting multiple datasets
+        for filename, save_name in zip(args.predict_only, get_save_names(args.predict_only, args.name)):
+            print('Predicting %s...'%filename.split('/')[-1])
+            
+            # Record PPI prediction probabilities, streamed in chunks
+            predict_rp_chunks(pipe, filename, args.results + 'predictions_' + save_name + '.tsv', chunk_size=args.chunksize)
+        print('\nTime:', round(time.time() - t_start, 2), 'seconds')
+        exit()
+    
     # ================== FOR SINGLE TRAIN/TEST RUNS ==================
     if FILES == None and args.train != None and args.test != None:
         t_start = time.time()
@@ -123,70 +306,21 @@ if __name__ == '__main__':
         print('Training on %s\nTesting on %s\n'%(args.train.split('/')[-1], args.test.split('/')[-1]))
         output += '\nTraining on %s\nTesting on %s\n'%(args.train.split('/')[-1], args.test.split('/')[-1])
         
-        # Load data
-        df_train = pd.read_csv(args.train, delim_whitespace=True)
-        df_train.replace(to_replace=np.nan, value=0, inplace=True)
-        df_test = pd.read_csv(args.test, delim_whitespace=True)
-        df_test.replace(to_replace=np.nan, value=0, inplace=True)
+        # Fit model with training data, or load model previously fit on same training data and hyperparameters
+        pipe = get_fitted_model(get_pipeline(args.cme, args.cme_engine), args.train, MODELS_PATH)
+        #clf.fit(X_train, y_train)
+        #var_imp_df = pd.DataFrame([df_train.columns, clf.feature_importances_]).T
+        #var_imp_df.sort_values(by=[1], ascending=False, inplace=True)
+        #plot_importance(clf.booster_)
         
-        if df_train.empty or df_test.empty:
-            raise ValueError('DataFrames opened empty')
-
-        # Define data and labels
-        pairs_train = np.array(df_train[df_train.columns[0:2]])
-        X_train = np.array(df_train[df_train.columns[2:-1]])
-        y_train = np.array(df_train[df_train.columns[-1]])
-
-        pairs_test = np.array(df_test[df_test.columns[0:2]])
-        X_test = np.array(df_test[df_test.columns[2:-1]])
-        y_test = np.array(df_test[df_test.columns[-1]])
-
         # Filename for saving predictions
         if args.name == '':
             save_name = args.test.split('.')[0].split('/')[-1]
         else:
             save_name = args.name
-            
-        # Define classifier model and pipeline
-        if args.cme:
-            clf = SVC(C=0.6,
-                      kernel='sigmoid',
-                      gamma='scale',
-                      probability=True,
-                      random_state=13052021,
-                      )
-        else:
-            clf = LGBMClassifier(random_state=13052021,
-                             boosting_type='goss', 
-                             learning_rate=0.1, 
-                             num_leaves=50,
-                             max_depth=10, 
-                             min_data_in_leaf=50,
-                             n_estimators=150,
-                             path_smooth=0.1,
-                             )
-        
-        pipe = Pipeline([('scaler', StandardScaler()), ('metaclf', clf)])
-        
-        # Fit model with training data
-        pipe.fit(X_train, y_train)
-        #clf.fit(X_train, y_train)
-        #var_imp_df = pd.DataFrame([df_train.columns, clf.feature_importances_]).T
-        #var_imp_df.sort_values(by=[1], ascending=False, inplace=True)
-        #plot_importance(clf.booster_)
         
-        # Record PPI binary predictions
-        pred = pipe.predict(X_test)
-        #pred = clf.predict(X_test)
-        ppi_bin = pd.DataFrame(pairs_test, columns=[df_test.columns[0], df_test.columns[1]])
-        ppi_bin.insert(2, 2, pred)
-        
-        # Record PPI prediction probabilities
-        pred_probs = pipe.predict_proba(X_test)
-        #pred_probs = clf.predict_proba(X_test)
-        ppi_probs = pd.DataFrame(np.append(pairs_test, pred_probs, axis=1), columns=[df_test.columns[0], df_test.columns[1], 2, 3])
-        ppi_probs.drop(columns=[2], inplace=True)
-        ppi_probs.to_csv(args.results + 'predictions_' + save_name + '.tsv', sep='\t', header=None, index=False)
+        # Record PPI binary predictions and prediction probabilities, test data streamed in chunks
+        y_test, pred, pred_probs = predict_rp_chunks(pipe, args.test, args.results + 'predictions_' + save_name + '.tsv', chunk_size=args.chunksize, evaluate=True)
         
         # If only one class in labels (predicting unknowns)
         if pd.Series(y_test).unique().shape[0] < 2:
@@ -200,7 +334,7 @@ if __name__ == '__main__':
         
         # For imbalanced classification metrics
         if args.delta != 0.5:
-            accuracy, precision, recall, specificity, f1, mcc = recalculate_metrics_to_imbalance(tp, tn, fp, fn, args.delta)
+            accuracy, precision, recall, specificity, f1, mcc = [round(m[0], 5) for m in get_imbalanced_metrics(tn, fp, fn, tp, [args.delta])]
         else:
             try:
                 accuracy = round((tp+tn)/(tp+fp+tn+fn), 5)
@@ -230,25 +364,13 @@ if __name__ == '__main__':
         print('Accuracy =', accuracy, '\nPrecision =', precision, '\nRecall =', recall, '\nSpecificity =', specificity, '\nF1 =', f1, '\nMCC =', mcc)
         output += '\nAccuracy = ' + str(accuracy) + '\nPrecision = ' + str(precision) + '\nRecall = '+ str(recall) + '\nSpecificity = ' + str(specificity) + '\nF1 = ' + str(f1) + '\nMCC = ' + str(mcc)
         
-        auc_roc = metrics.roc_auc_score(y_test, pred_probs[:, 1])
-        auc_pr = metrics.average_precision_score(y_test, pred_probs[:, 1])
-        fpr, tpr, __ = metrics.roc_curve(y_test, pred_probs[:, 1])
-        
         # Get performance metrics for curve plotting
         # Evaluate performance and adjust for hypothetical imbalance
-        precision, recall, thresholds = metrics.precision_recall_curve(y_test, pred_probs[:, 1])
-        df_pred = pd.DataFrame(data={1:y_test, 0:pred_probs[:, 1]})
-        
-        # Evaluate performance and adjust for hypothetical imbalance
-        precision, recall, thresholds = metrics.precision_recall_curve(df_pred[1], df_pred[0])
-        if args.delta != 0.5:
-            precision = recalculate_precision(df_pred, precision, thresholds, args.delta)
-        fpr, tpr, __ = metrics.roc_curve(df_pred[1], df_pred[0])
-        if args.delta == 0.5:
-            pr_auc = metrics.average_precision_score(df_pred[1], df_pred[0])
-        else:
-            pr_auc = metrics.auc(recall, precision)
-        roc_auc = metrics.roc_auc_score(df_pred[1], df_pred[0])
+        curves = Curves(y_test, pred_probs)
+        precision, recall, thresholds = curves.pr(args.delta)
+        fpr, tpr, __ = curves.roc()
+        pr_auc = curves.pr_auc(args.delta)
+        roc_auc = curves.roc_auc()
         
         print('auc_roc=%.6f'%(roc_auc) + '\nauc_pr=%.6f'%(pr_auc))
         output += '\nAUC_ROC = %0.5f'%roc_auc + '\nAUC_PR = %0.5f\n'%pr_auc
@@ -294,34 +416,28 @@ if __name__ == '__main__':
     # Combine feature vectors for PPIs from all files
     if args.cme:
         print('Performing CME...')
-        # Load first file
-        df_cme = pd.read_csv(FILES[0], delim_whitespace=True)
-        
-        # Append remaining files
-        for f in range(1, len(FILES)):
-            # Read files
-            df = pd.read_csv(FILES[f], delim_whitespace=True)
-            df.replace(to_replace=np.nan, value=0, inplace=True)
-            df_cme = df_cme.merge(df, on=[df.columns[0], df.columns[1]])
-            df_cme.drop(columns=['label_x'], inplace=True)
-            df_cme.rename(columns={'label_y': 'label'}, inplace=True)
+        # Align RP features of all experts by PPI, reading only features of experts included
+        store = FeatureStore(FILES)
+        experts = args.experts if args.experts else list(store.experts)
+        df_cme = store.get_dataset(experts)
 
         if df_cme.empty:
             raise ValueError('Combined DataFrame empty, error occurred')
 
-        cme_name = ['_'.join([path.split('/')[-1].split('.')[0].split('_')[-1] for path in FILES])]
+        cme_name = '_'.join(experts)
         if args.name == '':
             save_name = cme_name
         else:
             save_name = args.name
         
-    for f in FILES:
+    # Combined dataset is cross-validated once for CME
+    for f in (FILES[:1] if args.cme else FILES):
         print('Performing cross-validation run on %s'%([i.split('/')[-1] for i in FILES]))
         # Run CME using previously created df from files, else use df from files individually
         if args.cme:
             df = df_cme.copy()
         else:       
-            df = pd.read_csv(f, delim_whitespace=True)
+            df = load_rp_dataset(f)
             df.replace(to_replace=np.nan, value=0, inplace=True)
             if args.name == '':
                 save_name = f.split('.')[0].split('/')[-1]
@@ -337,25 +453,7 @@ if __name__ == '__main__':
         # Define data partiioning
         kf = StratifiedKFold(n_splits=K_FOLDS)
 
-        if args.cme:
-            clf = SVC(C=0.6,
-                      kernel='sigmoid',
-                      gamma='scale',
-                      probability=True,
-                      random_state=13052021,
-                      )
-        else:
-            clf = LGBMClassifier(random_state=13052021,
-                             boosting_type='goss', 
-                             learning_rate=0.1, 
-                             num_leaves=50,
-                             max_depth=10, 
-                             min_data_in_leaf=50,
-                             n_estimators=150,
-                             path_smooth=0.1,
-                             ) 
-        
-        pipe = Pipeline([('scaler', StandardScaler()), ('metaclf', clf)])
+        pipe = get_pipeline(args.cme, args.cme_engine)
             
         # Metrics for evaluation
         # For ROC curve
@@ -381,22 +479,19 @@ if __name__ == '__main__':
         bin_predictions = pd.DataFrame()
         output = args.name
         t_start = time.time()
-        for train, test in kf.split(X, y):
+        # Fit model with training data of each fold (in parallel if -j > 1), evaluated in order of folds
+        folds = list(kf.split(X, y))
+        for (train, test), (pred, pred_probs) in zip(folds, get_fold_predictions(pipe, X, y, folds, jobs=args.jobs, bins=args.bin_cache)):
             
             print('===== Fold-%s ====='%k)
             output += '===== Fold-%s ====='%k
             
-            # Fit model with training data
-            pipe.fit(X[train], y[train])
-            
             # Record PPI binary predictions
-            pred = pipe.predict(X[test])
             ppi_bin = pd.DataFrame(pairs[test], columns=[df.columns[0], df.columns[1]])
             ppi_bin.insert(2, 2, pred)
             bin_predictions = bin_predictions.append(ppi_bin)
             
             # Record PPI prediction probabilities
-            pred_probs = pipe.predict_proba(X[test])
             ppi_probs = pd.DataFrame(np.append(pairs[test], pred_probs, axis=1), columns=[df.columns[0], df.columns[1], 2, 3])
             ppi_probs.drop(columns=[2], inplace=True)
             ppi_probs.to_csv(args.results + 'predictions_' + save_name + '_fold-%s'%k + '.tsv', sep='\t', header=None, index=False)
@@ -409,7 +504,7 @@ if __name__ == '__main__':
             
             # For imbalanced classification metrics
             if args.delta != 0.5:
-                accuracy, precision, recall, specificity, f1, mcc = recalculate_metrics_to_imbalance(tp, tn, fp, fn, args.delta)
+                accuracy, precision, recall, specificity, f1, mcc = [round(m[0], 5) for m in get_imbalanced_metrics(tn, fp, fn, tp, [args.delta])]
                 if np.isnan(accuracy) == False:
                     fold_accuracy.append(accuracy)
                 if np.isnan(precision) == False:
@@ -457,25 +552,16 @@ if __name__ == '__main__':
             print('Accuracy =', accuracy, '\nPrecision =', precision, '\nRecall =', recall, '\nSpecificity =', specificity, '\nF1 =', f1, '\nMCC =', mcc)
             output += '\nAccuracy = ' + str(accuracy) + '\nPrecision = ' + str(precision) + '\nRecall = '+ str(recall) + '\nSpecificity = ' + str(specificity) + '\nF1 = ' + str(f1) + '\nMCC = ' + str(mcc)
         
-            auc_roc = metrics.roc_auc_score(y[test], pred_probs[:, 1])
-            auc_pr = metrics.average_precision_score(y[test], pred_probs[:, 1])
-            fpr, tpr, __ = metrics.roc_curve(y[test], pred_probs[:, 1])
-            
             print('Accuracy =', accuracy, '\nPrecision =', precision, '\nRecall =', recall, '\nSpecificity =', specificity, '\nF1 =', f1, '\nMCC =', mcc)
             output += '\nAccuracy = ' + str(accuracy) + '\nPrecision = ' + str(precision) + '\nRecall = '+ str(recall) + '\nSpecificity = ' + str(specificity) + '\nF1 = ' + str(f1) + '\nMCC = ' + str(mcc)
             
             # Get performance metricss for curve plotting
             # Evaluate k-fold performance and adjust for hypothetical imbalance
-            precision, recall, thresholds = metrics.precision_recall_curve(y[test], pred_probs[:, 1])
-            df_pred = pd.DataFrame(data={1:y[test], 0:pred_probs[:, 1]})
-            if args.delta != 0.5:
-                precision = recalculate_precision(df_pred, precision, thresholds, args.delta)
-            fpr, tpr, __ = metrics.roc_curve(df_pred[1], df_pred[0])
-            if args.delta == 0.5:
-                pr_auc = metrics.average_precision_score(df_pred[1], df_pred[0])
-            else:
-                pr_auc = metrics.auc(recall, precision)
-            roc_auc = metrics.roc_auc_score(df_pred[1], df_pred[0])
+            curves = Curves(y[test], pred_probs[:, 1])
+            precision, recall, thresholds = curves.pr(args.delta)
+            fpr, tpr, __ = curves.roc()
+            pr_auc = curves.pr_auc(args.delta)
+            roc_auc = curves.roc_auc()
 
             print('AUC_ROC = %0.5f'%roc_auc, '\nAUC_PR = %0.5f'%pr_auc)
             output += '\nAUC_ROC = %0.5f'%roc_auc + '\nAUC_PR = %0.5f\n'%pr_auc
@@ -526,15 +612,11 @@ if __name__ == '__main__':
         df_pred_total = pd.DataFrame(data={1:y, 0:prob_predictions[prob_predictions.columns[-1]]})
         
         # Get total performance from all PPI predictions (concatenated k-fold tested subsets)
-        precision, recall, thresholds = metrics.precision_recall_curve(df_pred_total[1], df_pred_total[0])
-        if args.delta != 0.5:
-            precision = recalculate_precision(df_pred_total, precision, thresholds, args.delta)
-        fpr, tpr, __ = metrics.roc_curve(df_pred_total[1], df_pred_total[0])
-        if args.delta == 0.5:
-            pr_auc = metrics.average_precision_score(df_pred_total[1], df_pred_total[0])
-        else:
-            pr_auc = metrics.auc(recall, precision)
-        roc_auc = metrics.roc_auc_score(df_pred_total[1], df_pred_total[0])
+        curves = Curves(df_pred_total[1], df_pred_total[0])
+        precision, recall, thresholds = curves.pr(args.delta)
+        fpr, tpr, __ = curves.roc()
+        pr_auc = curves.pr_auc(args.delta)
+        roc_auc = curves.roc_auc()
         
         if args.delta <= 0.5:
             leg_loc = 'lower right'
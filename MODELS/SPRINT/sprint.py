@@ -40,8 +40,11 @@ import time
 import pandas as pd
 import numpy as np
 from sklearn.model_selection import StratifiedKFold
-from sklearn import metrics
 import matplotlib.pyplot as plt
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from score_matrix import convert_predictions
+from ppi_metrics import Curves
 
 
 describe_help = 'python sprint.py -s sequences.fasta -f data.tsv -h HSP/file.hsp -k5'
@@ -65,6 +68,7 @@ parser.add_argument('-pos', '--positive_testing_file', help='File contaiing spac
 parser.add_argument('-neg', '--negative_testing_file', help='File contaiing space-separated negative PPIs used for testing', type=str)
 parser.add_argument('-o', '--output_file', help='Name used for saving files', type=str, nargs='?', default='output.txt')
 parser.add_argument('-e', '--entire_proteome', help='Flag for performing entire proteome (all-to-all) prediction', action='store_true')
+parser.add_argument('-bin', '--binary', help='Flag for also saving entire proteome predictions as a score matrix (.npy, see score_matrix.py)', action='store_true')
 # Additional arguements and options for easily performing cross-validation
 parser.add_argument('-s', '--sprint', help='Full path to SPRINT location (can be omitted if SPRINT is in same directory)', type=str, nargs='?', default=os.getcwd()+'/')
 parser.add_argument('-file', help='Full path to labelled PPI dataset in (.tsv file, no header, using labels 0 (neg) and 1 (pos))', type=str)
@@ -85,20 +89,6 @@ else:
 # Display ratio of positives:negatives
 RATIO = '1:' + str(int((1/IMBALANCE) - 1))
 
-# Calculate estimate for prevalence-corrected precision on imbalanced data
-def recalculate_precision(df, precision, thresholds, ratio=IMBALANCE):
-    delta = 2*ratio - 1
-    new_precision = precision.copy()
-    for t in range(0, len(thresholds)):
-        tn, fp, fn, tp = metrics.confusion_matrix(df[df.columns[-1]], (df[df.columns[2]] >= thresholds[t]).astype(int)).ravel()
-        lpp = tp/(tp+fn)
-        lnn = tn/(tn+fp)
-        if ratio != 0.5:
-            new_precision[t] = (lpp*(1 + delta)) / ( (lpp*(1 + delta)) + ((1 - lnn)*(1 - delta)) )
-        else:
-            new_precision[t] = (lpp)/(lpp + (1-lnn))
-    return new_precision
-
 def compile_SPRINT(sprint_location, serial=False, parallel=False):
     current_dir = os.getcwd()
     os.chdir(sprint_location)
@@ -269,14 +259,11 @@ if __name__ == '__main__':
             os.remove(RESULTS_DIR + 'predictions_' + output + '_fold-%s.txt.neg'%str(fold))
             
             # Evaluate k-fold performance and adjust for hypothetical imbalance
-            precision, recall, thresholds = metrics.precision_recall_curve(df_pred[df_pred.columns[-1]], df_pred[df_pred.columns[2]])
-            fpr, tpr, __ = metrics.roc_curve(df_pred[df_pred.columns[-1]], df_pred[df_pred.columns[2]])
-            if IMBALANCE == 0.5:
-                pr_auc = metrics.average_precision_score(df_pred[df_pred.columns[-1]], df_pred[df_pred.columns[2]])
-            else:
-                precision = recalculate_precision(df_pred, precision, thresholds)
-                pr_auc = metrics.auc(recall, precision)
-            roc_auc = metrics.roc_auc_score(df_pred[df_pred.columns[-1]], df_pred[df_pred.columns[2]])
+            curves = Curves(df_pred[df_pred.columns[-1]], df_pred[df_pred.columns[2]])
+            precision, recall, thresholds = curves.pr(IMBALANCE)
+            fpr, tpr, __ = curves.roc()
+            pr_auc = curves.pr_auc(IMBALANCE)
+            roc_auc = curves.roc_auc()
             print('auc_roc=', roc_auc, '\nauc_pr=', pr_auc)
             
             # Add k-fold performance for overall average performance
@@ -290,14 +277,11 @@ if __name__ == '__main__':
             fold += 1
         
         # Get overall performance across all folds
-        precision, recall, thresholds = metrics.precision_recall_curve(df_pred_all[df_pred_all.columns[-1]], df_pred_all[df_pred_all.columns[2]])
-        fpr, tpr, __ = metrics.roc_curve(df_pred_all[df_pred_all.columns[-1]], df_pred_all[df_pred_all.columns[2]])
-        if IMBALANCE == 0.5:
-            pr_auc = metrics.average_precision_score(df_pred_all[df_pred_all.columns[-1]], df_pred_all[df_pred_all.columns[2]])
-        else:
-            precision = recalculate_precision(df_pred_all, precision, thresholds)
-            pr_auc = metrics.auc(recall, precision)
-        roc_auc = metrics.roc_auc_score(df_pred_all[df_pred_all.columns[-1]], df_pred_all[df_pred_all.columns[2]])
+        curves = Curves(df_pred_all[df_pred_all.columns[-1]], df_pred_all[df_pred_all.columns[2]])
+        precision, recall, thresholds = curves.pr(IMBALANCE)
+        fpr, tpr, __ = curves.roc()
+        pr_auc = curves.pr_auc(IMBALANCE)
+        roc_auc = curves.roc_auc()
         
         # Write results to text file
         with open(RESULTS_DIR + output + '_results.txt', 'w') as f:
@@ -336,5 +320,8 @@ if __name__ == '__main__':
         predict_interactions(args.sprint, args.protein_sequences, args.hsp_file, thc=args.hc_threshold, 
                              train_pos=args.training_file, pos=args.positive_testing_file, neg=args.negative_testing_file, 
                              output_name=args.results + args.output_file, entire_proteome=args.entire_proteome)
+        if args.entire_proteome and args.binary:
+            # Score matrix of all-to-all predictions can be read by other scripts without parsing text
+            convert_predictions(args.results + args.output_file, args.results + args.output_file.rsplit('.', 1)[0] + '.npy')
         
         
\ No newline at end of file
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Description:
+    Cache of LightGBM binned datasets, so features are binned once and reused by every model fit on them
+    (e.g. cross-validation folds, repeated fits of the same training data, reruns).
+
+    LGBMClassifier.fit constructs a new lgb.Dataset (histogram bins of every feature) for each fit.
+    A BinnedDataset constructs it once per (features, scaler, LightGBM params) as float64 features,
+    folds are fit on subsets of its rows sharing the same bins, and the binned dataset is saved to a
+    cache directory (LightGBM binary format) to be loaded instead of binned again by later runs.
+    Models fit on the whole dataset are the same as LGBMClassifier.fit on the same scaled features.
+"""
+
+__all__ = ['BinnedDataset',
+           'BinnedLGBMClassifier',
+           ]
+
+import os
+import hashlib
+import numpy as np
+import lightgbm as lgb
+
+# LGBMClassifier params that are not LightGBM training params
+SKLEARN_PARAMS = ['class_weight', 'importance_type', 'n_estimators']
+
+
+def get_train_params(clf):
+    # LightGBM training params of LGBMClassifier clf (sklearn names are aliases of LightGBM params)
+    params = {k: v for k, v in clf.get_params().items() if v is not None and k not in SKLEARN_PARAMS}
+    if params.get('objective') is None:
+        params['objective'] = 'binary'
+    return params
+
+
+class BinnedDataset(object):
+    # Features X (and labels y of 0 and 1) binned once for LightGBM models with params of LGBMClassifier clf
+    # scaler is an optional fitted transformer applied to features before binning and predicting (e.g. StandardScaler)
+    # If cache is a directory, binned dataset is saved there and loaded by later runs with the same data, scaler and params
+    def __init__(self, X, y, clf, scaler=None, cache=None):
+        self.scaler = scaler
+        self.params = get_train_params(clf)
+        X = self.transform(X)
+        y = np.asarray(y)
+        filename = None
+        if cache:
+            filename = os.path.join(cache, 'bins_%s.bin'%self.get_key(X, y))
+        if filename and os.path.exists(filename):
+            self.dataset = lgb.Dataset(filename, params=self.params, free_raw_data=False).construct()
+        else:
+            self.dataset = lgb.Dataset(X, label=y, params=self.params, free_raw_data=False).construct()
+            if filename:
+                if not os.path.exists(cache):
+                    os.makedirs(cache)
+                # Write to temporary file first so concurrent runs never load a partially written dataset
+                self.dataset.save_binary(filename + '.%s.tmp'%os.getpid())
+                os.replace(filename + '.%s.tmp'%os.getpid(), filename)
+
+    def get_key(self, X, y):
+        # Hash of features, labels, scaler and params, identifying a binned dataset in cache
+        h = hashlib.sha256()
+        h.update(np.ascontiguousarray(X).tobytes())
+        h.update(np.ascontiguousarray(y).tobytes())
+        # Number of threads doesn't change bins
+        params = sorted((k, v) for k, v in self.params.items() if k not in ('n_jobs', 'num_threads'))
+        h.update(repr((X.shape, type(self.scaler).__name__, params, lgb.__version__)).encode())
+        if self.scaler is not None:
+            for name, value in sorted(vars(self.scaler).items(), key=lambda item: item[0]):
+                h.update(name.encode())
+                h.update(value.tobytes() if isinstance(value, np.ndarray) else repr(value).encode())
+        return h.hexdigest()[:16]
+
+    def transform(self, X):
+        # Features as float64 (as scaled by a Pipeline, float32 can change bin edges) scaled as the binned dataset
+        X = np.asarray(X)
+        if self.scaler is not None:
+            X = self.scaler.transform(X)
+        return X.astype(np.float64)
+
+    def subset(self, rows):
+        # Binned dataset of rows (e.g. training data of a fold) using the same bins, or all rows if rows is None
+        if rows is None:
+            return self.dataset
+        return self.dataset.subset(np.sort(np.asarray(rows)).tolist())
+
+
+class BinnedLGBMClassifier(object):
+    # LGBMClassifier clf fit on rows of a BinnedDataset, with predict and predict_proba of LGBMClassifier
+    def __init__(self, clf, binned):
+        self.clf = clf
+        self.binned = binned
+        self.booster = None
+
+    def fit(self, rows=None):
+        self.booster = lgb.train(self.binned.params, self.binned.subset(rows), num_boost_round=self.clf.get_params()['n_estimators'])
+        return self
+
+    def predict_proba(self, X, num_iteration=None):
+        probs = self.booster.predict(self.binned.transform(X), num_iteration=num_iteration)
+        return np.column_stack([1 - probs, probs])
+
+    def predict(self, X):
+        # Binary predictions (labels 0 and 1) at probability 0.5, as LGBMClassifier
+        return (self.predict_proba(X)[:, 1] > 0.5).astype(int)
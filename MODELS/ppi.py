@@ -18,8 +18,6 @@ __all__ = [
     'check_ppi_confidence',
     'run_cdhit',
     'perform_rp_traintests',
-    'recalculate_precision',
-    'recalculate_metrics_to_imbalance',
     'get_top_interactors',
     ]
 
@@ -27,6 +25,8 @@ import os
 import pandas as pd
 import numpy as np
 import math
+import itertools
+import multiprocessing
 #import tqdm
 import urllib.parse
 import urllib.request
@@ -47,6 +47,10 @@ from sklearn.svm import SVC
 from lgbm import LGBMClassifier
 from lightgbm import plot_split_value_histogram, plot_importance
 import xgb
+from score_matrix import ScoreMatrix
+from binned_datasets import BinnedDataset, BinnedLGBMClassifier
+from ppi_metrics import Curves, get_imbalanced_metrics
+from ppi_pairs import get_matching_pairs
 #from sklearn.neural_network import MLPClassifier
 #from scipy.stats import f_oneway, ttest_ind
 
@@ -103,29 +107,6 @@ def remove_redundant_pairs(df_ppi):
     
     return df_out
 
-def get_matching_pairs(df_1, df_2):
-    # Get matches using PPI ordering of smaller df
-    if df_1.shape > df_2.shape:
-        df_test = df_1.copy()
-        df_train = df_2.copy()
-    else:
-        df_test = df_2.copy()
-        df_train = df_1.copy()
-    
-    # Include all PPIs where A-B is B-A
-    df_test_rev = df_test.copy()
-    df_test_rev[[df_test_rev.columns[0], df_test_rev.columns[1]]] = df_test_rev[[df_test_rev.columns[1], df_test_rev.columns[0]]]
-    df = df_test.append(df_test_rev)
-    df = df.drop_duplicates(subset=[df.columns[0], df.columns[1]])
-    df.reset_index(drop=True, inplace=True)
-    
-    # Merge to match all PPIs found between df
-    matches = df_train.merge(df, on=[df.columns[0], df.columns[1]])
-    matches = matches.drop_duplicates(subset=[df.columns[0], df.columns[1]])
-    matches.reset_index(drop=True, inplace=True)
-    # Returns as <ProteinA> <ProteinB> <label> <score>
-    return matches
-    
 def remove_matching_pairs(df_1, df_2):
     # First get matches
     if df_1.shape > df_2.shape:
@@ -1003,355 +984,105 @@ def get_cme_avg_dataset(dir_path, results, name):
         
 # ================================================================================
 
-# Calculate estimate for prevalence-corrected precision on imbalanced data
-def recalculate_precision(df, precision, thresholds, d):
-    delta = 2*d - 1
-    new_precision = precision.copy()
-    for t in range(0, len(thresholds)):
-        tn, fp, fn, tp = metrics.confusion_matrix(df[1], (df[0] >= thresholds[t]).astype(int)).ravel()
-        lpp = tp/(tp+fn)
-        lnn = tn/(tn+fp)
-        if d != 0.5:
-            new_precision[t] = (lpp*(1 + delta)) / ( (lpp*(1 + delta)) + ((1 - lnn)*(1 - delta)) )
-        else:
-            new_precision[t] = (lpp)/(lpp + (1-lnn))
-    return new_precision
-
-# Recalculate metrics for imbalanced classification where d is num_positives/(num_positives + num_negatives)
-def recalculate_metrics_to_imbalance(tp, tn, fp, fn, d):
-    delta = 2*d - 1
-    # recall and specificity are unchanged
-    lpp = tp/(tp+fn)
-    lnn = tn/(tn+fp)
-    if d != 0.5:
-        accuracy = lpp*((1 + delta)/2) + lnn*((1 - delta)/2)
-        precision = (lpp*(1 + delta)) / ( (lpp*(1 + delta)) + ((1 - lnn)*(1 - delta)) )
-        f1 = (2*lpp*(1 + delta)) / ( ((1+lpp)*(1+delta)) + ((1-lnn)*(1-delta)) )
-        mcc = (lpp+lnn-1) / np.sqrt((lpp + (1-lnn)*( (1-delta)/(1+delta) ) )*( lnn + (1-lpp)*( (1+delta)/(1-delta) ) ))
-    else:
-        accuracy = (lpp + lnn)/2
-        precision = (lpp)/(lpp + (1-lnn))
-        f1 = (2*lpp)/(2 + lpp - lnn)
-        mcc = (lpp + lnn - 1) / np.sqrt( (lpp + (1-lnn))*(lnn + (1-lpp)) )
-        
-    return round(accuracy, 5), round(precision, 5), round(lpp, 5), round(lnn, 5), round(f1, 5), round(mcc, 5)
-
 # ======================== GRIDSEARCHING =============================================================================
-def gridsearch(train, test):
-    # Grid-search params
-    # LightGBM
-    boosting_types = ['goss']
-    learning_rates = [0.05, 0.1, 0.15]
-    num_leaves = [40, 50, 60]
-    n_estimators = [120, 150, 250]
-    min_data_in_leafs = [40, 50, 60]
-    max_depths = [7, 10, 15]
-    smoothing = [0.05, 0.1, 0.15]
-    l1s = [0, 0.01, 0.05]
-    l2s = [0, 0.01, 0.05]
-    gains = [0, 0.1]
-    delta = 0.5
-    #import lightgbm as lgb
-    best_auPR = 0
-    best = ''
-    
-    precs = []
-    recs = []
-    labs = []
+# Grid-search params
+# LightGBM
+GRID = {'boosting_type': ['goss'],
+        'learning_rate': [0.05, 0.1, 0.15],
+        'num_leaves': [40, 50, 60],
+        'n_estimators': [120, 150, 250],
+        'min_data_in_leaf': [40, 50, 60],
+        'max_depth': [7, 10, 15],
+        'path_smooth': [0.05, 0.1, 0.15],
+        'lambda_l1': [0, 0.01, 0.05],
+        'lambda_l2': [0, 0.01, 0.05],
+        'min_gain_to_split': [0, 0.1],
+        }
+
+# AUPR adjusted to imbalance d (see ppi_metrics.Curves.pr)
+def get_pr_auc(labels, probs, d=0.5):
+    return Curves(labels, probs).pr_auc(d)
+
+# Load k cross-validation folds (<train>-<i>.tsv, <test>-<i>.tsv) once as float32 arrays, features scaled as StandardScaler in pipelines
+def load_cv_folds(train, test, k=10):
+    folds = []
+    for i in range(0, k):
+        df_train = pd.read_csv(train + '-%s.tsv'%i, delim_whitespace=True)
+        df_test = pd.read_csv(test + '-%s.tsv'%i, delim_whitespace=True)
+        scaler = StandardScaler().fit(np.array(df_train[df_train.columns[2:-1]]))
+        folds.append({'X_train': scaler.transform(np.array(df_train[df_train.columns[2:-1]])).astype(np.float32),
+                      'y_train': np.array(df_train[df_train.columns[-1]]),
+                      'X_test': scaler.transform(np.array(df_test[df_test.columns[2:-1]])).astype(np.float32),
+                      'y_test': np.array(df_test[df_test.columns[-1]]),
+                      })
+    return folds
+
+# Fitting search configurations in parallel processes
+def init_search_worker(folds, n_jobs):
+    global FOLDS, N_JOBS
+    FOLDS = folds
+    N_JOBS = n_jobs
+
+def fit_search_task(task):
+    # Fit params on a fold once with the most trees of n_estimators, probabilities for test data using the first n trees for each n
+    params, n_estimators, i = task
+    clf = LGBMClassifier(random_state=13052021, n_estimators=max(n_estimators), n_jobs=N_JOBS, verbose=-1, **params)
+    clf.fit(FOLDS[i]['X_train'], FOLDS[i]['y_train'])
+    return {n: clf.predict_proba(FOLDS[i]['X_test'], num_iteration=n)[:, 1] for n in n_estimators}
+
+# Successive halving grid-search of LightGBM params (GRID) by cross-validation on k folds at imbalance delta
+# All configurations are evaluated on the first fold, only the best 1/eta are evaluated on eta times as many folds, until all k folds
+# and one configuration remain. Configurations are ranked by AUPR of their predictions on all folds evaluated so far.
+# Fits are run by a pool of processes, configurations only differing in n_estimators share a fit.
+# Returns best params and their AUPR over all k folds
+def gridsearch(train, test, k=10, delta=0.5, processes=1, eta=3, grid=GRID):
     t_start = time.time()
-    for s in smoothing:
-        for l1 in l1s:
-            for l2 in l2s:
-                for g in gains:
-                    for x in min_data_in_leafs:
-                        for d in max_depths:
-                            for n in n_estimators:
-                                for boost in boosting_types:
-                                    for rate in learning_rates:
-                                        for leaves in num_leaves:
-                                
-                                            try:
-                                                # Metrics for evaluation
-                                                # For ROC curve
-                                                tprs = {}
-                                                roc_aucs = {}
-                                                fprs = {}
-                                                # For PR curve
-                                                precisions = {}
-                                                pr_aucs = {}
-                                                recalls = {}
-                                            
-                                                # Additional metrics
-                                                fold_accuracy = []
-                                                fold_precision = []
-                                                fold_recall = []
-                                                fold_specificity = []
-                                                fold_f1 = []
-                                                fold_mcc = []
-                                            
-                                                df_pred_total = pd.DataFrame()
-                                                fold = 0
-                                                for i in range(0, 10):
-                                                    print("=== FOLD %s ==="%i)
-                                                    # Load Data
-                                                    df_train = pd.read_csv(train + '-%s.tsv'%i, delim_whitespace=True)
-                                                    df_test = pd.read_csv(test + '-%s.tsv'%i, delim_whitespace=True)
-                                                    
-                                                    # Define data and labels
-                                                    #pairs_train = np.array(df_train[df_train.columns[0:2]])
-                                                    X_train = np.array(df_train[df_train.columns[2:-1]])
-                                                    y_train = np.array(df_train[df_train.columns[-1]])
-                                                    pairs_test = np.array(df_test[df_test.columns[0:2]])
-                                                    X_test = np.array(df_test[df_test.columns[2:-1]])
-                                                    y_test = np.array(df_test[df_test.columns[-1]])
-                                                    t_start = time.time()
-                                                    
-                                                    
-                                                    '''
-                                                    lgb_train = lgb.Dataset(X_train,label=y_train)
-                                                    lgb_test = lgb.Dataset(X_test,label=y_test)
-                                                    
-                                                    params = {'metric' : 'binary_logloss',
-                                                              'boosting_type' : 'dart',
-                                                              'learning_rate': 0.05,
-                                                              'num_leaves' : 100,
-                                                              'max_depth' : 20,
-                                                              'verbose' : -1,
-                                                              # Reducing overfitting
-                                                              'min_data_in_leaf': 300,
-                                                              'feature_fraction':0.8,
-                                                              'bagging_fraction':0.8,
-                                                              'bagging_freq':10
-                                                    }
-                                                    eval_results = {}
-                                                    lgbm = lgb.train(params,
-                                                                     lgb_train,
-                                                                     num_boost_round=200,
-                                                                     valid_sets=[lgb_train, lgb_test],
-                                                                     early_stopping_rounds= 20,
-                                                                     #verbose_eval= 10,
-                                                                     callbacks = [lgb.record_evaluation(eval_results)]
-                                                                     )
-                                                    plt.plot(eval_results['training']['binary_logloss'], color='blue', label='Training Data')
-                                                    plt.plot(eval_results['valid_1']['binary_logloss'], color='orange', label='Validation Data')
-                                                    plt.xlabel('Number of Boosting Rounds')
-                                                    plt.ylabel('Binary LogLoss')
-                                                    plt.title('')
-                                                    plt.legend()
-                                                    '''
-                                                    
-                                                    clf = LGBMClassifier(random_state=13052021, 
-                                                                         boosting_type=boost, 
-                                                                         learning_rate=rate, 
-                                                                         num_leaves=leaves,
-                                                                         max_depth=d, 
-                                                                         min_data_in_leaf=x,
-                                                                         n_estimators=n,
-                                                                         #early_stopping_round=30,
-                                                                         path_smooth=s,
-                                                                         lambda_l1=l1,
-                                                                         lambda_l2=l2,
-                                                                         min_gain_to_split=g,
-                                                                         )
-                                                    '''
-                                                    
-                                                    
-                                                    clf = xgb.XGBClassifier(random_state=13052021,
-                                                                            booster='gbtree',
-                                                                            use_label_encoder=False, 
-                                                                            eval_metric=leaves,
-                                                                            eta=rate
-                                                                            )
-                                                    '''
-                                                    
-                                                    '''
-                                                    clf = RandomForestClassifier(random_state=13052021,
-                                                                                 n_estimators=rate,
-                                                                                 criterion=leaves
-                                                                                 )
-                                                    '''
-                                                    #pipe = Pipeline([('scaler', StandardScaler()), ('rndforest', clf)])
-                                                    #pipe = Pipeline([('scaler', StandardScaler()), ('xgboost', clf)])
-                                                    pipe = Pipeline([('scaler', StandardScaler()), ('lgbm', clf)])
-                                    
-                                                    # Fit model with training data
-                                                    pipe.fit(X_train, y_train)
-                                                    
-                                                    # Record PPI binary predictions
-                                                    pred = pipe.predict(X_test)
-                                                    ppi_bin = pd.DataFrame(pairs_test, columns=[df_test.columns[0], df_test.columns[1]])
-                                                    ppi_bin.insert(2, 2, pred)
-                                                    
-                                                    # Record PPI prediction probabilities
-                                                    pred_probs = pipe.predict_proba(X_test)
-                                                    ppi_probs = pd.DataFrame(np.append(pairs_test, pred_probs, axis=1), columns=[df_test.columns[0], df_test.columns[1], 2, 3])
-                                                    ppi_probs.drop(columns=[2], inplace=True)
-                                                    
-                                                    df_pred = ppi_probs.copy()
-                                                    df_pred = get_matching_pairs(df_pred, df_test[['Protein_A', 'Protein_B','label']])
-                                                    df_pred.drop(columns=[df_test.columns[0], df_test.columns[1]], inplace=True)
-                                                    df_pred.rename(columns={3: 0, 'label': 1}, inplace=True)
-                                                    df_pred_total = df_pred_total.append(df_pred)
-                                                    
-                                                    # Get performance metricss of binary evaluation (threshold=0.5)
-                                                    tn, fp, fn, tp = metrics.confusion_matrix(y_test, pred).ravel()
-                                                    print('TP = %0.0f \nFP = %0.0f \nTN = %0.0f \nFN = %0.0f'%(tp, fp, tn, fn))
-                                    
-                                                    print('Total_samples = %s'%(tn+fp+fn+tp))
-                                                    # For imbalanced classification metrics
-                                                    if delta != 0.5:
-                                                        accuracy, precision, recall, specificity, f1, mcc = recalculate_metrics_to_imbalance(tp, tn, fp, fn, delta)
-                                                        if np.isnan(accuracy) == False:
-                                                            fold_accuracy.append(accuracy)
-                                                        if np.isnan(precision) == False:
-                                                            fold_precision.append(precision)
-                                                        if np.isnan(recall) == False:
-                                                            fold_recall.append(recall)
-                                                        if np.isnan(specificity) == False:
-                                                            fold_specificity.append(specificity)
-                                                        if np.isnan(f1) == False:
-                                                            fold_f1.append(f1)
-                                                        if np.isnan(mcc) == False:
-                                                            fold_mcc.append(mcc)
-                                                    else:
-                                                        try:
-                                                            accuracy = round((tp+tn)/(tp+fp+tn+fn), 5)
-                                                            fold_accuracy.append(accuracy)
-                                                        except ZeroDivisionError:
-                                                            accuracy = np.nan
-                                                        try:
-                                                            precision = round(tp/(tp+fp), 5)
-                                                            fold_precision.append(precision)
-                                                        except ZeroDivisionError:
-                                                            precision = np.nan
-                                                        try:
-                                                            recall = round(tp/(tp+fn), 5)
-                                                            fold_recall.append(recall)
-                                                        except ZeroDivisionError:
-                                                            recall = np.nan
-                                                        try:
-                                                            specificity = round(tn/(tn+fp), 5)
-                                                            fold_specificity.append(specificity)
-                                                        except ZeroDivisionError:
-                                                            specificity = np.nan
-                                                        try:
-                                                            f1 = round((2*tp)/(2*tp+fp+fn), 5)
-                                                            fold_f1.append(f1)
-                                                        except ZeroDivisionError:
-                                                            f1 = np.nan
-                                                        try:
-                                                            mcc = round( ( ((tp*tn) - (fp*fn)) / np.sqrt((tp+fp)*(tp+fn)*(tn+fp)*(tn+fn)) ), 5)
-                                                            fold_mcc.append(mcc)
-                                                        except ZeroDivisionError:
-                                                            mcc = np.nan
-                                                            
-                                                    print('Accuracy =', accuracy, '\nPrecision =', precision, '\nRecall =', recall, '\nSpecificity =', specificity, '\nF1 =', f1, '\nMCC =', mcc)
-                                                
-                                                    np.seterr(invalid='ignore')
-                                                    # Evaluate k-fold performance and adjust for hypothetical imbalance
-                                                    precision, recall, thresholds = metrics.precision_recall_curve(df_pred[1], df_pred[0])
-                                                    if delta != 0.5:
-                                                        precision = recalculate_precision(df_pred, precision, thresholds, delta)
-                                                    fpr, tpr, __ = metrics.roc_curve(df_pred[1], df_pred[0])
-                                                    if delta == 0.5:
-                                                        pr_auc = metrics.average_precision_score(df_pred[1], df_pred[0])
-                                                    else:
-                                                        pr_auc = metrics.auc(recall, precision)
-                                                    roc_auc = metrics.roc_auc_score(df_pred[1], df_pred[0])
-                                                    
-                                                    print('AUC_ROC = %0.5f'%roc_auc, '\nAUC_PR = %0.5f'%pr_auc)
-                                                    
-                                                    # Add k-fold performance for overall average performance
-                                                    tprs[fold] = tpr
-                                                    fprs[fold] = fpr
-                                                    roc_aucs[fold] = roc_auc
-                                                    precisions[fold] = precision
-                                                    recalls[fold] = recall
-                                                    pr_aucs[fold] = pr_auc
-                                                
-                                                    fold += 1
-                                                
-                                                # Get total performance from all PPI predictions (concatenated k-fold tested subsets)
-                                                precision, recall, thresholds = metrics.precision_recall_curve(df_pred_total[1], df_pred_total[0])
-                                                if delta != 0.5:
-                                                    precision = recalculate_precision(df_pred_total, precision, thresholds, delta)
-                                                fpr, tpr, __ = metrics.roc_curve(df_pred_total[1], df_pred_total[0])
-                                                if delta == 0.5:
-                                                    pr_auc = metrics.average_precision_score(df_pred_total[1], df_pred_total[0])
-                                                else:
-                                                    pr_auc = metrics.auc(recall, precision)
-                                                roc_auc = metrics.roc_auc_score(df_pred_total[1], df_pred_total[0])
-                                                
-                                                if df_pred_total[0].min() >= 0 and df_pred_total[0].max() <= 1:
-                                                    evaluation = ('accuracy = %.5f (+/- %.5f)'%(np.mean(fold_accuracy), np.std(fold_accuracy))
-                                                                  + '\nprecision = %.5f (+/- %.5f)'%(np.mean(fold_precision), np.std(fold_precision)) 
-                                                                  + '\nrecall = %.5f (+/- %.5f)'%(np.mean(fold_recall), np.std(fold_recall)) 
-                                                                  + '\nspecificity = %.5f (+/- %.5f)'%(np.mean(fold_specificity), np.std(fold_specificity)) 
-                                                                  + '\nf1 = %.5f (+/- %.5f)'%(np.mean(fold_f1), np.std(fold_f1)) 
-                                                                  + '\nmcc = %.5f (+/- %.5f)'%(np.mean(fold_mcc), np.std(fold_mcc))
-                                                                  + '\nroc_auc = %.5f (+/- %.5f)' % (np.mean(np.fromiter(roc_aucs.values(), dtype=float)), np.std(np.fromiter(roc_aucs.values(), dtype=float)))
-                                                                  + '\npr_auc = %.5f (+/- %.5f)' % (np.mean(np.fromiter(pr_aucs.values(), dtype=float)), np.std(np.fromiter(pr_aucs.values(), dtype=float)))
-                                                                  + '\nroc_auc_overall = %.5f' % (roc_auc)
-                                                                  + '\npr_auc_overall = %.5f' % (pr_auc)
-                                                                  + '\n')
-                                                else:
-                                                    evaluation = ('roc_auc = %.5f (+/- %.5f)' % (np.mean(np.fromiter(roc_aucs.values(), dtype=float)), np.std(np.fromiter(roc_aucs.values(), dtype=float)))
-                                                                  + '\npr_auc = %.5f (+/- %.5f)' % (np.mean(np.fromiter(pr_aucs.values(), dtype=float)), np.std(np.fromiter(pr_aucs.values(), dtype=float)))
-                                                                  + '\nroc_auc_overall = %.5f' % (roc_auc)
-                                                                  + '\npr_auc_overall = %.5f' % (pr_auc)
-                                                                  + '\n')  
-                                                print('\n===== EVALUATION =====')
-                                                print(evaluation)
-                                                #performance = pd.DataFrame(data={'precision': pd.Series(fold_precision, dtype=float), 'recall': pd.Series(fold_recall, dtype=float), 'specificity': pd.Series(fold_specificity, dtype=float), 'f1': pd.Series(fold_f1, dtype=float), 'mcc': pd.Series(fold_mcc, dtype=float), 'auc_pr': pd.Series(np.fromiter(pr_aucs.values(), dtype=float), dtype=float), 'auc_roc': pd.Series(np.fromiter(roc_aucs.values(), dtype=float), dtype=float)}, dtype=float)
-                                                #overall_curves = pd.DataFrame(data={'precision': pd.Series(precision, dtype=float), 'recall': pd.Series(recall, dtype=float), 'fpr': pd.Series(fpr, dtype=float), 'tpr': pd.Series(tpr, dtype=float)}, dtype=float)
-                                                
-                                                # Interpolate k-fold curves for overall std plotting
-                                                interp_precisions = {}
-                                                #pr_auc_interp = {}
-                                                for i in recalls.keys():
-                                                    interp_precision = np.interp(recall, recalls[i], precisions[i], period=precision.shape[0]/precisions[i].shape[0])
-                                                    interp_precisions[i] = interp_precision
-                                                    #pr_auc_interp[i] = pr_aucs[i]
-                                                df_interp_precisions = pd.DataFrame(data=interp_precisions)
-                                                df_interp_precisions.insert(df_interp_precisions.shape[1], 'mean', df_interp_precisions.mean(axis=1))
-                                                df_interp_precisions.insert(df_interp_precisions.shape[1], 'std', df_interp_precisions.std(axis=1))
-                                                
-                                                # Interpolate k-fold curves for overall std plotting
-                                                interp_tprs = {}
-                                                #roc_auc_interp = {}
-                                                for i in fprs.keys():
-                                                    interp_tpr = np.interp(fpr, fprs[i], tprs[i], period=tpr.shape[0]/tprs[i].shape[0])
-                                                    interp_tprs[i] = interp_tpr
-                                                    #roc_auc_interp[i] = roc_aucs[i]
-                                                df_interp_tprs = pd.DataFrame(data=interp_tprs)
-                                                df_interp_tprs.insert(df_interp_tprs.shape[1], 'mean', df_interp_tprs.mean(axis=1))
-                                                df_interp_tprs.insert(df_interp_tprs.shape[1], 'std', df_interp_tprs.std(axis=1))
-                                                    
-                                                if pr_auc > best_auPR:
-                                                    best_auPR = pr_auc
-                                                    best = "\n ====== BEST core params: boost=%s rate=%s leaves=%s n_estimators=%s min_data_in_leaf=%s max_depth=%s smooth=%s l1=%s l2=%s gain=%s ====== \n"%(boost, rate, leaves, n, x, d, s, l1, l2, g)
-                                                    print(best)
-                                                    print('\npr_auc=%.4f (+/- %.4f)' % (np.mean(np.fromiter(pr_aucs.values(), dtype=float)), np.std(np.fromiter(pr_aucs.values(), dtype=float))))
-                                                    precs.append(precision)
-                                                    recs.append(recall)
-                                                    labs.append('AUC=%s boost=%s rate=%s leaves=%s trees=%s min_data=%s max_depth=%s smooth=%s l1=%s l2=%s gain=%s '%(round(best_auPR,4), boost, rate, leaves, n, x, d, s, l1, l2, g))
-                                                    
-                                                else:
-                                                    print("Tested core params: boost %s rate %s leaves %s estimators %s min_data %s max_depth %s smooth %s l1 %s l2 %s gain %s\n"%(boost, rate, leaves, n, x, d, s, l1, l2, g))
-                                            except Exception as e:
-                                                print("\n *** Could not test core params: boost %s rate %s leaves %s estimators %s min_data %s max_dapth %s smooth %s l1 %s l2 %s gain %s *** \n"%(boost, rate, leaves, n, x, d, s, l1, l2, g))
-                                                print(e)
-                                                continue
+    folds = load_cv_folds(train, test, k=k)
+    names = [p for p in grid.keys() if p != 'n_estimators']
+    configs = [dict(zip(names, values), n_estimators=n) for values in itertools.product(*[grid[p] for p in names]) for n in grid['n_estimators']]
+    # Probabilities predicted for each fold of each configuration (index of configs)
+    probs = {c: {} for c in range(len(configs))}
+    candidates = list(range(len(configs)))
+    
+    processes = processes if processes > 0 else os.cpu_count()
+    with multiprocessing.Pool(processes, initializer=init_search_worker, initargs=(folds, max(1, os.cpu_count() // processes))) as pool:
+        n_folds = 1
+        while True:
+            # Group candidates sharing all params but n_estimators into one task per fold not yet evaluated
+            groups = {}
+            for c in candidates:
+                params = {p: configs[c][p] for p in names}
+                groups.setdefault(tuple(sorted(params.items())), (params, []))[1].append(c)
+            tasks, keys = [], []
+            for params, group in groups.values():
+                for i in range(0, n_folds):
+                    if i not in probs[group[0]]:
+                        tasks.append((params, tuple(sorted(set(configs[c]['n_estimators'] for c in group))), i))
+                        keys.append((group, i))
+            print('Evaluating %s configurations on %s folds (%s fits)...'%(len(candidates), n_folds, len(tasks)))
+            for (group, i), predictions in zip(keys, pool.imap(fit_search_task, tasks, chunksize=max(1, len(tasks) // (processes*16)))):
+                for c in group:
+                    probs[c][i] = predictions[configs[c]['n_estimators']]
+            
+            # Rank candidates by AUPR of predictions on evaluated folds
+            labels = np.concatenate([folds[i]['y_test'] for i in range(0, n_folds)])
+            pr_aucs = {c: get_pr_auc(labels, np.concatenate([probs[c][i] for i in range(0, n_folds)]), d=delta) for c in candidates}
+            candidates = sorted(candidates, key=lambda c: -pr_aucs[c])
+            print('\tBest AUPR = %.5f %s'%(pr_aucs[candidates[0]], configs[candidates[0]]))
+            if n_folds == k and len(candidates) == 1:
+                break
+            # Keep best 1/eta (at least 1) and drop predictions of others
+            for c in candidates[max(1, len(candidates) // eta):]:
+                del probs[c]
+            candidates = candidates[:max(1, len(candidates) // eta)]
+            n_folds = min(k, n_folds*eta)
+    
+    best, best_auPR = configs[candidates[0]], pr_aucs[candidates[0]]
+    fold_pr_aucs = [get_pr_auc(folds[i]['y_test'], probs[candidates[0]][i], d=delta) for i in range(0, k)]
+    print("\n ====== BEST params: %s ====== "%best)
+    print('pr_auc_overall = %.5f\npr_auc = %.5f (+/- %.5f)'%(best_auPR, np.mean(fold_pr_aucs), np.std(fold_pr_aucs)))
     print('TIME = %s seconds'%(time.time() - t_start))
-    
-    for i in range(0, len(precs)):
-        plt.plot(recs[i], precs[i], label=labs[i])
-    plt.xlabel('Recall')
-    plt.ylabel('Precision') 
-    plt.xlim([-0.05, 1.05])
-    plt.ylim([-0.05, 1.05])
-    plt.title("Precision-Recall Curve")
-    plt.legend(loc='best', handlelength=0, prop={'size': 6})
+    return best, best_auPR
 
 # Return training set,
 # c1_test (both proteins in pairs are found in training set),
@@ -1671,7 +1402,7 @@ def run_classifier(train, test, delta=0.5, clf=None):
         print('Total_samples = %s'%(tn+fp+fn+tp))
         # For imbalanced classification metrics
         if delta != 0.5:
-            accuracy, precision, recall, specificity, f1, mcc = recalculate_metrics_to_imbalance(tp, tn, fp, fn, delta)
+            accuracy, precision, recall, specificity, f1, mcc = [round(m[0], 5) for m in get_imbalanced_metrics(tn, fp, fn, tp, [delta])]
             if np.isnan(accuracy) == False:
                 fold_accuracy.append(accuracy)
             if np.isnan(precision) == False:
@@ -1720,15 +1451,11 @@ def run_classifier(train, test, delta=0.5, clf=None):
     
         np.seterr(invalid='ignore')
         # Evaluate k-fold performance and adjust for hypothetical imbalance
-        precision, recall, thresholds = metrics.precision_recall_curve(df_pred[1], df_pred[0])
-        if delta != 0.5:
-            precision = recalculate_precision(df_pred, precision, thresholds, delta)
-        fpr, tpr, __ = metrics.roc_curve(df_pred[1], df_pred[0])
-        if delta == 0.5:
-            pr_auc = metrics.average_precision_score(df_pred[1], df_pred[0])
-        else:
-            pr_auc = metrics.auc(recall, precision)
-        roc_auc = metrics.roc_auc_score(df_pred[1], df_pred[0])
+        curves = Curves(df_pred[1], df_pred[0])
+        precision, recall, thresholds = curves.pr(delta)
+        fpr, tpr, __ = curves.roc()
+        pr_auc = curves.pr_auc(delta)
+        roc_auc = curves.roc_auc()
         
         print('AUC_ROC = %0.5f'%roc_auc, '\nAUC_PR = %0.5f'%pr_auc)
         
@@ -1743,15 +1470,11 @@ def run_classifier(train, test, delta=0.5, clf=None):
         fold += 1
     
     # Get total performance from all PPI predictions (concatenated k-fold tested subsets)
-    precision, recall, thresholds = metrics.precision_recall_curve(df_pred_total[1], df_pred_total[0])
-    if delta != 0.5:
-        precision = recalculate_precision(df_pred_total, precision, thresholds, delta)
-    fpr, tpr, __ = metrics.roc_curve(df_pred_total[1], df_pred_total[0])
-    if delta == 0.5:
-        pr_auc = metrics.average_precision_score(df_pred_total[1], df_pred_total[0])
-    else:
-        pr_auc = metrics.auc(recall, precision)
-    roc_auc = metrics.roc_auc_score(df_pred_total[1], df_pred_total[0])
+    curves = Curves(df_pred_total[1], df_pred_total[0])
+    precision, recall, thresholds = curves.pr(delta)
+    fpr, tpr, __ = curves.roc()
+    pr_auc = curves.pr_auc(delta)
+    roc_auc = curves.roc_auc()
     
     if df_pred_total[0].min() >= 0 and df_pred_total[0].max() <= 1:
         evaluation = ('accuracy = %.5f (+/- %.5f)'%(np.mean(fold_accuracy), np.std(fold_accuracy))
@@ -1851,7 +1574,8 @@ clf.fit(X_train_scaled, y_train, feature_name=df_train.columns[2:-1].tolist())
 plot_importance(clf, title='RP-CME Feature Importance', ignore_zero=True, importance_type='split', xlabel='Number of Times Used to Build Model')
 plot_split_value_histogram(clf, 'Score_A_in_B')
 
-def compile_preds(train, test, probability=0.8):
+# Predictions of 10 fits on train for test PPIs with probability >= probability, training data binned once (cached in directory cache if given)
+def compile_preds(train, test, probability=0.8, cache=None):
     
     # Load data
     df_train = pd.read_csv(train, delim_whitespace=True)
@@ -1868,19 +1592,20 @@ def compile_preds(train, test, probability=0.8):
     #y_test = np.array(df_test[df_test.columns[-1]])
     
     # No random_state
+    clf = LGBMClassifier(
+                        boosting_type='goss', 
+                        learning_rate=0.1, 
+                        num_leaves=50,
+                        max_depth=10, 
+                        min_data_in_leaf=50,
+                        n_estimators=150,
+                        path_smooth=0.1,
+                        )
+    # Scaled training data binned once for all fits
+    binned = BinnedDataset(X_train, y_train, clf, scaler=StandardScaler().fit(X_train), cache=cache)
     df_preds = pd.DataFrame()
     for i in range(0, 10):
-        clf = LGBMClassifier(
-                            boosting_type='goss', 
-                            learning_rate=0.1, 
-                            num_leaves=50,
-                            max_depth=10, 
-                            min_data_in_leaf=50,
-                            n_estimators=150,
-                            path_smooth=0.1,
-                            )
-        pipe = Pipeline([('scaler', StandardScaler()), ('metaclf', clf)])
-        pipe.fit(X_train, y_train)
+        pipe = BinnedLGBMClassifier(clf, binned).fit()
         
         pred_probs = pipe.predict_proba(X_test)
         ppi_probs = pd.DataFrame(np.append(pairs_test, pred_probs, axis=1), columns=[df_test.columns[0], df_test.columns[1], 2, 3])
@@ -1890,6 +1615,13 @@ def compile_preds(train, test, probability=0.8):
         df_preds.sort_values(by=df_preds.columns[-1], ascending=False, inplace=True)
         df_preds.reset_index(drop=True, inplace=True)
 '''
+# Curves of all ratios from one sort of the predictions (labels and scores of tested PPIs)
+sweep = Curves(labels, scores).sweep([0.5, 0.1, 0.01, 0.001])
+precision_05, recall_05, threshold_05 = sweep[0.5]['precision'], sweep[0.5]['recall'], sweep[0.5]['thresholds']
+precision_01, recall_01, threshold_01 = sweep[0.1]['precision'], sweep[0.1]['recall'], sweep[0.1]['thresholds']
+precision_001, recall_001, threshold_001 = sweep[0.01]['precision'], sweep[0.01]['recall'], sweep[0.01]['thresholds']
+precision_0001, recall_0001, threshold_0001 = sweep[0.001]['precision'], sweep[0.001]['recall'], sweep[0.001]['thresholds']
+
 # PLOTTING THRESHOLD VS. PRECISON
 plt.plot(threshold_05, precision_05[:len(threshold_05)], label='ratio = 1:1')
 plt.plot(threshold_01, precision_01[:len(threshold_01)], label='ratio = 1:10')
@@ -1917,8 +1649,12 @@ plt.legend(prop={'size': 8})
 '''
 
 def get_top_interactors(preds, known_positives, threshold=0.9):
-    df = preds.copy()
-    df_top = df[df[2] >= threshold]
+    # preds can be a DataFrame or a ScoreMatrix (only pairs above threshold are read)
+    if isinstance(preds, ScoreMatrix):
+        df_top = preds.to_df(threshold=threshold)
+    else:
+        df = preds.copy()
+        df_top = df[df[2] >= threshold]
     df_top_new = df_top.merge(known_positives, on=[0,1], how='outer')
     df_top_new = df_top_new[df_top_new['2_y'].isna()]
     df_top_new.drop(columns=['2_y'], inplace=True)
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Description:
+    Bootstrap confidence intervals of AUC_ROC and AUC_PR of PPI predictions.
+
+    Scores are sorted once. Each resample (PPIs drawn with replacement) is a row of a matrix of how many times each
+    PPI is drawn, so the weighted counts of true and false positives above each distinct score, and from them the AUCs
+    (same as ppi_metrics.Curves of the resampled PPIs), are computed for a chunk of resamples at once with cumulative sums
+    over the matrix. Chunks of resamples can be computed by a pool of processes, each chunk has its own random seed so
+    resamples are the same whatever the number of processes.
+
+    e.g. for labels (0 or 1) and scores:
+        bootstrap = Bootstrap(labels, scores)
+        roc_aucs, pr_aucs = bootstrap.get_aucs(1000, delta=0.5)
+        low, high = get_confidence_interval(pr_aucs, level=0.95)
+"""
+
+__all__ = ['Bootstrap',
+           'get_confidence_interval',
+           ]
+
+import multiprocessing
+import numpy as np
+
+# Number of elements of each resamples matrix (resamples x PPIs), limits memory of a chunk of resamples
+CHUNK_ELEMENTS = 2**22
+
+
+def get_confidence_interval(values, level=0.95):
+    # Percentile interval of bootstrapped values at confidence level, resamples of only one class (nan) are ignored
+    return tuple(np.nanpercentile(values, [100*(1 - level)/2, 100*(1 + level)/2]))
+
+def init_bootstrap_worker(bootstrap):
+    global BOOTSTRAP
+    BOOTSTRAP = bootstrap
+
+def get_chunk_aucs(task):
+    # AUCs of a chunk of resamples, task is (random seed, number of resamples, delta)
+    seed, n_resamples, delta = task
+    return BOOTSTRAP.get_resample_aucs(BOOTSTRAP.get_resamples(n_resamples, seed), delta)
+
+
+class Bootstrap(object):
+    # Scores of PPIs with labels (1 for positives) sorted once for bootstrapped AUCs
+    def __init__(self, labels, scores):
+        labels = np.asarray(labels).ravel() == 1
+        scores = np.asarray(scores).ravel()
+        if scores.dtype == object:
+            scores = scores.astype(float)
+        order = np.argsort(scores, kind='mergesort')[::-1]
+        scores = scores[order]
+        self.positives = labels[order]
+        # Last PPI of each distinct score, counts are of PPIs scored at least that score
+        self.last = np.r_[np.flatnonzero(np.diff(scores)), len(scores) - 1]
+
+    def get_resamples(self, n_resamples, seed=None):
+        # Matrix of times each PPI (in sorted order) is drawn in each of n_resamples resamples of all PPIs with replacement
+        rng = np.random.default_rng(seed)
+        n = len(self.positives)
+        drawn = rng.integers(0, n, size=(n_resamples, n)) + (np.arange(n_resamples)*n)[:, np.newaxis]
+        return np.bincount(drawn.ravel(), minlength=n_resamples*n).reshape(n_resamples, n)
+
+    def get_resample_aucs(self, weights, delta=0.5):
+        # AUC_ROC and AUC_PR (average precision if delta is 0.5, else area under PR curve adjusted to imbalance delta)
+        # of each resample, weights is matrix of times each PPI is drawn in each resample (see get_resamples)
+        tps = np.cumsum(weights*self.positives, axis=1)[:, self.last].astype(float)
+        fps = np.cumsum(weights, axis=1)[:, self.last] - tps
+        positives, negatives = tps[:, -1:], fps[:, -1:]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            # Trapezoids of ROC curve
+            tps_previous = np.c_[np.zeros(len(tps)), tps[:, :-1]]
+            roc_aucs = np.sum(np.diff(fps, axis=1, prepend=0)*(tps + tps_previous), axis=1) / (2*positives*negatives).ravel()
+            recall_step = np.diff(tps / positives, axis=1, prepend=0)
+            if delta == 0.5:
+                # Average precision, as Curves.average_precision
+                precision = np.divide(tps, tps + fps, out=np.zeros_like(tps), where=(tps + fps != 0))
+                pr_aucs = np.sum(recall_step*precision, axis=1)
+            else:
+                # Trapezoids of PR curve adjusted to imbalance, from (recall 0, precision 1) as Curves.pr_auc
+                d = 2*delta - 1
+                lpp = tps / positives
+                lnn = (negatives - fps) / negatives
+                precision = (lpp*(1 + d)) / ( (lpp*(1 + d)) + ((1 - lnn)*(1 - d)) )
+                # Scores above which no PPI is drawn are the start of the curve
+                precision[(tps + fps) == 0] = 1
+                precision_previous = np.c_[np.ones(len(tps)), precision[:, :-1]]
+                pr_aucs = np.sum(recall_step*(precision + precision_previous), axis=1) / 2
+            # Undefined for resamples of only one class
+            roc_aucs[positives.ravel()*negatives.ravel() == 0] = np.nan
+            pr_aucs[positives.ravel()*negatives.ravel() == 0] = np.nan
+        return roc_aucs, pr_aucs
+
+    def get_aucs(self, n_resamples=1000, delta=0.5, seed=0, jobs=1):
+        # AUC_ROC and AUC_PR of n_resamples resamples, in chunks of resamples computed by a pool of processes if jobs > 1
+        size = max(1, CHUNK_ELEMENTS // max(1, len(self.positives)))
+        sizes = [min(size, n_resamples - i) for i in range(0, n_resamples, size)]
+        seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+        tasks = [(s, n, delta) for s, n in zip(seeds, sizes)]
+        if jobs <= 1 or len(tasks) <= 1:
+            init_bootstrap_worker(self)
+            aucs = [get_chunk_aucs(task) for task in tasks]
+        else:
+            with multiprocessing.Pool(min(jobs, len(tasks)), initializer=init_bootstrap_worker, initargs=(self,)) as pool:
+                aucs = pool.map(get_chunk_aucs, tasks)
+        return np.concatenate([a[0] for a in aucs]), np.concatenate([a[1] for a in aucs])
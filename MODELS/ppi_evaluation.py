@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Description:
+    Evaluation of PPI predictions files (e.g. cross-validation folds) against labelled PPIs by a pool of processes.
+
+    Each task is a predictions file and its labels file. A worker reads the predictions (text file, score matrix,
+    or streamed in chunks keeping only labelled PPIs), matches them to the labels, and computes the confusion counts
+    at 0.5, curves and AUCs (and AUC_PR of any further imbalance deltas) from one sort of the scores (ppi_metrics.Curves). Files of all tasks are evaluated
+    concurrently and results are returned in order of tasks, so per-fold results are merged in a fixed order
+    whatever the number of processes.
+"""
+
+__all__ = ['get_fold_files',
+           'read_labels',
+           'read_labelled_scores',
+           'evaluate_folds',
+           ]
+
+import os
+import multiprocessing
+import numpy as np
+import pandas as pd
+from score_matrix import ScoreMatrix, is_score_matrix
+from ppi_pairs import get_matching_pairs, PairIndex
+from ppi_metrics import Curves
+
+# Labelled PPIs read by each process, by filename
+LABELS = {}
+
+
+def get_fold_files(scores):
+    # Predictions files of scores, a directory of cross-validation files or a single test file
+    if os.path.isdir(scores):
+        files = os.listdir(path=scores)
+        files = [ x for x in files if 'prediction' in x and '.pos' not in x and '.neg' not in x and '.proteins.txt' not in x ]
+        files.sort()
+        return [scores + x for x in files]
+    return [scores]
+
+def read_labels(filename, index=False):
+    # Labelled PPIs <ProteinA> <ProteinB> <label> read once per process, with their PairIndex if index
+    if filename not in LABELS:
+        LABELS[filename] = {'df': pd.read_csv(filename, delim_whitespace=True, header=None), 'index': None}
+    if index and LABELS[filename]['index'] is None:
+        LABELS[filename]['index'] = PairIndex(LABELS[filename]['df'])
+    return LABELS[filename]['df'], LABELS[filename]['index']
+
+# Scores of labelled PPIs <score> <label> from predictions file <ProteinA> <ProteinB> <score> read in chunks of chunk_size PPIs,
+# only scores of PPIs in labels (PairIndex of df_labels) are kept, matched as get_matching_pairs in order of labels
+def read_labelled_scores(filename, df_labels, labels, chunk_size=2**20):
+    scores = np.zeros(len(labels.rows))
+    matched = np.zeros(len(labels.rows), dtype=np.int8)
+    dtype = {0: df_labels[0].dtype, 1: df_labels[1].dtype, 2: float}
+    for chunk in pd.read_csv(filename, delim_whitespace=True, header=None, usecols=[0, 1, 2], dtype=dtype, chunksize=chunk_size):
+        rows = labels.get_first_matches(chunk[0].to_numpy(), chunk[1].to_numpy(), matched)
+        scores[rows >= 0] = chunk[2].to_numpy()[rows[rows >= 0]]
+    return pd.DataFrame(data={0: scores[matched > 0], 1: df_labels[2].to_numpy()[labels.rows[matched > 0]]})
+
+def read_fold(filename, labels_filename, stream=False, chunk_size=2**20):
+    # Scores and labels <score> <label> of labelled PPIs of predictions file
+    stream = stream and not is_score_matrix(filename)
+    df_labels, labels = read_labels(labels_filename, index=stream)
+    if stream:
+        # Only scores of labelled PPIs are kept from chunks of predictions, already matched to labels
+        return read_labelled_scores(filename, df_labels, labels, chunk_size)
+    if is_score_matrix(filename):
+        # Only scores of labelled PPIs are read from score matrix
+        df_pred = ScoreMatrix(filename).lookup(df_labels)
+    else:
+        df_pred = pd.read_csv(filename, delim_whitespace=True, header=None)
+
+    # Remove any extra columns if exists, predictions files should be ProteinA ProteinB Score
+    if df_pred.shape[1] > 3:
+        df_pred.drop(columns=df_pred.columns[3:].tolist(), inplace=True)
+
+    # Get matching PPI labels for predictions
+    df_pred = get_matching_pairs(df_pred, df_labels)
+    df_pred.drop(columns=[0, 1], inplace=True)
+    df_pred.rename(columns={'2_x': 0, '2_y': 1}, inplace=True)
+    return df_pred
+
+def init_fold_worker(delta, stream=False, chunk_size=2**20, deltas=()):
+    global FOLD
+    FOLD = {'delta': delta, 'stream': stream, 'chunk_size': chunk_size, 'deltas': deltas}
+    np.seterr(invalid='ignore')
+
+def evaluate_fold(task):
+    # Scores, labels, confusion counts at 0.5 (None if scores are not probabilities, e.g. SPRINT), curves and AUCs
+    # of predictions file adjusted for imbalance delta, and AUC_PR of each imbalance delta of deltas ('sweep'),
+    # task is (predictions filename, labels filename)
+    filename, labels_filename = task
+    df_pred = read_fold(filename, labels_filename, stream=FOLD['stream'], chunk_size=FOLD['chunk_size'])
+    scores, labels = df_pred[0].to_numpy(), df_pred[1].to_numpy()
+    curves = Curves(labels, scores)
+    result = {'filename': filename, 'scores': scores, 'labels': labels, 'confusion': None}
+    if scores.min() >= 0 and scores.max() <= 1:
+        result['confusion'] = curves.confusion(0.5 - 1e-12)
+    result['precision'], result['recall'], __ = curves.pr(FOLD['delta'])
+    result['fpr'], result['tpr'], __ = curves.roc()
+    result['pr_auc'] = curves.pr_auc(FOLD['delta'])
+    result['roc_auc'] = curves.roc_auc()
+    result['sweep'] = {d: pr['pr_auc'] for d, pr in curves.sweep(FOLD['deltas']).items()}
+    return result
+
+def evaluate_folds(tasks, delta, jobs=1, stream=False, chunk_size=2**20, deltas=()):
+    # Results of evaluate_fold for each task (predictions filename, labels filename) in order of tasks,
+    # files are evaluated by a pool of processes if jobs > 1
+    if jobs <= 1 or len(tasks) <= 1:
+        init_fold_worker(delta, stream, chunk_size, deltas)
+        for task in tasks:
+            yield evaluate_fold(task)
+        return
+    with multiprocessing.Pool(min(jobs, len(tasks)), initializer=init_fold_worker, initargs=(delta, stream, chunk_size, deltas)) as pool:
+        for result in pool.imap(evaluate_fold, tasks):
+            yield result
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Description:
+    Evaluation metrics of PPI predictions from a single sort of the scores.
+
+    sklearn's precision_recall_curve, roc_curve, average_precision_score and roc_auc_score each sort the scores
+    again, Curves sorts them once and derives the ROC curve, Precision-Recall curve, average precision, AUCs,
+    confusion counts at any threshold and the prevalence-corrected (imbalanced) precision from the same
+    cumulative counts of true and false positives at each distinct score.
+
+    Curves and areas are the same as sklearn's, e.g. for labels (0 or 1) and scores:
+        curves = Curves(labels, scores)
+        curves.roc()                 # metrics.roc_curve(labels, scores)
+        curves.pr()                  # metrics.precision_recall_curve(labels, scores)
+        curves.pr(delta)             # with prevalence-corrected precision for imbalance delta
+        curves.average_precision()   # metrics.average_precision_score(labels, scores)
+        curves.roc_auc()             # metrics.roc_auc_score(labels, scores)
+        curves.pr_auc(delta)         # average precision if delta is 0.5, else area under imbalanced PR curve
+        curves.confusion(0.5)        # tn, fp, fn, tp of predicting scores >= 0.5 as positives
+        curves.sweep(deltas)         # curves.pr(delta) and curves.pr_auc(delta) of each of deltas in one pass
+
+    get_imbalanced_metrics(tn, fp, fn, tp, deltas) gives metrics at a threshold (confusion counts) for each of deltas at once.
+"""
+
+__all__ = ['Curves',
+           'get_imbalanced_metrics',
+           ]
+
+import numpy as np
+from sklearn import metrics
+
+
+def get_imbalanced_metrics(tn, fp, fn, tp, deltas):
+    # accuracy, precision, recall, specificity, f1, mcc (unrounded) estimated for data of each imbalance delta (positives/total)
+    # of deltas, recall and specificity are unchanged, metrics of the counts as they are for delta 0.5
+    d = 2*np.asarray(deltas, dtype=float) - 1
+    lpp = np.full(d.shape, tp/(tp+fn) if tp+fn else np.nan)
+    lnn = np.full(d.shape, tn/(tn+fp) if tn+fp else np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        accuracy = lpp*((1 + d)/2) + lnn*((1 - d)/2)
+        precision = (lpp*(1 + d)) / ( (lpp*(1 + d)) + ((1 - lnn)*(1 - d)) )
+        f1 = (2*lpp*(1 + d)) / ( ((1+lpp)*(1+d)) + ((1-lnn)*(1-d)) )
+        mcc = (lpp+lnn-1) / np.sqrt((lpp + (1-lnn)*( (1-d)/(1+d) ) )*( lnn + (1-lpp)*( (1+d)/(1-d) ) ))
+        balanced = d == 0
+        accuracy[balanced] = (tp+tn)/(tp+fp+tn+fn) if tp+fp+tn+fn else np.nan
+        precision[balanced] = tp/(tp+fp) if tp+fp else np.nan
+        f1[balanced] = (2*tp)/(2*tp+fp+fn) if 2*tp+fp+fn else np.nan
+        mcc[balanced] = ((tp*tn) - (fp*fn)) / np.sqrt(float((tp+fp)*(tp+fn)*(tn+fp)*(tn+fn)))
+    return accuracy, precision, lpp, lnn, f1, mcc
+
+
+class Curves(object):
+    # Scores of PPIs with labels (1 for positives) sorted once, counts of true and false positives above each distinct score
+    def __init__(self, labels, scores):
+        labels = np.asarray(labels).ravel() == 1
+        scores = np.asarray(scores).ravel()
+        if scores.dtype == object:
+            scores = scores.astype(float)
+        order = np.argsort(scores, kind='mergesort')[::-1]
+        self.scores = scores[order]
+        self.true_positives = np.cumsum(labels[order])
+        # Last PPI of each distinct score, counts are of PPIs scored at least that score
+        last = np.r_[np.flatnonzero(np.diff(self.scores)), len(self.scores) - 1]
+        self.thresholds = self.scores[last]
+        self.tps = self.true_positives[last].astype(float)
+        self.fps = 1 + last - self.tps
+        self.positives = self.tps[-1]
+        self.negatives = self.fps[-1]
+
+    def confusion(self, threshold=0.5):
+        # tn, fp, fn, tp (as metrics.confusion_matrix(...).ravel()) of predicting PPIs with scores >= threshold as positives
+        predicted = np.searchsorted(-self.scores, -threshold, side='right')
+        tp = int(self.true_positives[predicted - 1]) if predicted else 0
+        fp = predicted - tp
+        return int(self.negatives) - fp, fp, int(self.positives) - tp, tp
+
+    def roc(self):
+        # fpr, tpr, thresholds of ROC curve as metrics.roc_curve (drop_intermediate=True)
+        tps, fps, thresholds = self.tps, self.fps, self.thresholds
+        if len(fps) > 2:
+            optimal = np.flatnonzero(np.r_[True, np.logical_or(np.diff(fps, 2), np.diff(tps, 2)), True])
+            tps, fps, thresholds = tps[optimal], fps[optimal], thresholds[optimal]
+        tps, fps, thresholds = np.r_[0, tps], np.r_[0, fps], np.r_[np.inf, thresholds]
+        fpr = fps / fps[-1] if fps[-1] > 0 else np.repeat(np.nan, fps.shape)
+        tpr = tps / tps[-1] if tps[-1] > 0 else np.repeat(np.nan, tps.shape)
+        return fpr, tpr, thresholds
+
+    def pr(self, delta=0.5):
+        # precision, recall, thresholds of Precision-Recall curve as metrics.precision_recall_curve,
+        # precision recalculated for imbalance delta (positives/total) if not 0.5
+        if delta != 0.5:
+            d = 2*delta - 1
+            lpp = self.tps / self.positives
+            lnn = (self.negatives - self.fps) / self.negatives
+            with np.errstate(invalid='ignore', divide='ignore'):
+                precision = (lpp*(1 + d)) / ( (lpp*(1 + d)) + ((1 - lnn)*(1 - d)) )
+        else:
+            precision = np.zeros_like(self.tps)
+            np.divide(self.tps, self.tps + self.fps, out=precision, where=(self.tps + self.fps != 0))
+        recall = self.tps / self.positives if self.positives else np.ones_like(self.tps)
+        # Reversed so recall is decreasing
+        return np.r_[precision[::-1], 1], np.r_[recall[::-1], 0], self.thresholds[::-1]
+
+    def average_precision(self):
+        # As metrics.average_precision_score
+        precision, recall, __ = self.pr()
+        return -np.sum(np.diff(recall) * precision[:-1])
+
+    def roc_auc(self):
+        # As metrics.roc_auc_score
+        if not self.positives or not self.negatives:
+            raise ValueError('Only one class present in y_true. ROC AUC score is not defined in that case.')
+        fpr, tpr, __ = self.roc()
+        return metrics.auc(fpr, tpr)
+
+    def pr_auc(self, delta=0.5):
+        # Average precision for balanced data (delta 0.5), else area under Precision-Recall curve adjusted to imbalance delta
+        if delta == 0.5:
+            return self.average_precision()
+        precision, recall, __ = self.pr(delta)
+        return metrics.auc(recall, precision)
+
+    def sweep(self, deltas):
+        # precision, recall, thresholds (as pr(delta)) and area (as pr_auc(delta)) for each imbalance delta of deltas,
+        # precisions of all deltas computed at once from the same counts
+        deltas = np.asarray(deltas, dtype=float)
+        d = 2*deltas[:, np.newaxis] - 1
+        lpp = self.tps / self.positives
+        lnn = (self.negatives - self.fps) / self.negatives
+        with np.errstate(invalid='ignore', divide='ignore'):
+            precisions = (lpp*(1 + d)) / ( (lpp*(1 + d)) + ((1 - lnn)*(1 - d)) )
+        recall = self.tps / self.positives if self.positives else np.ones_like(self.tps)
+        recall, thresholds = np.r_[recall[::-1], 0], self.thresholds[::-1]
+        sweep = {}
+        for delta, precision in zip(deltas.tolist(), precisions):
+            if delta == 0.5:
+                precision, __, __ = self.pr()
+                pr_auc = -np.sum(np.diff(recall) * precision[:-1])
+            else:
+                precision = np.r_[precision[::-1], 1]
+                pr_auc = metrics.auc(recall, precision)
+            sweep[delta] = {'precision': precision, 'recall': recall, 'thresholds': thresholds, 'pr_auc': pr_auc}
+        return sweep
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Description:
+    Matching of PPIs between DataFrames <Protein_A> <Protein_B> <...> by integer pair keys.
+
+    Protein IDs of one DataFrame (the smaller, e.g. labels) are interned once and each of its PPIs is packed
+    into a uint64 key (code of A in the upper 32 bits, code of B in the lower) in a PairIndex, so PPIs of the other
+    DataFrame are matched with a hashed join of integer keys instead of a merge of object (string) columns,
+    and can be matched in chunks (e.g. streaming a predictions file) keeping only the PPIs found.
+    get_matching_pairs returns the same PPIs, columns and order as the previous merge of one DataFrame with
+    the other DataFrame and its reversed copy (A-B is B-A).
+"""
+
+__all__ = ['pack_pairs',
+           'PairIndex',
+           'get_matching_pairs',
+           ]
+
+import numpy as np
+import pandas as pd
+
+
+def pack_pairs(codes_a, codes_b, canonical=False):
+    # uint64 keys of pairs of protein codes (A in upper 32 bits), with lower code first if canonical (A-B is B-A)
+    codes_a, codes_b = np.asarray(codes_a, dtype=np.uint64), np.asarray(codes_b, dtype=np.uint64)
+    if canonical:
+        codes_a, codes_b = np.minimum(codes_a, codes_b), np.maximum(codes_a, codes_b)
+    return (codes_a << np.uint64(32)) | codes_b
+
+
+class PairIndex(object):
+    # Hashed uint64 keys of PPIs (first two columns) of df, first occurrence of each PPI in order of df,
+    # PPIs of other DataFrames (e.g. predictions read in chunks) are looked up without being kept
+    def __init__(self, df):
+        proteins_a, proteins_b = df[df.columns[0]].to_numpy(), df[df.columns[1]].to_numpy()
+        self.proteins = pd.Index(pd.unique(np.concatenate([proteins_a, proteins_b])))
+        keys = pack_pairs(self.proteins.get_indexer(proteins_a), self.proteins.get_indexer(proteins_b))
+        # Rows of df indexed
+        self.rows = np.flatnonzero(~pd.Index(keys).duplicated())
+        self.index = pd.Index(keys[self.rows])
+
+    def get_positions(self, proteins_a, proteins_b):
+        # Position in index of each PPI A-B, -1 if not found
+        codes_a, codes_b = self.proteins.get_indexer(proteins_a), self.proteins.get_indexer(proteins_b)
+        known = np.flatnonzero((codes_a >= 0) & (codes_b >= 0))
+        positions = np.full(len(codes_a), -1)
+        positions[known] = self.index.get_indexer(pack_pairs(codes_a[known], codes_b[known]))
+        return positions
+
+    def get_first_matches(self, proteins_a, proteins_b, matched=None):
+        # Row of first PPI matching each indexed PPI as A-B, else first matching as B-A (A-B is B-A), -1 if not found
+        # matched is updated to 2 for matches as A-B and 1 for B-A, so matches of earlier chunks are only replaced by A-B
+        matched = np.zeros(len(self.rows), dtype=np.int8) if matched is None else matched
+        rows = np.full(len(self.rows), -1)
+        for orientation, positions in [(2, self.get_positions(proteins_a, proteins_b)), (1, self.get_positions(proteins_b, proteins_a))]:
+            found = np.flatnonzero(positions >= 0)[::-1]
+            found = found[matched[positions[found]] < orientation]
+            # Reversed so first match of each PPI is written last
+            rows[positions[found]] = found
+            matched[positions[found]] = orientation
+        return rows
+
+
+def get_matching_pairs(df_1, df_2):
+    # Get matches using PPI ordering of smaller df
+    if df_1.shape > df_2.shape:
+        df_test, df_train = df_1, df_2
+    else:
+        df_test, df_train = df_2, df_1
+    on = [df_test.columns[0], df_test.columns[1]]
+
+    # PPIs of smaller df hashed once, matched in its order
+    pairs = PairIndex(df_train[on])
+    rows_test = pairs.get_first_matches(df_test[on[0]].to_numpy(), df_test[on[1]].to_numpy())
+    rows_train, rows_test = pairs.rows[rows_test >= 0], rows_test[rows_test >= 0]
+
+    # Returns as <ProteinA> <ProteinB> <label> <score>
+    left = df_train.iloc[rows_train].reset_index(drop=True)
+    right = df_test.drop(columns=on).iloc[rows_test].reset_index(drop=True)
+    return left.merge(right, left_index=True, right_index=True).reset_index(drop=True)
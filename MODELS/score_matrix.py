@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Description:
+    Binary score matrix format for all-to-all PPI predictions, converted once from a whitespace-separated
+    <proteinA> <proteinB> <score> file and then opened as a memory map instead of re-parsing text.
+
+    Format:
+        <name>.npy: N x N float32 matrix of scores (np.save format), NaN where a pair has no prediction.
+                    Matrix is symmetric so each protein's scores are one contiguous row,
+                    each pair is listed once from the upper triangle (including self-interactions on the diagonal).
+        <name>.proteins.txt: protein ID of each row/column, one per line (sidecar)
+
+    Opening a ScoreMatrix only reads the protein IDs, rows and pairs are read from the memory map when accessed.
+    Redundant pairs (A-B and B-A) are kept once with the highest score, as remove_redundant_pairs does.
+
+    Input arguements (converter):
+        -p: <str> path to all-to-all PPI predictions file (.tsv)
+        -o: <str> path of score matrix to create (.npy), default is predictions path with .npy extension
+        -c: <int> number of predictions read per chunk, default 1000000
+
+    Output files:
+        <name>.npy score matrix and <name>.proteins.txt sidecar
+"""
+
+__all__ = ['ScoreMatrix',
+           'convert_predictions',
+           'is_score_matrix',
+           ]
+
+import os
+import argparse
+import time
+import numpy as np
+import pandas as pd
+
+
+class ScoreMatrix(object):
+    # All-to-all scores memory-mapped read-only from filename (.npy) with protein IDs from its sidecar
+    def __init__(self, filename):
+        self.filename = filename
+        self.scores = np.load(filename, mmap_mode='r')
+        with open(get_sidecar(filename)) as f:
+            self.proteins = pd.Index(f.read().splitlines())
+
+    def __len__(self):
+        return len(self.proteins)
+
+    def __contains__(self, protein):
+        return protein in self.proteins
+
+    def get_codes(self, proteins):
+        # Row of each protein, -1 if not in matrix
+        return self.proteins.get_indexer(proteins)
+
+    def get_row(self, protein):
+        # Scores of protein with all proteins (view of memory map, not copied)
+        return self.scores[self.proteins.get_loc(protein)]
+
+    def get_score(self, proteinA, proteinB):
+        # Score of PPI, NaN if no prediction
+        if proteinA not in self.proteins or proteinB not in self.proteins:
+            return np.nan
+        return self.scores[self.proteins.get_loc(proteinA), self.proteins.get_loc(proteinB)]
+
+    def get_scores(self, proteins_a, proteins_b):
+        # Scores of PPIs given as arrays of protein IDs, NaN if no prediction
+        codes_a, codes_b = self.get_codes(proteins_a), self.get_codes(proteins_b)
+        found = (codes_a >= 0) & (codes_b >= 0)
+        scores = np.full(len(codes_a), np.nan, dtype=np.float32)
+        scores[found] = self.scores[codes_a[found], codes_b[found]]
+        return scores
+
+    def get_ranking(self, protein):
+        # Partners of protein ranked by descending score (without missing predictions) as a Series of scores
+        row = self.get_row(protein)
+        order = np.argsort(-row, kind='stable')
+        order = order[~np.isnan(row[order])]
+        return pd.Series(row[order], index=self.proteins[order])
+
+    def lookup(self, df_pairs):
+        # Predictions for pairs in first 2 columns of df_pairs (e.g. labelled PPIs) as <proteinA> <proteinB> <score>,
+        # pairs without a prediction are dropped
+        df = df_pairs[df_pairs.columns[:2]].copy()
+        df.columns = [0, 1]
+        df[2] = self.get_scores(df[0].to_numpy(), df[1].to_numpy())
+        df = df[df[2].notna()].reset_index(drop=True)
+        return df
+
+    def to_df(self, threshold=None, block_rows=1024):
+        # All predicted pairs (upper triangle) as <proteinA> <proteinB> <score>, optionally only scores >= threshold
+        # Read block_rows rows of the matrix at a time
+        codes_a, codes_b, scores = [], [], []
+        for start in range(0, len(self), block_rows):
+            block = np.asarray(self.scores[start:start + block_rows])
+            rows, cols = np.nonzero(~np.isnan(block) if threshold is None else block >= threshold)
+            upper = cols >= rows + start
+            codes_a.append(rows[upper] + start)
+            codes_b.append(cols[upper])
+            scores.append(block[rows[upper], cols[upper]])
+        codes_a, codes_b = np.concatenate(codes_a or [[]]).astype(np.int64), np.concatenate(codes_b or [[]]).astype(np.int64)
+        return pd.DataFrame({0: self.proteins[codes_a], 1: self.proteins[codes_b], 2: np.concatenate(scores or [[]]).astype(np.float32)})
+
+def get_sidecar(filename):
+    return filename.rsplit('.', 1)[0] + '.proteins.txt'
+
+def is_score_matrix(filename):
+    # True if filename is a score matrix (see ScoreMatrix) rather than a text file of predictions
+    return filename.endswith('.npy') and os.path.exists(get_sidecar(filename))
+
+def convert_predictions(filename, matrix_filename, chunk_rows=10**6, block_rows=1024):
+    # Convert whitespace-separated predictions file to a score matrix (see ScoreMatrix), reading chunk_rows at a time
+    # First pass collects protein IDs (in order of appearance), second pass fills in scores
+    proteins = {}
+    for chunk in pd.read_csv(filename, delim_whitespace=True, header=None, usecols=[0, 1], dtype=str, chunksize=chunk_rows):
+        for p in pd.unique(pd.concat([chunk[0], chunk[1]], ignore_index=True)):
+            if p not in proteins:
+                proteins[p] = len(proteins)
+    n = len(proteins)
+    with open(get_sidecar(matrix_filename), 'w') as f:
+        f.write(''.join('%s\n'%p for p in proteins))
+
+    scores = np.lib.format.open_memmap(matrix_filename, mode='w+', dtype=np.float32, shape=(n, n))
+    for start in range(0, n, block_rows):
+        scores[start:start + block_rows] = np.nan
+    for chunk in pd.read_csv(filename, delim_whitespace=True, header=None, usecols=[0, 1, 2], dtype={0: str, 1: str}, chunksize=chunk_rows):
+        codes_a = chunk[0].map(proteins).to_numpy()
+        codes_b = chunk[1].map(proteins).to_numpy()
+        low, high = np.minimum(codes_a, codes_b), np.maximum(codes_a, codes_b)
+        values = chunk[2].to_numpy(dtype=np.float32)
+        # Keep highest score of redundant pairs within chunk, then against previous chunks
+        order = np.lexsort((np.where(np.isnan(values), -np.inf, values), high, low))
+        last = np.ones(len(order), dtype=bool)
+        last[:-1] = (low[order][1:] != low[order][:-1]) | (high[order][1:] != high[order][:-1])
+        low, high, values = low[order][last], high[order][last], values[order][last]
+        values = np.fmax(scores[low, high], values)
+        scores[low, high] = values
+        scores[high, low] = values
+    scores.flush()
+    del scores
+    return ScoreMatrix(matrix_filename)
+
+
+if __name__ == '__main__':
+    describe_help = 'python score_matrix.py -p predictions.tsv -o predictions.npy'
+    parser = argparse.ArgumentParser(description=describe_help)
+    parser.add_argument('-p', '--predictions', help='Path to all-to-all PPI predictions file to convert (.tsv)', type=str)
+    parser.add_argument('-o', '--output', help='Path of score matrix to create (.npy), default is predictions path with .npy extension', type=str, default=None)
+    parser.add_argument('-c', '--chunksize', help='Number of predictions read per chunk (default 1000000)', type=int, default=10**6)
+    args = parser.parse_args()
+
+    start = time.time()
+    output = args.output if args.output else args.predictions.rsplit('.', 1)[0] + '.npy'
+    print('Converting %s...'%args.predictions)
+    matrix = convert_predictions(args.predictions, output, chunk_rows=args.chunksize)
+    print('\tScore matrix of %s proteins saved to %s'%(len(matrix), output))
+    print('\n\tTime:', round(time.time() - start, 2), 'seconds')